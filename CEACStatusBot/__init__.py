@@ -1,3 +1,13 @@
-from .request import *
-from .captcha import *
-from .notification import *
\ No newline at end of file
+from . import captcha, engine, notification, request
+from .utils.lazy import lazy_exports
+
+# 子包本身是惰性的：import CEACStatusBot 不会加载 onnxruntime、lxml、smtplib 等，
+# 用到哪个名字才导入对应的模块
+_EXPORTS = {
+    name: f".{package.__name__.rsplit('.', 1)[-1]}"
+    for package in (request, captcha, notification, engine)
+    for name in package.__all__
+}
+
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
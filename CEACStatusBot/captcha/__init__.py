@@ -1,3 +1,14 @@
-from .handle import *
-from .manual import *
-from .onnx import *
\ No newline at end of file
+from CEACStatusBot.utils.lazy import lazy_exports
+
+# onnxruntime / numpy / PIL 较重，子模块在第一次访问其导出的名字时才导入
+_EXPORTS = {
+    "CaptchaHandle": ".handle",
+    "get_default_captcha_handle": ".handle",
+    "ManualCaptchaHandle": ".manual",
+    "OnnxCaptchaHandle": ".onnx",
+    "get_onnx_session": ".onnx",
+    "BatchingCaptchaHandle": ".batching",
+}
+
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
@@ -0,0 +1,98 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from CEACStatusBot.utils import get_default_registry, log_with_timestamp
+from .handle import CaptchaHandle
+
+_metrics = get_default_registry()
+QUEUE_SECONDS = _metrics.histogram("captcha_queue_seconds", "Time a captcha waits in the batching queue before inference")
+BATCH_SIZE = _metrics.histogram("captcha_batch_size", "Captchas per dynamic batch", buckets=(1, 2, 4, 8, 16, 32, 64))
+
+
+class BatchingCaptchaHandle(CaptchaHandle):
+    def __init__(self, captchaHandle: CaptchaHandle, maxBatchSize: int = None, maxWaitMs: float = None) -> None:
+        """
+        动态批处理的验证码识别前端
+
+        多个线程并发调用 solve 时，在 maxWaitMs 时间窗口内收集到的图片会合并成一批，
+        交给底层 captchaHandle.solve_batch 一次性推理。
+
+        Args:
+            captchaHandle: 实际执行识别的 handle，通常是 OnnxCaptchaHandle
+            maxBatchSize: 单批最多图片数，默认读取环境变量 CAPTCHA_BATCH_SIZE（默认 16）
+            maxWaitMs: 收到第一张图片后最多等待的毫秒数，默认读取环境变量 CAPTCHA_BATCH_WAIT_MS（默认 5）
+        """
+        super().__init__()
+        self.__captchaHandle = captchaHandle
+        self.__maxBatchSize = maxBatchSize or int(os.getenv("CAPTCHA_BATCH_SIZE", "16"))
+        self.__maxWait = (maxWaitMs if maxWaitMs is not None else float(os.getenv("CAPTCHA_BATCH_WAIT_MS", "5"))) / 1000.0
+        self.__queue = queue.Queue()
+        self.__worker = None
+        self.__workerLock = threading.Lock()
+
+    def __ensure_worker(self) -> None:
+        if self.__worker is not None and self.__worker.is_alive():
+            return
+        with self.__workerLock:
+            if self.__worker is None or not self.__worker.is_alive():
+                self.__worker = threading.Thread(target=self.__run, name="captcha-batcher", daemon=True)
+                self.__worker.start()
+
+    def __collect(self) -> list:
+        """阻塞直到拿到第一张图片，然后在时间窗口内尽量凑满一批"""
+        batch = [self.__queue.get()]
+        deadline = time.monotonic() + self.__maxWait
+        while len(batch) < self.__maxBatchSize:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.__queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def __run(self) -> None:
+        while True:
+            batch = self.__collect()
+            now = time.monotonic()
+            for _, _, submitted in batch:
+                QUEUE_SECONDS.observe(now - submitted)
+            BATCH_SIZE.observe(len(batch))
+            images = [image for image, _, _ in batch]
+            try:
+                preds = self.__captchaHandle.solve_batch_with_confidence(images)
+            except Exception as e:
+                log_with_timestamp(f"Captcha batch inference failed (batch size {len(batch)}): {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), pred in zip(batch, preds):
+                future.set_result(pred)
+
+    def warmup(self) -> None:
+        self.__captchaHandle.warmup()
+        self.__ensure_worker()
+
+    def submit(self, image) -> Future:
+        """提交一张验证码图片，返回 (识别结果, 置信度) 的 Future"""
+        self.__ensure_worker()
+        future = Future()
+        self.__queue.put((image, future, time.monotonic()))
+        return future
+
+    def solve(self, image) -> str:
+        return self.submit(image).result()[0]
+
+    def solve_with_confidence(self, image) -> tuple:
+        return self.submit(image).result()
+
+    def solve_batch(self, images) -> list:
+        return [pred for pred, _ in self.solve_batch_with_confidence(images)]
+
+    def solve_batch_with_confidence(self, images) -> list:
+        futures = [self.submit(image) for image in images]
+        return [future.result() for future in futures]
@@ -1,3 +1,4 @@
+import threading
 from abc import ABC, abstractmethod
 
 class CaptchaHandle(ABC):
@@ -6,4 +7,52 @@ class CaptchaHandle(ABC):
 
     @abstractmethod
     def solve(self,image) -> str:
-        pass
\ No newline at end of file
+        pass
+
+    def warmup(self) -> None:
+        """提前加载识别所需的资源，默认无操作"""
+        pass
+
+    def solve_batch(self, images) -> list:
+        """
+        批量识别验证码，默认逐张调用 solve，支持批量推理的子类可覆盖
+
+        Args:
+            images: 验证码图片（bytes）列表
+
+        Returns:
+            与 images 一一对应的识别结果列表
+        """
+        return [self.solve(image) for image in images]
+
+    def solve_with_confidence(self, image) -> tuple:
+        """
+        识别验证码并给出置信度，默认置信度为 1.0，能给出概率的子类可覆盖
+
+        Returns:
+            (识别结果, 0~1 之间的置信度)
+        """
+        return self.solve(image), 1.0
+
+    def solve_batch_with_confidence(self, images) -> list:
+        """批量版本的 solve_with_confidence"""
+        return [self.solve_with_confidence(image) for image in images]
+
+
+_default_captcha_handle = None
+_default_captcha_handle_lock = threading.Lock()
+
+
+def get_default_captcha_handle() -> CaptchaHandle:
+    """
+    进程内默认共享的验证码识别 handle（OnnxCaptchaHandle("captcha.onnx")）
+
+    第一次调用时才导入 onnxruntime / numpy / PIL，使用其他 handle 时不需要加载这些依赖。
+    """
+    global _default_captcha_handle
+    with _default_captcha_handle_lock:
+        if _default_captcha_handle is None:
+            from .onnx import OnnxCaptchaHandle
+
+            _default_captcha_handle = OnnxCaptchaHandle("captcha.onnx")
+        return _default_captcha_handle
@@ -2,31 +2,303 @@ from PIL import Image
 from io import BytesIO
 import onnxruntime as ort
 import numpy as np
+import logging
+import os
 import string
+import threading
 
+from CEACStatusBot.utils import get_default_registry, log_with_timestamp
 from .handle import CaptchaHandle
 
+# 进程内共享的 InferenceSession，按 (模型路径, intra 线程数, inter 线程数) 缓存
+_session_cache = {}
+_session_lock = threading.Lock()
+
+_metrics = get_default_registry()
+PREPROCESS_SECONDS = _metrics.histogram(
+    "captcha_preprocess_seconds", "Captcha decoding and normalization time per solve call"
+)
+INFERENCE_SECONDS = _metrics.histogram("captcha_inference_seconds", "ONNX inference and decoding time per batch")
+INFERENCE_BATCH_SIZE = _metrics.histogram(
+    "captcha_inference_batch_size", "Images per ONNX inference call", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+
+
+_CHARACTERS = np.array(list('-' + string.digits + string.ascii_uppercase))
+
+
+def ctc_decode(sequences) -> list:
+    """
+    对一批 argmax 序列做 CTC 解码（向量化）
+
+    Args:
+        sequences: 形状为 (N, T) 的类别下标数组
+
+    Returns:
+        长度为 N 的字符串列表
+    """
+    a = np.asarray(sequences)
+    blank = 0
+    # 去掉 blank 并合并相邻重复字符：保留每段重复字符的最后一个
+    keep = np.zeros(a.shape, dtype=bool)
+    keep[:, :-1] = (a[:, :-1] != blank) & (a[:, :-1] != a[:, 1:])
+    # 最后一帧：仅当前面已有字符且与最后保留的字符不同才追加
+    positions = np.where(keep[:, :-1], np.arange(a.shape[1] - 1), -1)
+    last_kept = positions.max(axis=1)
+    last_char = a[np.arange(a.shape[0]), np.maximum(last_kept, 0)]
+    keep[:, -1] = (a[:, -1] != blank) & (last_kept >= 0) & (last_char != a[:, -1])
+    chars = _CHARACTERS[a]
+    return [''.join(row[mask]) for row, mask in zip(chars, keep)]
+
+
+def decode_outputs(outputs: np.ndarray) -> list:
+    """
+    把模型输出解码为识别结果和置信度
+
+    Args:
+        outputs: 模型输出的 logits，形状为 (T, N, C)
+
+    Returns:
+        [(识别结果, 置信度), ...]，置信度为 argmax 路径的概率，即每一帧 softmax 最大概率之积
+    """
+    x = np.transpose(outputs, (1, 0, 2))
+    t = np.argmax(x, -1)
+    # 每帧 softmax 的最大概率 = 1 / sum(exp(x - max(x)))
+    shifted = x - np.max(x, axis=-1, keepdims=True)
+    log_best = -np.log(np.sum(np.exp(shifted), axis=-1))
+    confidences = np.exp(np.sum(log_best, axis=-1))
+    return list(zip(ctc_decode(t), confidences.tolist()))
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return int(value)
+
+
+def get_onnx_session(onnxModelPath: str, intraOpNumThreads: int = 0, interOpNumThreads: int = 0) -> ort.InferenceSession:
+    """获取（必要时创建）共享的 InferenceSession
+
+    同一个模型在进程内只加载、优化一次，之后所有 solve 复用该 session。
+    ort.InferenceSession.run 本身是线程安全的。
+
+    Args:
+        onnxModelPath: 模型文件路径
+        intraOpNumThreads: 单个算子内部的并行线程数，0 表示使用 onnxruntime 默认值
+        interOpNumThreads: 算子之间的并行线程数，0 表示使用 onnxruntime 默认值
+    """
+    key = (os.path.abspath(onnxModelPath), intraOpNumThreads, interOpNumThreads)
+    session = _session_cache.get(key)
+    if session is not None:
+        return session
+
+    with _session_lock:
+        session = _session_cache.get(key)
+        if session is None:
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = intraOpNumThreads
+            options.inter_op_num_threads = interOpNumThreads
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = ort.InferenceSession(onnxModelPath, sess_options=options, providers=["CPUExecutionProvider"])
+            _session_cache[key] = session
+            log_with_timestamp(
+                f"ONNX model loaded: {onnxModelPath} (intra_op_threads={intraOpNumThreads}, inter_op_threads={interOpNumThreads})"
+            )
+    return session
+
+
 class OnnxCaptchaHandle(CaptchaHandle):
-    def __init__(self,onnxModelPath:str='captcha.onnx') -> None:
+    # 模型输入高宽为动态维度时，warm-up 使用的默认图片尺寸 (H, W)
+    WARMUP_IMAGE_SIZE = (50, 200)
+
+    def __init__(
+        self,
+        onnxModelPath: str = 'captcha.onnx',
+        intraOpNumThreads: int = None,
+        interOpNumThreads: int = None,
+        warmup: bool = None,
+        ioBinding: bool = None,
+    ) -> None:
+        """
+        基于 ONNX 模型的验证码识别
+
+        Args:
+            onnxModelPath: 模型文件路径
+            intraOpNumThreads: 算子内并行线程数，默认读取环境变量 ONNX_INTRA_OP_THREADS（0 表示 onnxruntime 默认值）
+            interOpNumThreads: 算子间并行线程数，默认读取环境变量 ONNX_INTER_OP_THREADS（0 表示 onnxruntime 默认值）
+            warmup: 是否在首次使用前进行一次 warm-up 推理，默认读取环境变量 ONNX_WARMUP
+            ioBinding: 是否通过 IOBinding 直接把输入缓冲区绑定给 onnxruntime，默认读取环境变量 ONNX_IO_BINDING（默认 true），
+                第一次推理时检查，当前 onnxruntime 不支持时退回 session.run
+        """
         super().__init__()
         self.__onnxModelPath = onnxModelPath
+        if intraOpNumThreads is None:
+            intraOpNumThreads = _env_int("ONNX_INTRA_OP_THREADS", 0)
+        if interOpNumThreads is None:
+            interOpNumThreads = _env_int("ONNX_INTER_OP_THREADS", 0)
+        if warmup is None:
+            warmup = os.getenv("ONNX_WARMUP", "").lower() in ("1", "true", "yes")
+        self.__intraOpNumThreads = intraOpNumThreads
+        self.__interOpNumThreads = interOpNumThreads
+        self.__warmup = warmup
+        self.__warmedUp = False
+        if ioBinding is None:
+            ioBinding = os.getenv("ONNX_IO_BINDING", "true").lower() in ("1", "true", "yes")
+        self.__ioBinding = ioBinding
+        # IOBinding 是否可用：None 表示尚未检查
+        self.__bindingSupported = None
+        # 每个线程一份输入缓冲区和 IOBinding，推理期间缓冲区不会被其他线程改写
+        self.__local = threading.local()
+
+    def __session(self) -> ort.InferenceSession:
+        session = get_onnx_session(self.__onnxModelPath, self.__intraOpNumThreads, self.__interOpNumThreads)
+        if self.__warmup and not self.__warmedUp:
+            self.__warmedUp = True
+            self.__run_warmup(session)
+        return session
+
+    def __run_warmup(self, session: ort.InferenceSession) -> None:
+        model_input = session.get_inputs()[0]
+        shape = []
+        for i, dim in enumerate(model_input.shape):
+            if isinstance(dim, int) and dim > 0:
+                shape.append(dim)
+            elif i == 0:
+                shape.append(1)
+            else:
+                # 动态维度：通道取 3，高宽取默认图片大小
+                shape.append({1: 3, 2: self.WARMUP_IMAGE_SIZE[0], 3: self.WARMUP_IMAGE_SIZE[1]}.get(i, 1))
+        try:
+            session.run(None, {model_input.name: np.zeros(shape, dtype=np.float32)})
+            log_with_timestamp(f"ONNX warm-up finished, input shape: {shape}")
+        except Exception as e:
+            log_with_timestamp(f"ONNX warm-up failed: {e}")
+
+    def warmup(self) -> None:
+        """提前加载模型并执行一次 warm-up 推理，使第一次真实识别与后续识别一样快"""
+        self.__warmup = True
+        self.__session()
+
+    @staticmethod
+    def __decode_image(image) -> np.ndarray:
+        """解码为 uint8 的 HWC 数组，尚未转换为 float32"""
+        return np.asarray(Image.open(BytesIO(image)))
+
+    def __input_buffer(self, n: int, shape: tuple) -> np.ndarray:
+        """
+        当前线程可复用的连续 NCHW float32 缓冲区
+
+        按 (C, H, W) 缓存，容量不足时按需扩大；返回前 n 张图片的切片，仍然是 C 连续的。
+        """
+        buffers = getattr(self.__local, "buffers", None)
+        if buffers is None:
+            buffers = self.__local.buffers = {}
+        buffer = buffers.get(shape)
+        if buffer is None or buffer.shape[0] < n:
+            buffer = np.empty((n, *shape), dtype=np.float32)
+            buffers[shape] = buffer
+        return buffer[:n]
+
+    def __fill(self, images: list) -> np.ndarray:
+        """
+        把同尺寸的 HWC uint8 图片写入输入缓冲区：转置、转换为 float32 与归一化在一次遍历中完成，不产生中间数组
+        """
+        height, width, channels = images[0].shape
+        batch = self.__input_buffer(len(images), (channels, height, width))
+        for img, out in zip(images, batch):
+            np.divide(img.transpose(2, 0, 1), np.float32(255.0), out=out)
+        return batch
+
+    def __supports_batch(self, session: ort.InferenceSession) -> bool:
+        batch_dim = session.get_inputs()[0].shape[0]
+        return not (isinstance(batch_dim, int) and batch_dim == 1)
+
+    def __infer(self, session: ort.InferenceSession, batch: np.ndarray) -> list:
+        """
+        推理并解码
+
+        Returns:
+            [(识别结果, 置信度), ...]，置信度为 argmax 路径的概率，即每一帧 softmax 最大概率之积
+        """
+        INFERENCE_BATCH_SIZE.observe(len(batch))
+        with INFERENCE_SECONDS.time():
+            return self.__run_and_decode(session, batch)
 
-    def __decode(self,sequence):
-        characters = '-' + string.digits + string.ascii_uppercase
-        a = ''.join([characters[x] for x in sequence])
-        s = ''.join([x for j, x in enumerate(a[:-1]) if x != characters[0] and x != a[j+1]])
-        if len(s) == 0:
-            return ''
-        if a[-1] != characters[0] and s[-1] != a[-1]:
-            s += a[-1]
-        return s
+    def __binding(self, session: ort.InferenceSession):
+        """
+        当前线程的 IOBinding，未启用或不支持时返回 None
+
+        是否支持只在第一次创建时检查一次；之后推理本身的错误（如图片尺寸不对）直接抛出，不影响 IOBinding 的使用。
+        """
+        if not self.__ioBinding or self.__bindingSupported is False:
+            return None
+        binding = getattr(self.__local, "binding", None)
+        if binding is not None and self.__local.bindingSession is session:
+            return binding
+        try:
+            binding = session.io_binding()
+        except Exception as e:
+            self.__bindingSupported = False
+            log_with_timestamp(f"ONNX IOBinding unavailable, falling back to session.run: {e}", logging.WARNING)
+            return None
+        self.__bindingSupported = True
+        self.__local.binding = binding
+        self.__local.bindingSession = session
+        return binding
+
+    def __run(self, session: ort.InferenceSession, batch: np.ndarray) -> np.ndarray:
+        """执行推理，返回第一个输出；IOBinding 直接使用 batch 的内存，不再复制输入"""
+        input_name = session.get_inputs()[0].name
+        binding = self.__binding(session)
+        if binding is None:
+            return session.run(None, {input_name: batch})[0]
+        binding.bind_cpu_input(input_name, batch)
+        binding.bind_output(session.get_outputs()[0].name)
+        session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()[0]
+
+    def __run_and_decode(self, session: ort.InferenceSession, batch: np.ndarray) -> list:
+        return decode_outputs(self.__run(session, batch))
 
     def solve(self,image) -> str:
-        img = np.asarray( Image.open(BytesIO(image)) ,dtype=np.float32) / 255.0
-        img = np.expand_dims(np.transpose(img,(2,0,1)), axis=0)
-        ort_sess = ort.InferenceSession(self.__onnxModelPath)
-        outputs = ort_sess.run(None, {'input': img})
-        x = outputs[0]
-        t = np.argmax( np.transpose(x,(1,0,2)), -1)
-        pred = self.__decode(t[0])
-        return pred
\ No newline at end of file
+        return self.solve_with_confidence(image)[0]
+
+    def solve_with_confidence(self, image) -> tuple:
+        with PREPROCESS_SECONDS.time():
+            batch = self.__fill([self.__decode_image(image)])
+        ort_sess = self.__session()
+        return self.__infer(ort_sess, batch)[0]
+
+    def solve_batch(self, images) -> list:
+        return [pred for pred, _ in self.solve_batch_with_confidence(images)]
+
+    def solve_batch_with_confidence(self, images) -> list:
+        """
+        批量识别验证码：相同尺寸的图片合并为一个 NCHW 张量，只执行一次推理
+
+        Args:
+            images: 验证码图片（bytes）列表
+
+        Returns:
+            与 images 一一对应的 (识别结果, 置信度) 列表
+        """
+        if not images:
+            return []
+        ort_sess = self.__session()
+        if not self.__supports_batch(ort_sess):
+            return [self.solve_with_confidence(image) for image in images]
+
+        # 按图片尺寸分组，每组写入各自的连续 NCHW 缓冲区（缓冲区按尺寸区分，互不覆盖）
+        with PREPROCESS_SECONDS.time():
+            groups = {}
+            for i, image in enumerate(images):
+                img = self.__decode_image(image)
+                groups.setdefault(img.shape, []).append((i, img))
+            batches = [([i for i, _ in group], self.__fill([img for _, img in group])) for group in groups.values()]
+
+        preds = [None] * len(images)
+        for indices, batch in batches:
+            for i, pred in zip(indices, self.__infer(ort_sess, batch)):
+                preds[i] = pred
+        return preds
@@ -0,0 +1,16 @@
+from CEACStatusBot.utils.lazy import lazy_exports
+
+_EXPORTS = {
+    "Case": ".case",
+    "load_cases": ".case",
+    "case_from_env": ".case",
+    "cases_from_env": ".case",
+    "NotificationRouter": ".routing",
+    "MultiCaseEngine": ".runner",
+    "engine_from_env": ".runner",
+    "AdaptivePollingPolicy": ".schedule",
+    "PollingDaemon": ".daemon",
+}
+
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
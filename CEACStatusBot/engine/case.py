@@ -0,0 +1,103 @@
+import json
+import os
+from dataclasses import dataclass, field
+
+from CEACStatusBot.utils import log_with_timestamp
+
+__all__ = ["Case", "load_cases", "case_from_env", "cases_from_env"]
+
+
+@dataclass
+class Case:
+    """
+    一个需要跟踪的签证申请
+
+    Args:
+        location: 领馆地点（代码或名称）
+        number: 申请号
+        passport_number: 护照号
+        surname: 姓
+        case_id: 状态存储中的案件标识，None 表示使用状态服务的默认案件（单案件模式）
+        notify: 该案件的通知路由配置，如 email_to / tg_chat_id / ios_url，缺省时使用全局环境变量
+    """
+
+    location: str
+    number: str
+    passport_number: str
+    surname: str
+    case_id: str = None
+    notify: dict = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        """用于日志显示的案件名"""
+        return self.case_id or self.number
+
+
+def load_cases(path: str) -> list:
+    """
+    从 JSON 文件加载案件列表
+
+    文件格式：
+    [
+        {
+            "location": "BEJ",
+            "number": "AA00XXXXXX",
+            "passport_number": "E12345678",
+            "surname": "ZHANG",
+            "email_to": "a@example.com|b@example.com",   // 可选
+            "tg_chat_id": "123456",                      // 可选
+            "ios_url": "https://..."                     // 可选
+        }
+    ]
+    case_id 默认为申请号。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+
+    cases = []
+    seen = set()
+    for entry in entries:
+        entry = dict(entry)
+        try:
+            case = Case(
+                location=entry.pop("location"),
+                number=entry.pop("number"),
+                passport_number=entry.pop("passport_number"),
+                surname=entry.pop("surname"),
+            )
+        except KeyError as e:
+            raise ValueError(f"Case entry missing required field {e}: {entry}") from e
+        case.case_id = entry.pop("case_id", None) or case.number
+        case.notify = entry
+        if case.case_id in seen:
+            raise ValueError(f"Duplicate case_id in {path}: {case.case_id}")
+        seen.add(case.case_id)
+        cases.append(case)
+    return cases
+
+
+def case_from_env() -> Case:
+    """从 LOCATION / NUMBER / PASSPORT_NUMBER / SURNAME 环境变量构造单个案件"""
+    try:
+        return Case(
+            location=os.environ["LOCATION"],
+            number=os.environ["NUMBER"],
+            passport_number=os.environ["PASSPORT_NUMBER"],
+            surname=os.environ["SURNAME"],
+        )
+    except KeyError as e:
+        raise RuntimeError(f"Missing required env var: {e}") from e
+
+
+def cases_from_env() -> list:
+    """
+    按环境变量构造案件列表：设置了 CASES_FILE 时从该 JSON 文件加载（多案件），
+    否则从 LOCATION / NUMBER / PASSPORT_NUMBER / SURNAME 构造单个案件
+    """
+    casesFile = os.getenv("CASES_FILE")
+    if not casesFile:
+        return [case_from_env()]
+    cases = load_cases(casesFile)
+    log_with_timestamp(f"Loaded {len(cases)} case(s) from {casesFile}")
+    return cases
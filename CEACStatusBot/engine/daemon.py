@@ -0,0 +1,219 @@
+import heapq
+import itertools
+import logging
+import os
+import random
+import signal
+import threading
+import time
+from contextlib import ExitStack
+
+from CEACStatusBot.request import CeacThrottle, get_default_throttle
+from CEACStatusBot.request.throttle import PROBE_RETRY_AFTER
+from CEACStatusBot.utils import TokenBucket, get_default_registry, log_with_timestamp, start_metrics_server
+
+from .runner import MultiCaseEngine
+from .schedule import AdaptivePollingPolicy
+
+__all__ = ["PollingDaemon"]
+
+DEFAULT_POLL_INTERVAL = 20 * 60
+DEFAULT_POLL_JITTER = 60
+# 查询持续重叠时，通知最多暂存多久就发送一次（秒）
+MAX_NOTIFY_HOLD = 300
+
+_metrics = get_default_registry()
+IN_FLIGHT = _metrics.gauge("daemon_polls_in_flight", "Case polls currently running")
+QUEUED = _metrics.gauge("daemon_cases_scheduled", "Cases waiting in the poll schedule")
+DEFERRED = _metrics.counter("daemon_polls_deferred_total", "Polls pushed back by the circuit breaker or poll budget", ["reason"])
+
+
+class PollingDaemon:
+    def __init__(
+        self,
+        engine: MultiCaseEngine,
+        interval: float = None,
+        jitter: float = None,
+        policy: AdaptivePollingPolicy = None,
+        budget: float = None,
+        throttle: CeacThrottle = None,
+        metricsPort: int = None,
+    ) -> None:
+        """
+        常驻进程模式：在进程内按间隔调度每个案件的查询，替代 cron 单次运行
+
+        模型、HTTP 连接等资源在进程生命周期内保持加载，每次轮询只剩网络请求的开销。
+        所有案件按下一次查询时间放在优先队列中；设置了请求预算时，同时到期的案件按变化的可能性排序，
+        预算不足的案件顺延；ceac.state.gov 熔断期间所有到期的案件顺延到熔断结束。
+        从第一个查询开始到所有进行中的查询结束，产生的通知留在发件箱中，结束后一起发送（邮件摘要据此合并多个案件）。
+
+        Args:
+            engine: 多案件引擎
+            interval: 每个案件的基础轮询间隔（秒），默认读取环境变量 POLL_INTERVAL（默认 1200）
+            jitter: 每次调度叠加的随机抖动上限（秒），默认读取环境变量 POLL_JITTER（默认 60）
+            policy: 按案件状态调整间隔的策略，默认 AdaptivePollingPolicy；
+                环境变量 POLL_ADAPTIVE=false 时所有案件使用固定间隔
+            budget: 全局每小时最多查询次数，默认读取环境变量 POLL_BUDGET（默认 0，即不限制）
+            throttle: 查询使用的限速器和熔断器，默认使用进程内共享的 CeacThrottle
+            metricsPort: Prometheus /metrics 的监听端口，默认读取环境变量 METRICS_PORT（默认 0，即不启动）
+        """
+        self.__engine = engine
+        self.__interval = interval if interval is not None else float(os.getenv("POLL_INTERVAL", DEFAULT_POLL_INTERVAL))
+        self.__jitter = jitter if jitter is not None else float(os.getenv("POLL_JITTER", DEFAULT_POLL_JITTER))
+        if policy is None and os.getenv("POLL_ADAPTIVE", "true").lower() == "true":
+            policy = AdaptivePollingPolicy(self.__interval)
+        self.__policy = policy
+        budget = budget if budget is not None else float(os.getenv("POLL_BUDGET", 0))
+        # 预算允许约 10 分钟的突发
+        self.__budget = TokenBucket(budget / 3600, max(budget / 6, 1)) if budget > 0 else None
+        self.__throttle = throttle or get_default_throttle()
+        self.__stopEvent = threading.Event()
+        self.__wakeEvent = threading.Event()
+        self.__queue = []
+        self.__seq = itertools.count()
+        self.__inFlight = {}
+        # 有查询进行中时暂不发送发件箱中的通知，让重叠的查询产生的通知合并为一个摘要
+        self.__holding = None
+        self.__holdingSince = 0.0
+        self.__metricsPort = metricsPort if metricsPort is not None else int(os.getenv("METRICS_PORT", 0))
+        self.__metricsServer = None
+        IN_FLIGHT.set_function(lambda: len(self.__inFlight))
+        QUEUED.set_function(lambda: len(self.__queue))
+
+    @property
+    def engine(self) -> MultiCaseEngine:
+        return self.__engine
+
+    def next_delay(self, name: str) -> float:
+        """案件本次查询结束后，距离下一次查询的秒数"""
+        if self.__policy is None:
+            delay = self.__interval
+        else:
+            delay = self.__policy.next_delay(self.__engine.case(name), self.__engine.manager(name).last_result)
+        return delay + random.uniform(-self.__jitter, self.__jitter)
+
+    def priority(self, name: str) -> float:
+        """同时到期时的排序依据，越小越优先"""
+        if self.__policy is None:
+            return 1.0
+        return self.__policy.factor(self.__engine.manager(name).last_result)
+
+    def schedule(self, name: str, delay: float) -> None:
+        heapq.heappush(self.__queue, (time.monotonic() + max(delay, 0), next(self.__seq), name))
+
+    def stop(self, *_args) -> None:
+        if not self.__stopEvent.is_set():
+            log_with_timestamp("Stop requested, waiting for in-flight polls to finish...")
+        self.__stopEvent.set()
+        self.__wakeEvent.set()
+
+    def install_signal_handlers(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+    def __reap(self) -> None:
+        """把已完成的案件重新放回调度队列；一批查询全部完成时发送暂存的通知"""
+        finished = False
+        for name, future in list(self.__inFlight.items()):
+            if future.done():
+                del self.__inFlight[name]
+                retry_after = self.__throttle.retry_after()
+                if not future.result() and retry_after:
+                    # 因熔断失败的案件在熔断结束后重试，而不是等到下一个完整间隔
+                    delay = retry_after + random.uniform(0, self.__jitter)
+                else:
+                    delay = self.next_delay(name)
+                self.schedule(name, delay)
+                log_with_timestamp(f"Next poll in {delay / 60:.0f} min", case=name)
+                finished = True
+        if finished and not self.__inFlight:
+            self.__release_notifications()
+            self.__engine.flush_notifications()
+        elif self.__holding is not None and time.monotonic() - self.__holdingSince > MAX_NOTIFY_HOLD:
+            # 一直有查询在进行时不无限期推迟通知
+            self.__release_notifications()
+            self.__hold_notifications()
+
+    def __hold_notifications(self) -> None:
+        if self.__holding is None:
+            self.__holding = ExitStack()
+            self.__holding.enter_context(self.__engine.hold_notifications())
+            self.__holdingSince = time.monotonic()
+
+    def __release_notifications(self) -> None:
+        if self.__holding is not None:
+            holding, self.__holding = self.__holding, None
+            holding.close()
+
+    def __dispatch(self, due: list) -> None:
+        """
+        提交到期的案件；熔断期间全部顺延；熔断结束后先只提交一个案件作为探测请求；
+        预算不足时按优先级提交，其余顺延到有预算时重新排序
+        """
+        retry_after = self.__throttle.retry_after() if due else 0
+        if retry_after:
+            log_with_timestamp(f"ceac.state.gov circuit open, deferring {len(due)} case(s) by {retry_after:.0f}s", logging.WARNING)
+            DEFERRED.inc(len(due), reason="circuit_open")
+            for deferred in due:
+                self.schedule(deferred, retry_after + random.uniform(0, self.__jitter))
+            return
+        if self.__budget is not None or (due and self.__throttle.half_open):
+            due.sort(key=self.priority)
+        if len(due) > 1 and self.__throttle.half_open:
+            log_with_timestamp(f"ceac.state.gov circuit half-open, probing with 1 case and deferring {len(due) - 1}")
+            DEFERRED.inc(len(due) - 1, reason="circuit_open")
+            for deferred in due[1:]:
+                self.schedule(deferred, PROBE_RETRY_AFTER + random.uniform(0, self.__jitter))
+            due = due[:1]
+        for i, name in enumerate(due):
+            if self.__budget is not None:
+                wait = self.__budget.try_acquire()
+                if wait:
+                    log_with_timestamp(
+                        f"Poll budget exhausted, deferring {len(due) - i} case(s) by {wait:.0f}s", sample="poll_budget"
+                    )
+                    DEFERRED.inc(len(due) - i, reason="budget")
+                    for deferred in due[i:]:
+                        self.schedule(deferred, wait)
+                    return
+            self.__hold_notifications()
+            future = self.__engine.submit(name)
+            future.add_done_callback(lambda _: self.__wakeEvent.set())
+            self.__inFlight[name] = future
+
+    def run(self) -> None:
+        log_with_timestamp(
+            f"Daemon started with {len(self.__engine.cases)} case(s), "
+            f"interval {self.__interval:.0f}s ± {self.__jitter:.0f}s"
+        )
+        if self.__metricsPort:
+            self.__metricsServer = start_metrics_server(self.__metricsPort)
+            log_with_timestamp(f"Metrics available at http://0.0.0.0:{self.__metricsPort}/metrics")
+        self.__engine.captchaHandle.warmup()
+        self.__engine.recover()
+
+        # 首轮在抖动窗口内错开，避免所有案件同时请求
+        for case in self.__engine.cases:
+            self.schedule(case.name, random.uniform(0, self.__jitter))
+
+        try:
+            while not self.__stopEvent.is_set():
+                self.__wakeEvent.clear()
+                self.__reap()
+                now = time.monotonic()
+                due = []
+                while self.__queue and self.__queue[0][0] <= now:
+                    due.append(heapq.heappop(self.__queue)[2])
+                self.__dispatch(due)
+
+                # 等到下一个案件到期、有查询完成或收到停止信号
+                wait = self.__queue[0][0] - now if self.__queue else 60.0
+                self.__wakeEvent.wait(max(wait, 0))
+        finally:
+            for future in list(self.__inFlight.values()):
+                future.result()
+            self.__release_notifications()
+            self.__engine.close()
+            if self.__metricsServer is not None:
+                self.__metricsServer.shutdown()
+            log_with_timestamp("Daemon stopped")
@@ -0,0 +1,75 @@
+import os
+import threading
+
+from CEACStatusBot.notification import NotificationHandle
+from CEACStatusBot.utils import log_with_timestamp
+
+from .case import Case
+
+__all__ = ["NotificationRouter"]
+
+
+class NotificationRouter:
+    def __init__(self) -> None:
+        """
+        根据案件配置和全局环境变量为每个案件生成通知 handle
+
+        发信账号、Bot Token 等凭据来自全局环境变量（FROM / PASSWORD / SMTP / TG_BOT_TOKEN），
+        收件人可以按案件覆盖（email_to / tg_chat_id / ios_url）。
+        相同目的地的 handle 会在案件之间共享；各渠道的模块只在该渠道启用时才导入。
+        """
+        self.__handles = {}
+        self.__lock = threading.Lock()
+
+    def __shared(self, key: tuple, factory) -> NotificationHandle:
+        with self.__lock:
+            handle = self.__handles.get(key)
+            if handle is None:
+                handle = factory()
+                self.__handles[key] = handle
+            return handle
+
+    def handles(self) -> list:
+        """返回目前创建的所有 handle"""
+        with self.__lock:
+            return list(self.__handles.values())
+
+    def handles_for(self, case: Case) -> list:
+        handles = []
+
+        # --- Optional: Email notifications ---
+        from_email = os.getenv("FROM")
+        to_email = case.notify.get("email_to") or os.getenv("TO")
+        password = os.getenv("PASSWORD")
+        smtp = os.getenv("SMTP", "")
+        if from_email and to_email and password:
+            from CEACStatusBot.notification.email import EmailNotificationHandle
+
+            handles.append(self.__shared(
+                ("email", from_email, to_email, smtp),
+                lambda: EmailNotificationHandle(from_email, to_email, password, smtp),
+            ))
+        else:
+            log_with_timestamp("Email notification config missing or incomplete", case=case.name)
+
+        # --- Optional: Telegram notifications ---
+        bot_token = os.getenv("TG_BOT_TOKEN")
+        chat_id = case.notify.get("tg_chat_id") or os.getenv("TG_CHAT_ID")
+        if bot_token and chat_id:
+            from CEACStatusBot.notification.telegram import TelegramNotificationHandle
+
+            handles.append(self.__shared(
+                ("telegram", bot_token, str(chat_id)),
+                lambda: TelegramNotificationHandle(bot_token, str(chat_id)),
+            ))
+        else:
+            log_with_timestamp("Telegram bot notification config missing or incomplete", case=case.name)
+
+        # --- iOS notifications ---
+        # iOS notification 默认启用，未配置 ios_url / IOS_NOTIFICATION_URL 时使用内置的默认 URL
+        ios_url = case.notify.get("ios_url") or os.getenv("IOS_NOTIFICATION_URL")
+        from CEACStatusBot.notification.ios import IOSNotificationHandle
+
+        handles.append(self.__shared(("ios", ios_url), lambda: IOSNotificationHandle(ios_url)))
+
+        return handles
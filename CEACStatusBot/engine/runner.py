@@ -0,0 +1,288 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+from CEACStatusBot.captcha import BatchingCaptchaHandle, CaptchaHandle, get_default_captcha_handle
+from CEACStatusBot.notification import NotificationManager, get_status_api_client
+from CEACStatusBot.notification.status_api import CHANGE_UNKNOWN
+from CEACStatusBot.request import SessionPool, get_default_session_pool
+from CEACStatusBot.utils import log_context, log_with_timestamp
+
+from .case import Case, cases_from_env
+from .routing import NotificationRouter
+
+__all__ = ["MultiCaseEngine", "engine_from_env"]
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def _check_case_ids(cases: list, status_api_base_url: str) -> None:
+    """
+    多案件模式下每个案件按 case_id 保存状态；旧版状态服务忽略 case_id，
+    所有案件会共用一条记录，相互覆盖后变更检测失效，这种情况下拒绝启动
+    """
+    if not status_api_base_url or not any(case.case_id for case in cases):
+        return
+    if get_status_api_client(status_api_base_url).supports_case_ids() is False:
+        raise RuntimeError(
+            f"Status API at {status_api_base_url} does not support case_id and stores a single shared record; "
+            "upgrade ceac-status-server before tracking multiple cases"
+        )
+
+
+class MultiCaseEngine:
+    def __init__(
+        self,
+        cases: list,
+        captchaHandle: CaptchaHandle = None,
+        maxWorkers: int = None,
+        status_api_base_url: str = None,
+        router: NotificationRouter = None,
+        sessionPool: SessionPool = None,
+    ) -> None:
+        """
+        在一个进程内并发跟踪多个案件
+
+        所有案件共享同一个验证码模型（默认通过 BatchingCaptchaHandle 合并推理），
+        每个案件有独立的 NotificationManager，负责各自的变更检测和通知路由。
+
+        Args:
+            cases: Case 列表
+            captchaHandle: 共享的验证码识别 handle，默认 BatchingCaptchaHandle(OnnxCaptchaHandle("captcha.onnx"))
+            maxWorkers: 并发查询的最大线程数，默认读取环境变量 MAX_WORKERS（默认 8）
+            status_api_base_url: 状态服务地址，默认读取环境变量 STATUS_API_BASE_URL
+            router: 通知路由，默认按环境变量配置
+            sessionPool: 共享的 HTTP 连接池，默认使用进程内默认连接池；每个案件有自己的长期 session
+        """
+        _check_case_ids(cases, status_api_base_url or os.getenv("STATUS_API_BASE_URL", ""))
+        self.__captchaHandle = captchaHandle or BatchingCaptchaHandle(get_default_captcha_handle())
+        self.__router = router or NotificationRouter()
+        self.__sessionPool = sessionPool or get_default_session_pool()
+        self.__maxWorkers = maxWorkers or int(os.getenv("MAX_WORKERS", DEFAULT_MAX_WORKERS))
+        self.__executor = ThreadPoolExecutor(max_workers=self.__maxWorkers, thread_name_prefix="case-worker")
+        self.__cases = {}
+        self.__managers = {}
+        self.__recovered = False
+        for case in cases:
+            self.add_case(case, status_api_base_url)
+
+    @property
+    def captchaHandle(self) -> CaptchaHandle:
+        return self.__captchaHandle
+
+    @property
+    def cases(self) -> list:
+        return list(self.__cases.values())
+
+    def add_case(self, case: Case, status_api_base_url: str = None) -> NotificationManager:
+        manager = NotificationManager(
+            case.location,
+            case.number,
+            case.passport_number,
+            case.surname,
+            captchaHandle=self.__captchaHandle,
+            status_api_base_url=status_api_base_url,
+            case_id=case.case_id,
+            session=self.__sessionPool.session_for(case.name),
+        )
+        for handle in self.__router.handles_for(case):
+            manager.addHandle(handle)
+        self.__cases[case.name] = case
+        self.__managers[case.name] = manager
+        return manager
+
+    def case(self, name: str) -> Case:
+        return self.__cases[name]
+
+    def manager(self, name: str) -> NotificationManager:
+        return self.__managers[name]
+
+    def __run_case(self, name: str) -> bool:
+        with log_context(case=name):
+            try:
+                self.__replay_staged([name])
+                self.__managers[name].send()
+                return True
+            except Exception as e:
+                log_with_timestamp(f"案件处理失败: {e}", logging.ERROR)
+                return False
+
+    def submit(self, name: str):
+        """在工作线程池中处理单个案件，返回 Future[bool]"""
+        return self.__executor.submit(self.__run_case, name)
+
+    def __outboxes(self) -> list:
+        outboxes = {}
+        for manager in self.__managers.values():
+            if manager.outbox is not None:
+                outboxes[id(manager.outbox)] = manager.outbox
+        return list(outboxes.values())
+
+    @contextmanager
+    def hold_notifications(self):
+        """
+        在 with 块内暂不发送发件箱中的通知，结束时一起发送：同一批查询产生的通知合并发送（如邮件摘要）
+        """
+        with ExitStack() as stack:
+            for outbox in self.__outboxes():
+                stack.enter_context(outbox.hold())
+            yield
+
+    def recover(self) -> None:
+        """
+        处理上次运行遗留在发件箱中的数据：重新提交未完成的查询结果，并启动发送线程发送未送达的通知
+        """
+        self.__recovered = True
+        self.__replay_staged()
+        for outbox in self.__outboxes():
+            outbox.start()
+
+    def __replay_staged(self, names: list = None) -> None:
+        """
+        按暂存顺序重新提交发件箱中还没有得到变更类型的查询结果（上次运行中断，或提交时状态服务不可用）
+
+        某个案件重新提交时状态服务仍不可用，该案件其余的暂存结果留到下一轮。
+        """
+        names = set(names) if names is not None else set(self.__managers)
+        unavailable = set()
+        for outbox in self.__outboxes():
+            for observation_id, case_key, res in outbox.staged():
+                if case_key not in names or case_key in unavailable:
+                    continue
+                manager = self.__managers[case_key]
+                with log_context(case=case_key):
+                    log_with_timestamp("Replaying staged result")
+                    try:
+                        change_type = manager.observe(res, observation_id)
+                        if change_type == CHANGE_UNKNOWN:
+                            unavailable.add(case_key)
+                        manager.notify(res, change_type, observation_id)
+                    except Exception as e:
+                        log_with_timestamp(f"重新提交查询结果失败: {e}", logging.ERROR)
+
+    def __query_case(self, name: str):
+        """查询并暂存到发件箱，返回 (查询结果, observation_id)，失败时返回 None"""
+        with log_context(case=name):
+            try:
+                manager = self.__managers[name]
+                res = manager.query()
+                if res is None:
+                    return None
+                return res, manager.stage(res)
+            except Exception as e:
+                log_with_timestamp(f"案件查询失败: {e}", logging.ERROR)
+                return None
+
+    def __notify_case(self, name: str, res: dict, change_type: str, observation_id: str) -> bool:
+        with log_context(case=name):
+            try:
+                results = self.__managers[name].notify(res, change_type, observation_id)
+                return all(result.success for result in results)
+            except Exception as e:
+                log_with_timestamp(f"案件通知失败: {e}", logging.ERROR)
+                return False
+
+    def __observe_all(self, queried: dict) -> dict:
+        """
+        按状态服务地址分组，每个服务只发一次 /observe/batch 请求
+
+        Returns:
+            {案件名: 变更类型}
+        """
+        groups = {}
+        for name in queried:
+            base_url = self.__managers[name].status_api_base_url
+            groups.setdefault(base_url, []).append(name)
+
+        change_types = {}
+        for base_url, names in groups.items():
+            if not base_url:
+                for name in names:
+                    change_types[name] = self.__managers[name].observe(*queried[name])
+                continue
+            observations = [
+                (self.__managers[name].case_id, res["status"], res["case_last_updated"], observation_id)
+                for res, observation_id in (queried[name] for name in names)
+            ]
+            change_types.update(zip(names, get_status_api_client(base_url).observe_many(observations)))
+        return change_types
+
+    def run_once(self, names: list = None) -> dict:
+        """
+        对所有（或指定的）案件各执行一次查询与通知
+
+        先并发查询所有案件，再按状态服务批量提交结果，最后并发发送通知（使用发件箱时写入发件箱，由后台线程一起发送）。
+
+        Returns:
+            {案件名: 是否处理成功}
+        """
+        names = names if names is not None else list(self.__managers)
+        if not self.__recovered:
+            self.recover()
+        else:
+            self.__replay_staged(names)
+        start = time.monotonic()
+        futures = {name: self.__executor.submit(self.__query_case, name) for name in names}
+        responses = {name: future.result() for name, future in futures.items()}
+        queried = {name: res for name, res in responses.items() if res is not None}
+
+        try:
+            change_types = self.__observe_all(queried)
+        except Exception as e:
+            log_with_timestamp(f"批量提交查询结果失败: {e}", logging.ERROR)
+            change_types = {}
+
+        with self.hold_notifications():
+            futures = {
+                name: self.__executor.submit(
+                    self.__notify_case, name, res, change_types.get(name, CHANGE_UNKNOWN), observation_id
+                )
+                for name, (res, observation_id) in queried.items()
+            }
+            results = {name: False for name in names}
+            results.update({name: future.result() for name, future in futures.items()})
+        self.flush_notifications()
+        succeeded = sum(results.values())
+        log_with_timestamp(
+            f"Processed {len(results)} case(s) in {time.monotonic() - start:.1f}s, "
+            f"{succeeded} succeeded, {len(results) - succeeded} failed"
+        )
+        return results
+
+    def flush_notifications(self) -> None:
+        """
+        一轮轮询结束后调用所有通知 handle 的 flush（例如发送邮件摘要）
+
+        使用发件箱时由发件箱在发送后 flush，并据此标记送达，这里不再重复 flush。
+        """
+        if self.__outboxes():
+            return
+        for handle in self.__router.handles():
+            try:
+                handle.flush()
+            except Exception as e:
+                log_with_timestamp(f"Failed to flush {handle.name} notifications: {e}")
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=True)
+        for outbox in self.__outboxes():
+            outbox.close()
+        self.flush_notifications()
+        for handle in self.__router.handles():
+            handle.close()
+
+
+def engine_from_env(**kwargs) -> MultiCaseEngine:
+    """
+    按环境变量构造 MultiCaseEngine：案件来自 CASES_FILE 或 LOCATION/NUMBER/PASSPORT_NUMBER/SURNAME，
+    状态服务地址来自 STATUS_API_BASE_URL，通知渠道由 NotificationRouter 按环境变量配置
+
+    Args:
+        kwargs: 传给 MultiCaseEngine 的其他参数
+    """
+    status_api_base_url = os.getenv("STATUS_API_BASE_URL")
+    if not status_api_base_url:
+        log_with_timestamp("STATUS_API_BASE_URL not set, status tracking will not work", logging.WARNING)
+    return MultiCaseEngine(cases_from_env(), status_api_base_url=status_api_base_url, **kwargs)
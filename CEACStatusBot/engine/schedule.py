@@ -0,0 +1,119 @@
+import datetime
+import os
+
+import pytz
+
+from .case import Case
+
+__all__ = ["AdaptivePollingPolicy"]
+
+# 各状态相对基础轮询间隔的倍数，未列出的状态为 1
+DEFAULT_STATUS_FACTORS = {
+    # 已签发，基本不会再变化
+    "Issued": 18.0,
+}
+# case_last_updated 在该天数内视为刚有进展，更新往往接连发生
+RECENT_UPDATE_DAYS = 3
+RECENT_UPDATE_FACTOR = 0.5
+# case_last_updated 超过该天数视为长期没有进展
+STALE_UPDATE_DAYS = 60
+STALE_UPDATE_FACTOR = 2.0
+CASE_DATE_FORMAT = "%d-%b-%Y"
+
+
+def _parse_hours(active_hours: str) -> tuple:
+    start_str, end_str = active_hours.split("-")
+    if end_str == "24:00":
+        end_str = "23:59"
+    start = datetime.datetime.strptime(start_str, "%H:%M").time()
+    end = datetime.datetime.strptime(end_str, "%H:%M").time()
+    return start, end
+
+
+class AdaptivePollingPolicy:
+    def __init__(
+        self,
+        interval: float,
+        minInterval: float = None,
+        maxInterval: float = None,
+        activeHours: str = None,
+        timezone: str = None,
+        statusFactors: dict = None,
+    ) -> None:
+        """
+        根据案件当前状态决定下一次轮询的间隔
+
+        间隔 = 基础间隔 × 状态倍数 × 进展倍数，限制在 [minInterval, maxInterval] 内：
+        - 状态倍数：Issued 等基本不会再变化的状态轮询得更少
+        - 进展倍数：case_last_updated 在最近几天内的案件更频繁，长期没有进展的案件更少
+        - 使馆工作时间：设置后，落在工作时间之外的轮询推迟到下一个工作时间开始
+
+        Args:
+            interval: 基础轮询间隔（秒）
+            minInterval: 最短间隔，默认读取环境变量 POLL_MIN_INTERVAL（默认基础间隔的一半）
+            maxInterval: 最长间隔，默认读取环境变量 POLL_MAX_INTERVAL（默认 24 小时）
+            activeHours: 使馆工作时间 "HH:MM-HH:MM"，默认读取环境变量 POLL_ACTIVE_HOURS，未设置时不限制；
+                可以在案件配置中用 poll_active_hours 按案件覆盖
+            timezone: 工作时间所在的时区，默认读取环境变量 POLL_TIMEZONE，其次 TIMEZONE；
+                可以在案件配置中用 poll_timezone 按案件覆盖
+            statusFactors: 状态 -> 间隔倍数，默认 DEFAULT_STATUS_FACTORS
+        """
+        self.__interval = interval
+        self.__minInterval = minInterval or float(os.getenv("POLL_MIN_INTERVAL", interval / 2))
+        self.__maxInterval = maxInterval or float(os.getenv("POLL_MAX_INTERVAL", 24 * 3600))
+        self.__activeHours = activeHours or os.getenv("POLL_ACTIVE_HOURS")
+        self.__timezone = timezone or os.getenv("POLL_TIMEZONE") or os.getenv("TIMEZONE")
+        self.__statusFactors = statusFactors if statusFactors is not None else DEFAULT_STATUS_FACTORS
+
+    def factor(self, result: dict, now: datetime.datetime = None) -> float:
+        """
+        案件的间隔倍数，越小表示越可能发生变化；同时用作请求预算不足时的优先级
+
+        还没有查询结果的案件返回 0（最优先）。
+        """
+        if not result:
+            return 0.0
+        factor = self.__statusFactors.get(result.get("status"), 1.0)
+
+        try:
+            updated = datetime.datetime.strptime(result.get("case_last_updated") or "", CASE_DATE_FORMAT).date()
+        except ValueError:
+            return factor
+        days = ((now or datetime.datetime.now()).date() - updated).days
+        if days <= RECENT_UPDATE_DAYS:
+            factor *= RECENT_UPDATE_FACTOR
+        elif days >= STALE_UPDATE_DAYS:
+            factor *= STALE_UPDATE_FACTOR
+        return factor
+
+    def __tz(self, case: Case):
+        name = case.notify.get("poll_timezone") or self.__timezone
+        try:
+            return pytz.timezone(name) if name else None
+        except pytz.exceptions.UnknownTimeZoneError:
+            return None
+
+    def __defer_to_active_hours(self, case: Case, delay: float) -> float:
+        """轮询时间落在工作时间之外时，推迟到下一个工作时间开始"""
+        active_hours = case.notify.get("poll_active_hours") or self.__activeHours
+        if not active_hours:
+            return delay
+        start, end = _parse_hours(active_hours)
+        tz = self.__tz(case)
+        now = datetime.datetime.now(tz)
+        due = now + datetime.timedelta(seconds=delay)
+        if start <= due.time() <= end:
+            return delay
+
+        day = due.date() if due.time() < start else due.date() + datetime.timedelta(days=1)
+        opening = datetime.datetime.combine(day, start)
+        opening = tz.localize(opening) if tz else opening
+        return (opening - now).total_seconds()
+
+    def next_delay(self, case: Case, result: dict) -> float:
+        """距离该案件下一次轮询的秒数（不含抖动）"""
+        if not result:
+            return self.__minInterval
+        delay = self.__interval * self.factor(result)
+        delay = min(max(delay, self.__minInterval), self.__maxInterval)
+        return self.__defer_to_active_hours(case, delay)
@@ -1,5 +1,24 @@
-from .handle import *
-from .manager import *
-from .email import *
-from .telegram import *
-from .ios import *
\ No newline at end of file
+from CEACStatusBot.utils.lazy import lazy_exports
+
+# 各通知渠道（smtplib、Telegram 等）只在实际使用时才导入
+_EXPORTS = {
+    "NotificationHandle": ".handle",
+    "StatusApiClient": ".status_api",
+    "get_status_api_client": ".status_api",
+    "NotificationResult": ".dispatch",
+    "NotificationDispatcher": ".dispatch",
+    "get_default_dispatcher": ".dispatch",
+    "NotificationOutbox": ".outbox",
+    "get_default_outbox": ".outbox",
+    "NotificationManager": ".manager",
+    "SmtpTransport": ".email",
+    "get_smtp_transport": ".email",
+    "EmailNotificationHandle": ".email",
+    "TelegramSender": ".telegram",
+    "get_telegram_sender": ".telegram",
+    "TelegramNotificationHandle": ".telegram",
+    "IOSNotificationHandle": ".ios",
+}
+
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
@@ -0,0 +1,147 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+from CEACStatusBot.utils import get_default_registry, log_with_timestamp
+
+from .handle import NotificationHandle, send_deadline
+
+__all__ = ["NotificationResult", "NotificationDispatcher", "get_default_dispatcher"]
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 30
+# 渠道在截止时间后还需要多久才能放弃网络请求并返回（秒），超过后才把发送记为超时
+TIMEOUT_GRACE = 5
+
+_metrics = get_default_registry()
+SEND_SECONDS = _metrics.histogram("notification_send_seconds", "Notification send latency per channel", ["channel"])
+NOTIFICATIONS = _metrics.counter("notifications_total", "Notifications by channel and result", ["channel", "result"])
+
+
+@dataclass
+class NotificationResult:
+    """单个渠道的发送结果"""
+    channel: str
+    success: bool
+    latency: float
+    error: str = None
+
+
+class NotificationDispatcher:
+    def __init__(self, maxWorkers: int = None, timeout: float = None) -> None:
+        """
+        在共享线程池中并发发送各渠道的通知
+
+        每个渠道独立计时、独立捕获异常：一个渠道慢或失败不影响其他渠道。
+        超时从渠道开始发送时计算（在线程池中排队的时间不算），并通过 send_deadline 传给渠道的 SMTP / HTTP 请求，
+        超时的发送由渠道自己中止，而不是在后台继续执行。
+
+        Args:
+            maxWorkers: 线程池大小，默认读取环境变量 NOTIFY_MAX_WORKERS（默认 8）
+            timeout: 每个渠道从开始发送起的超时（秒），默认读取环境变量 NOTIFY_TIMEOUT（默认 30）
+        """
+        self.__maxWorkers = maxWorkers or int(os.getenv("NOTIFY_MAX_WORKERS", DEFAULT_MAX_WORKERS))
+        self.__timeout = timeout or float(os.getenv("NOTIFY_TIMEOUT", DEFAULT_TIMEOUT))
+        self.__executor = ThreadPoolExecutor(max_workers=self.__maxWorkers, thread_name_prefix="notifier")
+
+    @property
+    def timeout(self) -> float:
+        return self.__timeout
+
+    def __send(self, started: dict, index: int, handle: NotificationHandle, result: dict, change_type: str) -> NotificationResult:
+        start = time.monotonic()
+        started[index] = start
+        try:
+            with send_deadline(self.__timeout):
+                handle.send(result, change_type=change_type)
+            return NotificationResult(handle.name, True, time.monotonic() - start)
+        except Exception as e:
+            return NotificationResult(handle.name, False, time.monotonic() - start, f"{type(e).__name__}: {e}")
+
+    def dispatch(self, handles: list, result: dict, change_type: str = "status") -> list:
+        """
+        并发调用所有 handle 的 send
+
+        Returns:
+            与 handles 一一对应的 NotificationResult 列表
+        """
+        return self.dispatch_jobs([(handle, result, change_type) for handle in handles])
+
+    def dispatch_jobs(self, jobs: list) -> list:
+        """
+        并发执行多个发送任务
+
+        每个任务从开始执行起计时；渠道在截止时间内自行中止请求并报告失败，
+        超过截止时间 TIMEOUT_GRACE 秒仍未返回的任务才记为超时（发送线程无法被中断，会在后台结束）。
+
+        Args:
+            jobs: [(handle, result, change_type), ...]
+
+        Returns:
+            与 jobs 一一对应的 NotificationResult 列表
+        """
+        if not jobs:
+            return []
+        # 任务序号 -> 开始执行的时间
+        started = {}
+        # 发送线程沿用调用方的日志上下文（如案件名）
+        futures = [
+            self.__executor.submit(contextvars.copy_context().run, self.__send, started, index, *job)
+            for index, job in enumerate(jobs)
+        ]
+        limit = self.__timeout + TIMEOUT_GRACE
+        pending = set(range(len(futures)))
+        while True:
+            now = time.monotonic()
+            pending = {
+                index for index in pending
+                if not futures[index].done() and (index not in started or now < started[index] + limit)
+            }
+            if not pending:
+                break
+            # 等到有任务结束或最早的截止时间；还在排队的任务开始后才有截止时间，最多等一个 timeout 再检查
+            deadlines = [started[index] + limit for index in pending if index in started]
+            until = min(deadlines) if deadlines else now + self.__timeout
+            wait([futures[index] for index in pending], timeout=max(until - now, 0), return_when=FIRST_COMPLETED)
+
+        results = []
+        for index, ((handle, _, _), future) in enumerate(zip(jobs, futures)):
+            if future.done():
+                outcome = future.result()
+            else:
+                outcome = NotificationResult(
+                    handle.name, False, time.monotonic() - started[index], f"timed out after {self.__timeout:g}s"
+                )
+            results.append(outcome)
+            SEND_SECONDS.observe(outcome.latency, channel=outcome.channel)
+            if outcome.success:
+                NOTIFICATIONS.inc(channel=outcome.channel, result="success")
+            else:
+                NOTIFICATIONS.inc(channel=outcome.channel, result="timeout" if not future.done() else "failure")
+            if outcome.success:
+                log_with_timestamp(f"Notification via {outcome.channel} sent in {outcome.latency:.2f}s")
+            else:
+                log_with_timestamp(
+                    f"Notification via {outcome.channel} failed after {outcome.latency:.2f}s: {outcome.error}", logging.WARNING
+                )
+        return results
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=True)
+
+
+_default_dispatcher = None
+_default_dispatcher_lock = threading.Lock()
+
+
+def get_default_dispatcher() -> NotificationDispatcher:
+    """进程内默认共享的 NotificationDispatcher"""
+    global _default_dispatcher
+    with _default_dispatcher_lock:
+        if _default_dispatcher is None:
+            _default_dispatcher = NotificationDispatcher()
+        return _default_dispatcher
@@ -1,13 +1,129 @@
+import os
+import smtplib
+import threading
+import time
 from smtplib import SMTP_SSL
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.header import Header
 
 from CEACStatusBot.utils import log_with_timestamp
-from .handle import NotificationHandle
+from .handle import NotificationHandle, send_timeout
+
+SMTP_TIMEOUT = 30
+# 连接空闲超过该秒数后，发送前先用 NOOP 检查连接是否还可用
+SMTP_NOOP_AFTER = 30
+# 连接空闲超过该秒数后直接重连（大多数服务器几分钟后会断开空闲连接）
+SMTP_MAX_IDLE = 240
+
+
+class SmtpTransport:
+    def __init__(self, hostAddress: str, hostPort: int, username: str, password: str) -> None:
+        """
+        复用 SMTP_SSL 连接的发送通道，连接失效时自动重连
+
+        Args:
+            hostAddress: SMTP 服务器地址
+            hostPort: 端口，0 表示默认的 465
+            username: 登录用户名
+            password: 登录密码
+        """
+        self.__hostAddress = hostAddress
+        self.__hostPort = hostPort
+        self.__username = username
+        self.__password = password
+        self.__smtp = None
+        self.__lastUsed = 0.0
+        self.__lock = threading.Lock()
+
+    def __connect(self) -> None:
+        smtp = SMTP_SSL(self.__hostAddress, self.__hostPort, timeout=send_timeout(SMTP_TIMEOUT)) # ssl登录
+        log_with_timestamp(f"Email login result: {smtp.login(self.__username, self.__password)}")
+        self.__smtp = smtp
+
+    def __disconnect(self) -> None:
+        if self.__smtp is None:
+            return
+        try:
+            self.__smtp.quit()
+        except OSError:
+            self.__smtp.close()
+        self.__smtp = None
+
+    def __ensure_connected(self) -> None:
+        idle = time.monotonic() - self.__lastUsed
+        if self.__smtp is not None and idle > SMTP_MAX_IDLE:
+            self.__disconnect()
+        elif self.__smtp is not None and idle > SMTP_NOOP_AFTER:
+            try:
+                if self.__smtp.noop()[0] != 250:
+                    self.__disconnect()
+            except OSError:
+                self.__smtp.close()
+                self.__smtp = None
+        if self.__smtp is None:
+            self.__connect()
+
+    def sendmail(self, fromEmail: str, toEmail: list, message: str) -> dict:
+        """
+        发送一封邮件；连接在发送过程中断开时重连并重试一次
+
+        在分发器中调用时，等待连接和每次 socket 操作的超时不超过本次发送剩余的时间。
+        """
+        if not self.__lock.acquire(timeout=send_timeout(SMTP_TIMEOUT)):
+            raise TimeoutError("timed out waiting for the SMTP connection")
+        try:
+            for attempt in range(2):
+                self.__ensure_connected()
+                # 复用的连接在建立时设置了超时，这里按剩余时间重新设置
+                self.__smtp.sock.settimeout(send_timeout(SMTP_TIMEOUT))
+                try:
+                    result = self.__smtp.sendmail(fromEmail, toEmail, message)
+                    self.__lastUsed = time.monotonic()
+                    return result
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+                    # 服务器正常拒绝了这封邮件，连接本身仍可用
+                    self.__lastUsed = time.monotonic()
+                    raise
+                except OSError as e:
+                    # 包括 SMTPServerDisconnected 和 socket 错误
+                    self.__smtp.close()
+                    self.__smtp = None
+                    if attempt:
+                        raise
+                    log_with_timestamp(f"SMTP connection lost ({e}), reconnecting")
+        finally:
+            self.__lock.release()
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__disconnect()
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_smtp_transport(hostAddress: str, hostPort: int, username: str, password: str) -> SmtpTransport:
+    """同一个发信账号在进程内共享一个 SMTP 连接"""
+    key = (hostAddress, hostPort, username)
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = SmtpTransport(hostAddress, hostPort, username, password)
+            _transports[key] = transport
+        return transport
+
 
 class EmailNotificationHandle(NotificationHandle):
-    def __init__(self,fromEmail:str,toEmail:str,emailPassword:str,hostAddress:str='') -> None:
+    name = "email"
+
+    def __init__(self,fromEmail:str,toEmail:str,emailPassword:str,hostAddress:str='',digest:bool=None) -> None:
+        """
+        Args:
+            digest: 摘要模式，send 只暂存变更，flush 时把同一轮轮询的所有变更合并为一封邮件发送；
+                默认读取环境变量 EMAIL_DIGEST（默认 false）
+        """
         super().__init__()
         self.__fromEmail = fromEmail
         self.__toEmail = toEmail.split("|")
@@ -19,27 +135,67 @@ class EmailNotificationHandle(NotificationHandle):
             self.__hostPort = int(port)
         else:
             self.__hostPort = 0
+        if digest is None:
+            digest = os.getenv("EMAIL_DIGEST", "false").lower() == "true"
+        self.__digest = digest
+        self.__pending = []
+        self.__pendingLock = threading.Lock()
+        self.__transport = get_smtp_transport(self.__hostAddress, self.__hostPort, fromEmail, emailPassword)
 
-    def send(self, result, change_type="status"):
-        
-        # {'success': True, 'visa_type': 'NONIMMIGRANT VISA APPLICATION', 'status': 'Issued', 'case_created': '30-Aug-2022', 'case_last_updated': '19-Oct-2022', 'description': 'Your visa is in final processing. If you have not received it in more than 10 working days, please see the webpage for contact information of the embassy or consulate where you submitted your application.', 'application_num': '***'}
+    @property
+    def key(self) -> str:
+        return f"email:{self.__fromEmail}:{'|'.join(self.__toEmail)}"
 
+    @staticmethod
+    def __title(result, change_type):
         if change_type == "case_updated":
             # 仅 case_last_updated 变更，强调美签正在被 Review
-            mail_title = f'[CEACStatusBot] 🔍 美签正在被 Review (更新日期: {result["case_last_updated"]})'
-        else:
-            # status 变更（包括同时变更的情况），强调状态变更
-            mail_title = f'[CEACStatusBot] 🇺🇸 美签状态更新: {result["status"]}'
-        
-        mail_content = str(result)
+            return f'[CEACStatusBot] 🔍 美签正在被 Review (更新日期: {result["case_last_updated"]})'
+        # status 变更（包括同时变更的情况），强调状态变更
+        return f'[CEACStatusBot] 🇺🇸 美签状态更新: {result["status"]}'
 
+    def __deliver(self, mail_title, mail_content):
         msg = MIMEMultipart()
         msg["Subject"] = Header(mail_title,'utf-8')
         msg["From"] = self.__fromEmail
         msg['To'] = ";".join(self.__toEmail)
         msg.attach(MIMEText(mail_content,'plain','utf-8'))
 
-        smtp = SMTP_SSL(self.__hostAddress, self.__hostPort) # ssl登录
-        log_with_timestamp(f"Email login result: {smtp.login(self.__fromEmail,self.__emailPassword)}")
-        log_with_timestamp(f"Email send result: {smtp.sendmail(self.__fromEmail,self.__toEmail,msg.as_string())}")
-        smtp.quit()
\ No newline at end of file
+        log_with_timestamp(f"Email send result: {self.__transport.sendmail(self.__fromEmail,self.__toEmail,msg.as_string())}")
+
+    def send(self, result, change_type="status"):
+
+        # {'success': True, 'visa_type': 'NONIMMIGRANT VISA APPLICATION', 'status': 'Issued', 'case_created': '30-Aug-2022', 'case_last_updated': '19-Oct-2022', 'description': 'Your visa is in final processing. If you have not received it in more than 10 working days, please see the webpage for contact information of the embassy or consulate where you submitted your application.', 'application_num': '***'}
+
+        if self.__digest:
+            with self.__pendingLock:
+                self.__pending.append((result, change_type))
+            return
+
+        self.__deliver(self.__title(result, change_type), str(result))
+
+    def flush(self, requeue: bool = True):
+        """摘要模式下把暂存的变更合并为一封邮件发送；发送失败时按 requeue 保留，下次 flush 重试"""
+        with self.__pendingLock:
+            pending, self.__pending = self.__pending, []
+        if not pending:
+            return
+
+        if len(pending) == 1:
+            result, change_type = pending[0]
+            mail_title, mail_content = self.__title(result, change_type), str(result)
+        else:
+            mail_title = f'[CEACStatusBot] 🇺🇸 {len(pending)} 个美签案件有更新'
+            mail_content = "\n\n".join(
+                f'{self.__title(result, change_type)}\n{result}' for result, change_type in pending
+            )
+        try:
+            self.__deliver(mail_title, mail_content)
+        except Exception:
+            if requeue:
+                with self.__pendingLock:
+                    self.__pending[:0] = pending
+            raise
+
+    def close(self):
+        self.__transport.close()
@@ -1,16 +1,73 @@
+import contextvars
+import time
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+# 分发器为当前发送设置的截止时间（monotonic），各渠道据此缩短网络请求的超时
+_deadline = contextvars.ContextVar("notification_deadline", default=None)
+
+
+@contextmanager
+def send_deadline(timeout: float):
+    """在 with 块内的发送必须在 timeout 秒内结束，渠道通过 send_timeout 获取剩余时间"""
+    token = _deadline.set(time.monotonic() + timeout)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def send_timeout(default: float) -> float:
+    """
+    渠道网络请求使用的超时：不超过 default，也不超过本次发送剩余的时间
+
+    Raises:
+        TimeoutError: 已经超过截止时间
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("notification deadline exceeded")
+    return min(default, remaining)
+
 
 class NotificationHandle(ABC):
+    # 通知渠道名称，用于日志和分发结果
+    name = "notification"
+
     def __init__(self) -> None:
         super().__init__() 
 
+    @property
+    def key(self) -> str:
+        """渠道 + 目的地的稳定标识，通知发件箱用它在重启后找回对应的 handle"""
+        return self.name
+
     @abstractmethod
     def send(self, result, change_type="status"):
         """
-        发送通知
+        发送通知，失败时抛出异常
         
         Args:
             result: 查询结果字典
             change_type: 变更类型，可选值: "status" (状态变更) 或 "case_updated" (案件更新日期变更)
         """
-        pass
\ No newline at end of file
+        pass
+
+    def flush(self, requeue: bool = True):
+        """
+        一轮轮询结束时调用，发送暂存的通知（例如邮件摘要模式），默认无操作
+
+        暂存的通知只有 flush 成功才算送达，发送失败时抛出异常。
+
+        Args:
+            requeue: 发送失败时是否保留暂存的通知，下次 flush 重试；
+                通知发件箱会自行重试未送达的记录，调用时传 False，避免重复发送
+        """
+        pass
+
+    def close(self):
+        """释放连接等资源，默认无操作"""
+        pass
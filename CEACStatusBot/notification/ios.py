@@ -2,10 +2,12 @@ import requests
 from urllib.parse import quote
 
 from CEACStatusBot.utils import log_with_timestamp
-from .handle import NotificationHandle
+from .handle import NotificationHandle, send_timeout
 
 
 class IOSNotificationHandle(NotificationHandle):
+    name = "ios"
+
     def __init__(self, base_url: str = None) -> None:
         """
         iOS 通知处理器
@@ -16,6 +18,10 @@ class IOSNotificationHandle(NotificationHandle):
         super().__init__()
         self.__base_url = base_url or "http://119.28.41.230:28080/FhKp8p8Ltd3abpX6bBXAHV"
 
+    @property
+    def key(self) -> str:
+        return f"ios:{self.__base_url}"
+
     def send(self, result, change_type="status"):
         """
         发送 iOS 通知
@@ -54,18 +60,14 @@ class IOSNotificationHandle(NotificationHandle):
         # 构建完整的请求 URL
         notification_url = f"{self.__base_url}/{encoded_title}/{encoded_content}"
         
-        try:
-            # 发送 GET 请求
-            response = requests.get(notification_url, timeout=10)
-            
-            # 检查响应
-            if response.status_code == 200:
-                log_with_timestamp("iOS notification sent successfully")
-            else:
-                log_with_timestamp(
-                    f"Failed to send iOS notification: "
-                    f"status_code={response.status_code}, response={response.text}"
-                )
-        except requests.exceptions.RequestException as e:
-            log_with_timestamp(f"Error sending iOS notification: {e}")
+        # 发送 GET 请求，网络错误直接抛出，由分发器记录
+        response = requests.get(notification_url, timeout=send_timeout(10))
+        
+        # 检查响应
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"Failed to send iOS notification: "
+                f"status_code={response.status_code}, response={response.text}"
+            )
+        log_with_timestamp("iOS notification sent successfully")
 
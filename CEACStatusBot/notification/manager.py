@@ -1,17 +1,25 @@
 import os
 import datetime
+import logging
 
 import pytz
 import requests
 
-from CEACStatusBot.captcha import CaptchaHandle, OnnxCaptchaHandle
+from CEACStatusBot.captcha import CaptchaHandle
 from CEACStatusBot.request import query_status
-from CEACStatusBot.utils import log_with_timestamp
+from CEACStatusBot.utils import get_default_registry, log_with_timestamp
 
+from .dispatch import NotificationDispatcher, get_default_dispatcher
 from .handle import NotificationHandle
+from .outbox import NotificationOutbox, get_default_outbox
+from .status_api import CHANGE_UNKNOWN, get_status_api_client
 
 DEFAULT_ACTIVE_HOURS = "00:00-23:59"
 
+STAGE_SECONDS = get_default_registry().histogram(
+    "notification_manager_stage_seconds", "Time spent per stage of a case check", ["stage"]
+)
+
 
 class NotificationManager:
     def __init__(
@@ -20,9 +28,23 @@ class NotificationManager:
         number: str,
         passport_number: str,
         surname: str,
-        captchaHandle: CaptchaHandle = OnnxCaptchaHandle("captcha.onnx"),
+        captchaHandle: CaptchaHandle = None,
         status_api_base_url: str = None,
+        case_id: str = None,
+        session: requests.Session = None,
+        dispatcher: NotificationDispatcher = None,
+        outbox: NotificationOutbox = None,
     ) -> None:
+        """
+        单个案件的查询、变更检测与通知
+
+        Args:
+            captchaHandle: 验证码识别 handle，默认在第一次查询时使用进程内共享的 OnnxCaptchaHandle("captcha.onnx")
+            case_id: 状态服务中的案件标识，None 表示使用状态服务的默认案件
+            session: 查询 CEAC 使用的 session，在多次轮询之间复用连接和 cookie，默认每次查询新建
+            dispatcher: 并发发送各渠道通知的分发器，默认使用进程内共享的分发器
+            outbox: 通知发件箱，默认使用进程内共享的发件箱（NOTIFY_OUTBOX_DB 为空时不使用，直接同步发送）
+        """
         self.__handleList = []
         self.__location = location
         self.__number = number
@@ -30,6 +52,29 @@ class NotificationManager:
         self.__passport_number = passport_number
         self.__surname = surname
         self.__status_api_base_url = status_api_base_url or os.getenv("STATUS_API_BASE_URL", "")
+        self.__case_id = case_id
+        self.__session = session
+        self.__last_result = None
+        self.__dispatcher = dispatcher
+        self.__outbox = outbox if outbox is not None else get_default_outbox()
+
+    @property
+    def case_id(self) -> str:
+        return self.__case_id
+
+    @property
+    def name(self) -> str:
+        """案件在本地（日志、发件箱）中的标识"""
+        return self.__case_id or self.__number
+
+    @property
+    def outbox(self) -> NotificationOutbox:
+        return self.__outbox
+
+    @property
+    def last_result(self) -> dict:
+        """最近一次成功查询的结果，还没有成功查询过时为 None"""
+        return self.__last_result
 
     def _get_hour_range(self) -> list:
         active_hours = os.getenv("ACTIVE_HOURS")
@@ -49,112 +94,112 @@ class NotificationManager:
 
     def addHandle(self, notificationHandle: NotificationHandle) -> None:
         self.__handleList.append(notificationHandle)
+        if self.__outbox is not None:
+            self.__outbox.register(notificationHandle)
 
-    def send(self) -> None:
+    @property
+    def status_api_base_url(self) -> str:
+        return self.__status_api_base_url
+
+    def query(self) -> dict:
+        """查询 CEAC，成功时返回查询结果，失败时返回 None"""
         res = query_status(
             self.__location,
             self.__number,
             self.__passport_number,
             self.__surname,
             self.__captchaHandle,
+            session=self.__session,
         )
         
         # 检查查询是否成功
         if not res.get("success", False):
-            log_with_timestamp(f"查询失败详情: {res}")
-            log_with_timestamp("无法获取签证状态，可能是验证码识别失败或网络问题")
-            return
-        
-        current_status = res["status"]
-        current_last_updated = res["case_last_updated"]
-        log_with_timestamp(f"Current status: {current_status} - Last updated: {current_last_updated}")
+            # 失败原因已由 query_status 记录，完整结果只在 DEBUG 级别输出
+            log_with_timestamp(f"查询失败详情: {res}", logging.DEBUG)
+            log_with_timestamp("无法获取签证状态，可能是验证码识别失败或网络问题", logging.WARNING)
+            return None
         
-        # Get the previous status from API
-        last_status_record = self.__get_last_status()
+        log_with_timestamp(f"Current status: {res['status']} - Last updated: {res['case_last_updated']}")
+        self.__last_result = res
+        return res
 
-        # Determine what changed
-        status_changed = False
-        case_updated_changed = False
-        
-        if not last_status_record:
-            # First run, record as status change
-            status_changed = True
-        else:
-            if current_status != last_status_record["status"]:
-                status_changed = True
-            if current_last_updated != last_status_record.get("case_last_updated", ""):
-                case_updated_changed = True
-        
-        # Determine notification behavior
-        if status_changed:
+    def send(self) -> None:
+        with STAGE_SECONDS.time(stage="query"):
+            res = self.query()
+        if res is None:
+            return
+
+        # 先暂存到发件箱，再由状态服务原子地比较并保存，返回变更类型
+        with STAGE_SECONDS.time(stage="stage"):
+            observation_id = self.stage(res)
+        with STAGE_SECONDS.time(stage="observe"):
+            change_type = self.observe(res, observation_id)
+        with STAGE_SECONDS.time(stage="notify"):
+            self.notify(res, change_type, observation_id)
+
+    def stage(self, res: dict) -> str:
+        """提交到状态服务之前把查询结果暂存到发件箱，返回 observation_id；未使用发件箱时返回 None"""
+        if self.__outbox is None:
+            return None
+        return self.__outbox.stage(self.name, res)
+
+    def notify(self, res: dict, change_type: str, observation_id: str = None) -> list:
+        """
+        根据变更类型发送通知
+
+        带 observation_id 且使用发件箱时，通知写入发件箱后立即返回，由后台线程发送。
+
+        变更类型为 CHANGE_UNKNOWN（状态服务不可用）时不发送通知，暂存的查询结果留在发件箱中，
+        由下一轮轮询重新提交。
+
+        Returns:
+            各渠道的 NotificationResult 列表，没有同步发送时为空列表
+        """
+        if change_type == CHANGE_UNKNOWN:
+            log_with_timestamp("Result: status API unavailable, change unknown, no notification sent.", logging.WARNING)
+            return []
+        if change_type == "status":
             # Status changed (with or without case_last_updated change)
-            # Treat as status change
-            self.__save_current_status(current_status, current_last_updated)
-            self.__send_notifications(res, change_type="status")
-            log_with_timestamp(f"Result: status changed to: {current_status}")
-        elif case_updated_changed:
+            log_with_timestamp(f"Result: status changed to: {res['status']}")
+            return self.__send_notifications(res, "status", observation_id)
+        elif change_type == "case_updated":
             # Only case_last_updated changed
-            self.__save_current_status(current_status, current_last_updated)
-            self.__send_notifications(res, change_type="case_updated")
-            log_with_timestamp(f"Result: case last updated changed to: {current_last_updated}")
+            log_with_timestamp(f"Result: case last updated changed to: {res['case_last_updated']}")
+            return self.__send_notifications(res, "case_updated", observation_id)
         else:
             log_with_timestamp("Result: no changes detected, no notification sent.")
+            self.__discard(observation_id, res)
+            return []
+
+    def __discard(self, observation_id: str, res: dict) -> None:
+        """不需要通知时删除发件箱中的暂存记录"""
+        if self.__outbox is not None and observation_id:
+            self.__outbox.resolve(observation_id, [], res, None)
 
-    def __get_last_status(self) -> dict:
-        """从 API 获取上一次的状态"""
+    def observe(self, res: dict, observation_id: str = None) -> str:
+        """
+        提交查询结果到状态服务，返回变更类型 "status" / "case_updated" / None，状态服务不可用时返回 CHANGE_UNKNOWN
+
+        未配置 STATUS_API_BASE_URL 时无法比较，每次都按状态变更处理。
+        observation_id 用于重试时让状态服务返回第一次的变更类型。
+        """
         if not self.__status_api_base_url:
             log_with_timestamp("STATUS_API_BASE_URL not set, cannot get last status")
-            return None
-        
-        try:
-            response = requests.get(f"{self.__status_api_base_url}/status", timeout=10)
-            response.raise_for_status()
-            result = response.json()
-            
-            if result.get("success"):
-                return result.get("data")
-            else:
-                log_with_timestamp(f"Failed to get status from API: {result.get('error', 'Unknown error')}")
-                return None
-        except Exception as e:
-            log_with_timestamp(f"Error getting status from API: {e}")
-            return None
+            return "status"
+        client = get_status_api_client(self.__status_api_base_url)
+        return client.observe(res["status"], res["case_last_updated"], self.__case_id, observation_id)
 
-    def __save_current_status(self, status: str, case_last_updated: str) -> None:
-        """保存当前状态到 API"""
-        if not self.__status_api_base_url:
-            log_with_timestamp("STATUS_API_BASE_URL not set, cannot save status")
-            return
-        
-        try:
-            payload = {
-                "status": status,
-                "case_last_updated": case_last_updated
-            }
-            response = requests.post(
-                f"{self.__status_api_base_url}/status",
-                json=payload,
-                timeout=10
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            if not result.get("success"):
-                log_with_timestamp(f"Failed to save status to API: {result.get('error', 'Unknown error')}")
-        except Exception as e:
-            log_with_timestamp(f"Error saving status to API: {e}")
-
-    def __send_notifications(self, res: dict, change_type: str = "status") -> None:
+    def __send_notifications(self, res: dict, change_type: str = "status", observation_id: str = None) -> list:
         if res["status"] == "Refused":
             try:
                 TIMEZONE = os.environ["TIMEZONE"]
                 localTimeZone = pytz.timezone(TIMEZONE)
                 localTime = datetime.datetime.now(localTimeZone)
             except pytz.exceptions.UnknownTimeZoneError:
-                log_with_timestamp("UNKNOWN TIMEZONE Error, use default")
+                log_with_timestamp("UNKNOWN TIMEZONE Error, use default", logging.WARNING)
                 localTime = datetime.datetime.now()
             except KeyError:
-                log_with_timestamp("TIMEZONE Error")
+                log_with_timestamp("TIMEZONE Error", logging.WARNING)
                 localTime = datetime.datetime.now()
 
             active_hour_start, active_hour_end = self._get_hour_range()
@@ -165,7 +210,12 @@ class NotificationManager:
                     f"Outside active hours {os.getenv('ACTIVE_HOURS', DEFAULT_ACTIVE_HOURS)}. "
                     "No notification sent for Refused status."
                 )
-                return
+                self.__discard(observation_id, res)
+                return []
+
+        if self.__outbox is not None and observation_id:
+            self.__outbox.resolve(observation_id, self.__handleList, res, change_type)
+            return []
 
-        for notificationHandle in self.__handleList:
-            notificationHandle.send(res, change_type=change_type)
+        dispatcher = self.__dispatcher or get_default_dispatcher()
+        return dispatcher.dispatch(self.__handleList, res, change_type)
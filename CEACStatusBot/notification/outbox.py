@@ -0,0 +1,328 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from CEACStatusBot.utils import get_default_registry, log_with_timestamp
+
+from .dispatch import NotificationDispatcher, NotificationResult, get_default_dispatcher
+from .handle import NotificationHandle
+
+__all__ = ["NotificationOutbox", "get_default_outbox"]
+
+DEFAULT_OUTBOX_DB = "notification_outbox.db"
+DEFAULT_MAX_ATTEMPTS = 20
+# 重试退避：5 秒起，每次翻倍，最长 1 小时
+BACKOFF_BASE = 5
+BACKOFF_MAX = 3600
+# 已送达的记录保留天数（用于幂等去重）
+DELIVERED_RETENTION_DAYS = 30
+DRAIN_BATCH_SIZE = 50
+# 找不到对应 handle 的通知隔多久再检查（秒）
+UNKNOWN_HANDLE_RECHECK = 60
+
+PENDING = get_default_registry().gauge("notification_outbox_pending", "Undelivered notifications in the default outbox")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS staged_observations (
+    observation_id TEXT PRIMARY KEY,
+    case_key TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    handle_key TEXT NOT NULL,
+    result TEXT NOT NULL,
+    change_type TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    delivered_at REAL,
+    failed_at REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_deliveries_due
+    ON deliveries (next_attempt_at) WHERE delivered_at IS NULL AND failed_at IS NULL;
+"""
+
+
+class NotificationOutbox:
+    def __init__(self, path: str = None, dispatcher: NotificationDispatcher = None, maxAttempts: int = None) -> None:
+        """
+        基于 SQLite 的通知发件箱，保证状态变更的通知不会丢失
+
+        流程：
+        1. 查询成功后先 stage() 暂存本次结果，得到 observation_id，再提交到状态服务（带上该 id）
+        2. 拿到变更类型后 resolve()：在同一个事务内删除暂存记录，并为每个渠道写入一条待发送记录
+        3. 后台线程按退避策略发送，成功后标记为已送达
+
+        进程在第 1、2 步之间退出时，暂存记录会在下次启动时重新提交（状态服务按 observation_id 返回第一次的变更类型）。
+        每条待发送记录以 "observation_id:渠道" 作为幂等键，重复 resolve 不会重复入队；
+        发送本身是至少一次语义，发送成功但标记前退出时可能重复发送一次。
+
+        Args:
+            path: 数据库路径，默认读取环境变量 NOTIFY_OUTBOX_DB（默认 notification_outbox.db）
+            dispatcher: 发送使用的分发器，默认使用进程内共享的分发器
+            maxAttempts: 单条通知的最大发送次数，默认读取环境变量 NOTIFY_MAX_ATTEMPTS（默认 20）
+        """
+        self.__path = path or os.getenv("NOTIFY_OUTBOX_DB", DEFAULT_OUTBOX_DB)
+        self.__dispatcher = dispatcher
+        self.__maxAttempts = maxAttempts or int(os.getenv("NOTIFY_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+        self.__conn = sqlite3.connect(self.__path, check_same_thread=False, isolation_level=None)
+        self.__conn.row_factory = sqlite3.Row
+        self.__lock = threading.RLock()
+        with self.__lock:
+            self.__conn.execute("PRAGMA journal_mode=WAL")
+            self.__conn.execute("PRAGMA synchronous=NORMAL")
+            self.__conn.executescript(SCHEMA)
+            self.__conn.execute(
+                "DELETE FROM deliveries WHERE delivered_at < ?",
+                (time.time() - DELIVERED_RETENTION_DAYS * 86400,),
+            )
+
+        self.__handles = {}
+        self.__wakeEvent = threading.Event()
+        self.__stopEvent = threading.Event()
+        self.__holdCount = 0
+        self.__worker = None
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def register(self, handle: NotificationHandle) -> None:
+        """登记可用于发送的 handle，重启后按 handle.key 找回对应渠道"""
+        with self.__lock:
+            self.__handles[handle.key] = handle
+
+    @contextmanager
+    def __transaction(self):
+        with self.__lock:
+            self.__conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.__conn
+                self.__conn.execute("COMMIT")
+            except Exception:
+                self.__conn.execute("ROLLBACK")
+                raise
+
+    def stage(self, case_key: str, result: dict) -> str:
+        """在提交到状态服务之前暂存查询结果，返回 observation_id"""
+        observation_id = uuid.uuid4().hex
+        with self.__transaction() as conn:
+            conn.execute(
+                "INSERT INTO staged_observations (observation_id, case_key, result, created_at) VALUES (?, ?, ?, ?)",
+                (observation_id, case_key, json.dumps(result, ensure_ascii=False), time.time()),
+            )
+        return observation_id
+
+    def staged(self) -> list:
+        """返回尚未 resolve 的暂存结果 [(observation_id, case_key, result), ...]"""
+        with self.__lock:
+            rows = self.__conn.execute(
+                "SELECT observation_id, case_key, result FROM staged_observations ORDER BY created_at"
+            ).fetchall()
+        return [(row["observation_id"], row["case_key"], json.loads(row["result"])) for row in rows]
+
+    def resolve(self, observation_id: str, handles: list, result: dict, change_type: str) -> int:
+        """
+        删除暂存记录，并在有变更时为每个 handle 写入待发送记录（同一个事务）
+
+        Returns:
+            新入队的通知数
+        """
+        now = time.time()
+        enqueued = 0
+        with self.__transaction() as conn:
+            conn.execute("DELETE FROM staged_observations WHERE observation_id = ?", (observation_id,))
+            if change_type:
+                payload = json.dumps(result, ensure_ascii=False)
+                for handle in handles:
+                    self.register(handle)
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO deliveries "
+                        "(idempotency_key, handle_key, result, change_type, next_attempt_at, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (f"{observation_id}:{handle.key}", handle.key, payload, change_type, now, now),
+                    )
+                    enqueued += cursor.rowcount
+        if enqueued:
+            self.__wake()
+        return enqueued
+
+    def pending_count(self) -> int:
+        with self.__lock:
+            return self.__conn.execute(
+                "SELECT COUNT(*) FROM deliveries WHERE delivered_at IS NULL AND failed_at IS NULL"
+            ).fetchone()[0]
+
+    @contextmanager
+    def hold(self):
+        """在 with 块内暂不唤醒发送线程，让一轮轮询产生的通知一起发送（邮件摘要据此合并）"""
+        with self.__lock:
+            self.__holdCount += 1
+        try:
+            yield
+        finally:
+            with self.__lock:
+                self.__holdCount -= 1
+            self.__wake()
+
+    def start(self) -> None:
+        """启动发送线程，发送上次运行遗留的通知"""
+        self.__wake()
+
+    def __wake(self) -> None:
+        with self.__lock:
+            if self.__holdCount:
+                return
+            if self.__worker is None:
+                self.__worker = threading.Thread(target=self.__run, name="notification-outbox", daemon=True)
+                self.__worker.start()
+        self.__wakeEvent.set()
+
+    def __backoff(self, attempts: int) -> float:
+        return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX) * random.uniform(0.5, 1.0)
+
+    def drain_once(self) -> int:
+        """
+        发送所有到期的通知，并调用涉及到的 handle 的 flush
+
+        摘要模式的 send 只是暂存，flush 成功后才把对应记录标记为已送达；flush 失败时这些记录按退避重试。
+
+        Returns:
+            本次成功送达的通知数
+        """
+        now = time.time()
+        with self.__lock:
+            rows = self.__conn.execute(
+                "SELECT id, handle_key, result, change_type, attempts FROM deliveries "
+                "WHERE delivered_at IS NULL AND failed_at IS NULL AND next_attempt_at <= ? "
+                "ORDER BY id LIMIT ?",
+                (now, DRAIN_BATCH_SIZE),
+            ).fetchall()
+            handles = dict(self.__handles)
+
+        # 渠道已不在配置中（重启后未登记）的记录推迟检查，不计入发送次数
+        unknown = [row["id"] for row in rows if row["handle_key"] not in handles]
+        if unknown:
+            with self.__lock:
+                self.__conn.executemany(
+                    "UPDATE deliveries SET next_attempt_at = ? WHERE id = ?",
+                    [(now + UNKNOWN_HANDLE_RECHECK, row_id) for row_id in unknown],
+                )
+        rows = [row for row in rows if row["handle_key"] in handles]
+        if not rows:
+            return 0
+
+        dispatcher = self.__dispatcher or get_default_dispatcher()
+        jobs = [(handles[row["handle_key"]], json.loads(row["result"]), row["change_type"]) for row in rows]
+        results = dispatcher.dispatch_jobs(jobs)
+
+        # 先 flush 再标记：flush 失败的 handle，其 send 成功的记录同样视为未送达
+        flushErrors = {}
+        for handle in {id(job[0]): job[0] for job in jobs}.values():
+            try:
+                handle.flush(requeue=False)
+            except Exception as e:
+                log_with_timestamp(f"Failed to flush {handle.name} notifications: {e}", logging.WARNING)
+                flushErrors[handle.key] = f"flush failed: {type(e).__name__}: {e}"
+
+        delivered = 0
+        now = time.time()
+        with self.__transaction() as conn:
+            for row, outcome in zip(rows, results):
+                attempts = row["attempts"] + 1
+                if outcome.success and row["handle_key"] in flushErrors:
+                    outcome = NotificationResult(outcome.channel, False, outcome.latency, flushErrors[row["handle_key"]])
+                if outcome.success:
+                    delivered += 1
+                    conn.execute(
+                        "UPDATE deliveries SET attempts = ?, delivered_at = ?, last_error = NULL WHERE id = ?",
+                        (attempts, now, row["id"]),
+                    )
+                elif attempts >= self.__maxAttempts:
+                    log_with_timestamp(
+                        f"Giving up {outcome.channel} notification #{row['id']} after {attempts} attempts: {outcome.error}",
+                        logging.ERROR,
+                    )
+                    conn.execute(
+                        "UPDATE deliveries SET attempts = ?, failed_at = ?, last_error = ? WHERE id = ?",
+                        (attempts, now, outcome.error, row["id"]),
+                    )
+                else:
+                    delay = self.__backoff(attempts)
+                    log_with_timestamp(
+                        f"Retrying {outcome.channel} notification #{row['id']} in {delay:.0f}s", sample=f"outbox_retry:{outcome.channel}"
+                    )
+                    conn.execute(
+                        "UPDATE deliveries SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                        (attempts, now + delay, outcome.error, row["id"]),
+                    )
+        return delivered
+
+    def __next_due(self) -> float:
+        """距离下一条待发送通知到期的秒数，没有待发送通知时返回 None"""
+        with self.__lock:
+            row = self.__conn.execute(
+                "SELECT MIN(next_attempt_at) FROM deliveries WHERE delivered_at IS NULL AND failed_at IS NULL"
+            ).fetchone()
+        return None if row[0] is None else max(row[0] - time.time(), 0)
+
+    def __run(self) -> None:
+        while not self.__stopEvent.is_set():
+            self.__wakeEvent.clear()
+            try:
+                self.drain_once()
+            except Exception as e:
+                log_with_timestamp(f"Notification outbox drain failed: {e}", logging.ERROR)
+            wait = self.__next_due()
+            self.__wakeEvent.wait(min(wait, 60) if wait is not None else 60)
+
+    def close(self, timeout: float = None) -> None:
+        """
+        停止发送线程，退出前把已到期的通知尽量发送一遍；未送达的通知留在数据库中，下次启动继续发送
+
+        Args:
+            timeout: 等待发送线程结束的最长秒数
+        """
+        self.__stopEvent.set()
+        self.__wakeEvent.set()
+        if self.__worker is not None:
+            self.__worker.join(timeout)
+        try:
+            self.drain_once()
+        except Exception as e:
+            log_with_timestamp(f"Notification outbox drain failed: {e}", logging.ERROR)
+        remaining = self.pending_count()
+        if remaining:
+            log_with_timestamp(f"{remaining} notification(s) left in outbox {self.__path}, will retry on next start")
+
+
+_default_outbox = None
+_default_outbox_lock = threading.Lock()
+
+
+def get_default_outbox() -> NotificationOutbox:
+    """
+    进程内默认共享的 NotificationOutbox
+
+    环境变量 NOTIFY_OUTBOX_DB 设为空字符串时禁用发件箱，返回 None（直接同步发送）。
+    """
+    global _default_outbox
+    if os.getenv("NOTIFY_OUTBOX_DB", DEFAULT_OUTBOX_DB) == "":
+        return None
+    with _default_outbox_lock:
+        if _default_outbox is None:
+            _default_outbox = NotificationOutbox()
+            PENDING.set_function(_default_outbox.pending_count)
+        return _default_outbox
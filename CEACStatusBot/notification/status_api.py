@@ -0,0 +1,234 @@
+import gzip
+import logging
+import json
+import threading
+from urllib.parse import urlsplit
+
+import requests
+
+from CEACStatusBot.utils import get_default_registry, log_with_timestamp
+
+__all__ = ["StatusApiClient", "get_status_api_client"]
+
+DEFAULT_TIMEOUT = 10
+# 状态服务不可用时的变更类型：无法判断是否变化，不能按变更通知，查询结果留在发件箱中等待重新提交
+CHANGE_UNKNOWN = "unknown"
+# 超过该字节数的请求体使用 gzip 压缩
+GZIP_MIN_SIZE = 1024
+
+_metrics = get_default_registry()
+REQUEST_SECONDS = _metrics.histogram(
+    "status_api_request_seconds", "ceac-status-server request latency", ["method", "endpoint", "status"]
+)
+
+
+def _record_response(response: requests.Response, *_args, **_kwargs) -> None:
+    REQUEST_SECONDS.observe(
+        response.elapsed.total_seconds(),
+        method=response.request.method,
+        endpoint=urlsplit(response.url).path or "/",
+        status=response.status_code,
+    )
+
+
+def detect_change(previous: dict, status: str, case_last_updated: str) -> str:
+    """
+    比较新旧状态，返回变更类型："status"、"case_updated" 或 None
+    与 ceac-status-server 的 /observe 使用相同的规则
+    """
+    if not previous:
+        return "status"
+    if status != previous["status"]:
+        return "status"
+    if case_last_updated != previous.get("case_last_updated", ""):
+        return "case_updated"
+    return None
+
+
+class StatusApiClient:
+    def __init__(self, base_url: str, timeout: float = DEFAULT_TIMEOUT) -> None:
+        """
+        ceac-status-server 客户端，所有请求复用同一个 keep-alive session
+
+        Args:
+            base_url: 状态服务地址
+            timeout: 请求超时（秒）
+        """
+        self.__base_url = base_url.rstrip("/")
+        self.__timeout = timeout
+        self.__session = requests.Session()
+        self.__session.hooks["response"].append(_record_response)
+        # 旧版服务端没有 /observe 接口时退回 GET + POST
+        self.__observe_supported = True
+        self.__batch_supported = True
+
+    @property
+    def base_url(self) -> str:
+        return self.__base_url
+
+    def get_last_status(self, case_id: str = None) -> dict:
+        """从 API 获取上一次的状态，失败时返回 None"""
+        try:
+            return self.__get_last_status(case_id)
+        except Exception as e:
+            log_with_timestamp(f"Error getting status from API: {e}", logging.WARNING)
+            return None
+
+    def __get_last_status(self, case_id: str = None) -> dict:
+        params = {"case_id": case_id} if case_id else None
+        response = self.__session.get(f"{self.__base_url}/status", params=params, timeout=self.__timeout)
+        response.raise_for_status()
+        result = response.json()
+        if not result.get("success"):
+            raise RuntimeError(f"Failed to get status from API: {result.get('error', 'Unknown error')}")
+        return result.get("data")
+
+    def supports_case_ids(self) -> bool:
+        """
+        检查服务端是否按 case_id 分别保存状态
+
+        旧版服务端忽略 case_id，所有案件共用一条记录；按案件存储的服务端同时提供 /status/history，
+        这里用只读的 GET /status/history 探测。
+
+        Returns:
+            True / False；请求失败、无法判断时返回 None
+        """
+        try:
+            response = self.__session.get(
+                f"{self.__base_url}/status/history", params={"limit": 1}, timeout=self.__timeout
+            )
+            if response.status_code == 404:
+                return False
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            log_with_timestamp(f"Error checking status API capabilities: {e}", logging.WARNING)
+            return None
+
+    def save_status(self, status: str, case_last_updated: str, case_id: str = None) -> None:
+        """保存当前状态到 API"""
+        try:
+            self.__save_status(status, case_last_updated, case_id)
+        except Exception as e:
+            log_with_timestamp(f"Error saving status to API: {e}", logging.WARNING)
+
+    def __save_status(self, status: str, case_last_updated: str, case_id: str = None) -> None:
+        payload = {
+            "status": status,
+            "case_last_updated": case_last_updated
+        }
+        if case_id:
+            payload["case_id"] = case_id
+        response = self.__session.post(f"{self.__base_url}/status", json=payload, timeout=self.__timeout)
+        response.raise_for_status()
+        result = response.json()
+        if not result.get("success"):
+            raise RuntimeError(f"Failed to save status to API: {result.get('error', 'Unknown error')}")
+
+    def observe(self, status: str, case_last_updated: str, case_id: str = None, observation_id: str = None) -> str:
+        """
+        提交本次查询结果，由服务端原子地比较并保存
+
+        Args:
+            observation_id: 本次查询结果的唯一 id，重试提交时服务端返回第一次的变更类型
+
+        Returns:
+            变更类型 "status" / "case_updated" / None；请求失败时返回 CHANGE_UNKNOWN
+        """
+        if not self.__observe_supported:
+            return self.__observe_legacy(status, case_last_updated, case_id)
+
+        payload = {
+            "status": status,
+            "case_last_updated": case_last_updated
+        }
+        if case_id:
+            payload["case_id"] = case_id
+        if observation_id:
+            payload["observation_id"] = observation_id
+        try:
+            response = self.__session.post(f"{self.__base_url}/observe", json=payload, timeout=self.__timeout)
+            if response.status_code == 404:
+                log_with_timestamp("Status API does not support /observe, falling back to GET + POST /status")
+                self.__observe_supported = False
+                return self.__observe_legacy(status, case_last_updated, case_id)
+            response.raise_for_status()
+            result = response.json()
+            if result.get("success"):
+                return result.get("change_type")
+            log_with_timestamp(f"Failed to observe status via API: {result.get('error', 'Unknown error')}", logging.WARNING)
+        except Exception as e:
+            log_with_timestamp(f"Error observing status via API: {e}", logging.WARNING)
+        return CHANGE_UNKNOWN
+
+    def __post_json(self, path: str, payload, headers: dict = None) -> requests.Response:
+        """发送 JSON 请求，请求体较大时使用 gzip 压缩"""
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", **(headers or {})}
+        if len(body) >= GZIP_MIN_SIZE:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        return self.__session.post(f"{self.__base_url}{path}", data=body, headers=headers, timeout=self.__timeout)
+
+    def observe_many(self, observations: list) -> list:
+        """
+        一次请求提交多个案件的查询结果，由服务端在一个事务内比较并保存
+
+        Args:
+            observations: [(case_id, status, case_last_updated, observation_id), ...]，observation_id 可以为 None
+
+        Returns:
+            与 observations 一一对应的变更类型列表；请求失败时均为 CHANGE_UNKNOWN
+        """
+        if not observations:
+            return []
+        if not self.__batch_supported:
+            return [
+                self.observe(status, updated, case_id, observation_id)
+                for case_id, status, updated, observation_id in observations
+            ]
+
+        payload = {
+            "observations": [
+                {"case_id": case_id, "status": status, "case_last_updated": updated, "observation_id": observation_id}
+                for case_id, status, updated, observation_id in observations
+            ]
+        }
+        try:
+            response = self.__post_json("/observe/batch", payload)
+            if response.status_code == 404:
+                log_with_timestamp("Status API does not support /observe/batch, falling back to per-case requests")
+                self.__batch_supported = False
+                return self.observe_many(observations)
+            response.raise_for_status()
+            result = response.json()
+            if result.get("success"):
+                return [item.get("change_type") for item in result.get("results", [])]
+            log_with_timestamp(f"Failed to observe statuses via API: {result.get('error', 'Unknown error')}", logging.WARNING)
+        except Exception as e:
+            log_with_timestamp(f"Error observing statuses via API: {e}", logging.WARNING)
+        return [CHANGE_UNKNOWN] * len(observations)
+
+    def __observe_legacy(self, status: str, case_last_updated: str, case_id: str = None) -> str:
+        try:
+            change_type = detect_change(self.__get_last_status(case_id), status, case_last_updated)
+            if change_type:
+                self.__save_status(status, case_last_updated, case_id)
+            return change_type
+        except Exception as e:
+            log_with_timestamp(f"Error observing status via API: {e}", logging.WARNING)
+            return CHANGE_UNKNOWN
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_status_api_client(base_url: str) -> StatusApiClient:
+    """按地址返回进程内共享的 StatusApiClient"""
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = StatusApiClient(base_url)
+            _clients[base_url] = client
+        return client
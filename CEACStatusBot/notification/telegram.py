@@ -1,16 +1,195 @@
 import requests
 import json
 import html
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from CEACStatusBot.utils import TokenBucket, log_with_timestamp
+from .handle import NotificationHandle, send_timeout
+
+SEND_TIMEOUT = 10
+# 等待队列中的消息发送完成的最长秒数（包括限速和 429 重试的等待）
+RESULT_TIMEOUT = 120
+# Telegram 单条消息的最大长度
+MAX_MESSAGE_LENGTH = 4096
+# Bot 全局每秒最多约 30 条，单个聊天每秒最多 1 条
+DEFAULT_GLOBAL_RATE = 25
+DEFAULT_CHAT_RATE = 1
+# 一条消息被 429 限流的最大重试次数
+MAX_RETRY_AFTER = 5
+
+
+class TelegramSender:
+    def __init__(self, bot_token: str, globalRate: float = None, chatRate: float = None) -> None:
+        """
+        单个 Bot 的消息发送队列
+
+        所有消息由一个后台线程通过 keep-alive session 发送：
+        - 按 Bot 全局和每个聊天各自的令牌桶限速
+        - 收到 429 时按 retry_after 暂停该聊天，消息留在队首稍后重试
+        - 队列积压时，同一个聊天的多条消息合并为一条发送（不超过 4096 字符）
+
+        Args:
+            bot_token: Bot Token
+            globalRate: 全局每秒消息数，默认读取环境变量 TG_GLOBAL_RATE（默认 25）
+            chatRate: 每个聊天每秒消息数，默认读取环境变量 TG_CHAT_RATE（默认 1）
+        """
+        self.__api_url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+        self.__session = requests.Session()
+        self.__chatRate = chatRate or float(os.getenv("TG_CHAT_RATE", DEFAULT_CHAT_RATE))
+        self.__globalBucket = TokenBucket(globalRate or float(os.getenv("TG_GLOBAL_RATE", DEFAULT_GLOBAL_RATE)))
+        # chat_id -> deque[(text, future, retries)]
+        self.__queues = {}
+        self.__chatBuckets = {}
+        # chat_id -> 429 之后可以再次发送的时间（monotonic）
+        self.__blockedUntil = {}
+        self.__cond = threading.Condition()
+        self.__worker = None
+        self.__workerLock = threading.Lock()
+
+    def __ensure_worker(self) -> None:
+        if self.__worker is not None and self.__worker.is_alive():
+            return
+        with self.__workerLock:
+            if self.__worker is None or not self.__worker.is_alive():
+                self.__worker = threading.Thread(target=self.__run, name="telegram-sender", daemon=True)
+                self.__worker.start()
+
+    def submit(self, chat_id: str, text: str) -> Future:
+        """
+        把消息放入队列，返回在消息发送完成（或失败）时结束的 Future
+
+        开始发送之前取消 Future（如等待超时）时，消息不会再发送。
+        """
+        self.__ensure_worker()
+        future = Future()
+        with self.__cond:
+            self.__queues.setdefault(chat_id, deque()).append((text, future, 0))
+            if chat_id not in self.__chatBuckets:
+                self.__chatBuckets[chat_id] = TokenBucket(self.__chatRate)
+            self.__cond.notify()
+        return future
+
+    def __next_chat(self):
+        """选出一个可以发送的聊天；都不能发送时返回 (None, 需要等待的秒数)"""
+        now = time.monotonic()
+        wait = None
+        for chat_id, queue in self.__queues.items():
+            if not queue:
+                continue
+            delay = max(self.__blockedUntil.get(chat_id, 0) - now, self.__chatBuckets[chat_id].delay())
+            if delay <= 0:
+                return chat_id, 0
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def __take(self, chat_id: str) -> list:
+        """取出队首的消息，积压时尽量合并同一聊天的多条消息；跳过已取消的消息"""
+        queue = self.__queues[chat_id]
+        batch = []
+        length = -2
+        while queue and (not batch or length + 2 + len(queue[0][0]) <= MAX_MESSAGE_LENGTH):
+            item = queue.popleft()
+            # 429 重试时消息已经是运行状态
+            if item[2] == 0 and not item[1].set_running_or_notify_cancel():
+                continue
+            length += 2 + len(item[0])
+            batch.append(item)
+        return batch
+
+    def __run(self) -> None:
+        while True:
+            batch = []
+            try:
+                with self.__cond:
+                    chat_id, wait = self.__next_chat()
+                    if chat_id is None:
+                        self.__cond.wait(wait)
+                        continue
+                    globalWait = self.__globalBucket.try_acquire()
+                    if globalWait:
+                        self.__cond.wait(globalWait)
+                        continue
+                    batch = self.__take(chat_id)
+                    if not batch:
+                        continue
+                    self.__chatBuckets[chat_id].try_acquire()
+                self.__deliver(chat_id, batch)
+            except Exception as e:
+                # 只让当前这批消息失败，发送线程继续处理其他消息
+                log_with_timestamp(f"Telegram sender error: {e}", logging.ERROR)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def __deliver(self, chat_id: str, batch: list) -> None:
+        text = "\n\n".join(item[0] for item in batch)
+        if len(batch) > 1:
+            log_with_timestamp(f"Merged {len(batch)} queued Telegram messages for chat {chat_id}")
+        try:
+            response = self.__session.post(self.__api_url, data={
+                "chat_id": chat_id,
+                "text": text,
+                "parse_mode": "HTML"
+            }, timeout=SEND_TIMEOUT)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.json().get("parameters", {}).get("retry_after", 1))
+            except ValueError:
+                retry_after = 1.0
+            retry = [(text, future, retries + 1) for text, future, retries in batch if retries + 1 < MAX_RETRY_AFTER]
+            for _, future, retries in batch:
+                if retries + 1 >= MAX_RETRY_AFTER:
+                    future.set_exception(RuntimeError(f"Telegram rate limited too many times: {response.text}"))
+            log_with_timestamp(f"Telegram rate limited for chat {chat_id}, retrying after {retry_after:g}s")
+            with self.__cond:
+                self.__blockedUntil[chat_id] = time.monotonic() + retry_after
+                self.__queues[chat_id].extendleft(reversed(retry))
+                self.__cond.notify()
+            return
+
+        # Check the response
+        for _, future, _ in batch:
+            if response.status_code == 200:
+                future.set_result(len(batch))
+            else:
+                future.set_exception(RuntimeError(f"Failed to send Telegram message: {response.text}"))
+
+
+_senders = {}
+_senders_lock = threading.Lock()
+
+
+def get_telegram_sender(bot_token: str) -> TelegramSender:
+    """同一个 Bot 在进程内共享一个发送队列，限速才能覆盖所有案件"""
+    with _senders_lock:
+        sender = _senders.get(bot_token)
+        if sender is None:
+            sender = TelegramSender(bot_token)
+            _senders[bot_token] = sender
+        return sender
 
-from CEACStatusBot.utils import log_with_timestamp
-from .handle import NotificationHandle
 
 class TelegramNotificationHandle(NotificationHandle):
+    name = "telegram"
+
     def __init__(self, bot_token: str, chat_id: str) -> None:
         super().__init__()
-        self.__bot_token = bot_token
         self.__chat_id = chat_id
-        self.__api_url = f"https://api.telegram.org/bot{self.__bot_token}/sendMessage"
+        self.__sender = get_telegram_sender(bot_token)
+
+    @property
+    def key(self) -> str:
+        return f"telegram:{self.__chat_id}"
 
     def send(self, result, change_type="status"):
         # {'success': True, 'visa_type': 'NONIMMIGRANT VISA APPLICATION', 'status': 'Issued', 'case_created': '30-Aug-2022', 'case_last_updated': '19-Oct-2022', 'description': 'Your visa is in final processing. If you have not received it in more than 10 working days, please see the webpage for contact information of the embassy or consulate where you submitted your application.', 'application_num': '***'}
@@ -21,21 +200,18 @@ class TelegramNotificationHandle(NotificationHandle):
         else:
             # status 变更（包括同时变更的情况），强调状态变更
             message_title = f'🇺🇸 美签状态更新: {result["status"]}'
-        
+
         message_content = html.escape(json.dumps(result, indent=2))
 
         # Construct the message text with the title in bold
         message_text = f"<b>{message_title}</b>\n\n<pre>{message_content}</pre>"
 
-        # Send the message using the Telegram Bot API
-        response = requests.post(self.__api_url, data={
-            "chat_id": self.__chat_id,
-            "text": message_text,
-            "parse_mode": "HTML"
-        })
-
-        # Check the response
-        if response.status_code == 200:
-            log_with_timestamp("Telegram message sent successfully")
-        else:
-            log_with_timestamp(f"Failed to send Telegram message: {response.text}")
\ No newline at end of file
+        # Send the message through the shared, rate-limited queue
+        future = self.__sender.submit(self.__chat_id, message_text)
+        try:
+            future.result(timeout=send_timeout(RESULT_TIMEOUT))
+        except TimeoutError:
+            # 还没开始发送的消息取消后不会再发出，避免发件箱重试时重复发送
+            future.cancel()
+            raise
+        log_with_timestamp("Telegram message sent successfully")
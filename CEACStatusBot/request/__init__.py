@@ -1 +1,20 @@
-from .query import *
\ No newline at end of file
+from CEACStatusBot.utils.lazy import lazy_exports
+
+# requests / lxml 只在第一次访问对应的名字时才导入
+_EXPORTS = {
+    "query_status": ".query",
+    "SessionPool": ".session",
+    "get_default_session_pool": ".session",
+    "parse_async_delta": ".extract",
+    "extract_form": ".extract",
+    "extract_async_form": ".extract",
+    "extract_status": ".extract",
+    "LocationIndex": ".location",
+    "get_default_location_index": ".location",
+    "CircuitOpenError": ".throttle",
+    "CeacThrottle": ".throttle",
+    "get_default_throttle": ".throttle",
+}
+
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
@@ -0,0 +1,155 @@
+from lxml import etree, html
+
+__all__ = ["parse_async_delta", "extract_form", "extract_async_form", "extract_status"]
+
+CAPTCHA_IMAGE_ID = "c_status_ctl00_contentplaceholder1_defaultcaptcha_CaptchaImage"
+CAPTCHA_VCID_FIELD = "LBD_VCID_c_status_ctl00_contentplaceholder1_defaultcaptcha"
+STATUS_VIEW_PREFIX = "ctl00_ContentPlaceHolder1_ucApplicationStatusView_"
+
+# 一次 XPath 取出表单需要的全部节点：隐藏字段、验证码图片、地点下拉选项
+_FORM_NODES = etree.XPath(
+    "//input[@type='hidden'] | //img[@id=$captcha_id] | //select[@id='Location_Dropdown']/option"
+)
+_FORM_NODES_WITHOUT_LOCATIONS = etree.XPath("//input[@type='hidden'] | //img[@id=$captcha_id]")
+_STATUS_SPANS = etree.XPath("//span[starts-with(@id, $prefix)]")
+
+# 状态页上的 span id 后缀 -> 结果字段
+STATUS_FIELDS = {
+    "lblCaseNo": "application_num",
+    "lblStatus": "status",
+    "lblAppName": "visa_type",
+    "lblSubmitDate": "case_created",
+    "lblStatusDate": "case_last_updated",
+    "lblMessage": "description",
+}
+
+
+def parse_async_delta(text: str) -> list:
+    """
+    解析 ASP.NET UpdatePanel 异步回发（__ASYNCPOST=true）的响应
+
+    响应由若干 "长度|类型|id|内容|" 片段拼接而成。长度是 .NET 字符串的长度（UTF-16 码元数），
+    与 Python 字符数只在内容含有 BMP 以外的字符（如 emoji）时不同。
+
+    Returns:
+        [(类型, id, 内容), ...]，不是合法的 delta 格式时返回空列表
+    """
+    entries = []
+    i = 0
+    try:
+        while i < len(text):
+            j = text.index("|", i)
+            length = int(text[i:j])
+            k = text.index("|", j + 1)
+            l = text.index("|", k + 1)
+            end = _utf16_end(text, l + 1, length)
+            if text[end:end + 1] != "|":
+                return []
+            entries.append((text[j + 1:k], text[k + 1:l], text[l + 1:end]))
+            i = end + 1
+    except ValueError:
+        return []
+    return entries
+
+
+def _utf16_end(text: str, start: int, length: int) -> int:
+    """从 start 开始数 length 个 UTF-16 码元，返回结束位置的字符下标"""
+    end = start + length
+    chunk = text[start:end]
+    if end > len(text) or chunk.isascii() or max(chunk, default="") <= "\uffff":
+        return end
+    # BMP 以外的字符占两个码元
+    units = 0
+    end = start
+    while units < length and end < len(text):
+        units += 2 if ord(text[end]) > 0xFFFF else 1
+        end += 1
+    if units != length:
+        raise ValueError("length splits a surrogate pair")
+    return end
+
+
+def _parse_fragment(content: str):
+    return html.fragment_fromstring(content, create_parent="div")
+
+
+def _collect_form(root, with_locations: bool) -> dict:
+    xpath = _FORM_NODES if with_locations else _FORM_NODES_WITHOUT_LOCATIONS
+    form = {"image_src": None, "fields": {}, "locations": []}
+    for node in xpath(root, captcha_id=CAPTCHA_IMAGE_ID):
+        if node.tag == "input":
+            name = node.get("name")
+            if name:
+                form["fields"][name] = node.get("value", "")
+        elif node.tag == "img":
+            form["image_src"] = node.get("src")
+        else:
+            form["locations"].append((node.get("value", ""), node.text_content().strip()))
+    return form
+
+
+def extract_form(page: str, with_locations: bool = True) -> dict:
+    """
+    从 status.aspx 页面中一次性提取提交表单所需的内容
+
+    Args:
+        page: 页面 HTML
+        with_locations: 是否提取地点下拉选项，地点索引已缓存时可以跳过
+
+    Returns:
+        {"image_src": 验证码图片相对地址, "fields": {隐藏字段名: 值}, "locations": [(选项值, 选项文本), ...]}
+    """
+    return _collect_form(html.document_fromstring(page), with_locations)
+
+
+def extract_async_form(response_text: str) -> dict:
+    """
+    从异步回发响应中提取更新后的表单状态（用于验证码错误后的重试）
+
+    Returns:
+        {"image_src": 新验证码地址或 None, "fields": {字段名: 值}}；不是 delta 格式时返回 None
+    """
+    entries = parse_async_delta(response_text)
+    if not entries:
+        return None
+
+    form = {"image_src": None, "fields": {}}
+    for entry_type, entry_id, content in entries:
+        if entry_type == "hiddenField":
+            form["fields"][entry_id] = content
+        elif entry_type == "updatePanel" and content.strip():
+            panel = _collect_form(_parse_fragment(content), with_locations=False)
+            form["fields"].update(panel["fields"])
+            form["image_src"] = panel["image_src"] or form["image_src"]
+    return form
+
+
+def extract_status(response_text: str) -> dict:
+    """
+    从提交表单后的响应中提取状态信息
+
+    只解析 UpdatePanel 片段，并用一个 XPath 取出所有 ucApplicationStatusView 的 span。
+
+    Returns:
+        {"application_num", "status", "visa_type", "case_created", "case_last_updated", "description"}；
+        响应中没有状态信息（验证码错误等）时返回 None
+    """
+    if STATUS_VIEW_PREFIX + "lblStatus" not in response_text:
+        return None
+
+    entries = parse_async_delta(response_text)
+    panels = [content for entry_type, _, content in entries if entry_type == "updatePanel"]
+    if panels:
+        roots = (_parse_fragment(content) for content in panels if STATUS_VIEW_PREFIX + "lblStatus" in content)
+    else:
+        # 非异步回发（完整页面）的响应
+        roots = [html.document_fromstring(response_text)]
+    for root in roots:
+        result = {}
+        for span in _STATUS_SPANS(root, prefix=STATUS_VIEW_PREFIX):
+            field = STATUS_FIELDS.get(span.get("id")[len(STATUS_VIEW_PREFIX):])
+            if field:
+                result[field] = span.text_content()
+        if "status" in result:
+            return result
+    return None
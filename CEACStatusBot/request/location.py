@@ -0,0 +1,151 @@
+import difflib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from CEACStatusBot.utils import log_with_timestamp
+
+__all__ = ["LocationIndex", "get_default_location_index"]
+
+DEFAULT_CACHE_FILE = "location_index.json"
+DEFAULT_CACHE_TTL = 7 * 24 * 3600
+
+
+def normalize_location(text: str) -> str:
+    """统一大小写和空白，用于精确匹配"""
+    return re.sub(r"\s+", " ", text).strip().upper()
+
+
+class LocationIndex:
+    def __init__(self, cacheFile: str = None, ttl: float = None) -> None:
+        """
+        地点下拉框的索引：按三字母代码（见 LOCATION.md，即下拉选项的 value）或规范化后的名称精确查找
+
+        索引从 status.aspx 的下拉选项构建一次，并缓存到磁盘；缓存未过期时查询不需要解析下拉框。
+
+        Args:
+            cacheFile: 磁盘缓存路径，默认读取环境变量 LOCATION_CACHE_FILE（默认 location_index.json），空字符串表示不落盘
+            ttl: 缓存有效期（秒），默认读取环境变量 LOCATION_CACHE_TTL（默认 7 天）
+        """
+        self.__cacheFile = cacheFile if cacheFile is not None else os.getenv("LOCATION_CACHE_FILE", DEFAULT_CACHE_FILE)
+        self.__ttl = ttl if ttl is not None else float(os.getenv("LOCATION_CACHE_TTL", DEFAULT_CACHE_TTL))
+        self.__options = []
+        self.__byKey = {}
+        self.__builtAt = 0.0
+        # 规范化后的地点 -> 查找失败时索引的构建时间；索引重建后自动失效
+        self.__misses = {}
+        self.__lock = threading.Lock()
+        self.__load_cache()
+
+    def __build(self, options: list, builtAt: float) -> None:
+        byKey = {}
+        for value, text in options:
+            if not value:
+                continue
+            byKey[normalize_location(value)] = value
+            byKey[normalize_location(text)] = value
+        self.__options = [(value, text) for value, text in options if value]
+        self.__byKey = byKey
+        self.__builtAt = builtAt
+
+    def __load_cache(self) -> None:
+        if not self.__cacheFile or not os.path.exists(self.__cacheFile):
+            return
+        try:
+            with open(self.__cacheFile, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.__build([tuple(option) for option in data["options"]], data["built_at"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log_with_timestamp(f"Failed to load location cache {self.__cacheFile}: {e}")
+
+    def __save_cache(self) -> None:
+        if not self.__cacheFile:
+            return
+        tmp = f"{self.__cacheFile}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"built_at": self.__builtAt, "options": self.__options}, f, ensure_ascii=False)
+            os.replace(tmp, self.__cacheFile)
+        except OSError as e:
+            log_with_timestamp(f"Failed to save location cache {self.__cacheFile}: {e}")
+
+    @property
+    def fresh(self) -> bool:
+        """索引存在且未过期"""
+        return bool(self.__byKey) and time.time() - self.__builtAt < self.__ttl
+
+    def update(self, options: list) -> None:
+        """
+        用下拉选项重建索引并写入磁盘缓存
+
+        Args:
+            options: [(选项值, 选项文本), ...]
+        """
+        with self.__lock:
+            self.__build(options, time.time())
+            self.__save_cache()
+
+    def lookup(self, location: str) -> str:
+        """
+        查找地点对应的下拉选项值
+
+        先按代码或完整名称精确匹配；都不匹配时，仅当名称包含 location 的选项唯一时才返回，
+        有多个候选（例如 "CHINA"）时视为歧义。
+
+        Returns:
+            选项值，找不到或有歧义时返回 None
+        """
+        key = normalize_location(location)
+        value = self.__byKey.get(key)
+        if value is not None:
+            return value
+
+        candidates = self.__candidates(key)
+        if len(candidates) == 1:
+            return candidates[0][0]
+        return None
+
+    def __candidates(self, key: str) -> list:
+        """名称包含 key 的选项"""
+        return [(value, text) for value, text in self.__options if key in normalize_location(text)]
+
+    def missed(self, location: str) -> bool:
+        """该地点在当前索引中已经查找失败过：索引过期之前重建也找不到，不需要再解析下拉框"""
+        with self.__lock:
+            return self.__misses.get(normalize_location(location)) == self.__builtAt
+
+    def record_miss(self, location: str) -> None:
+        """记录查找失败，每个索引版本只输出一次错误日志，列出有歧义的候选或拼写相近的地点"""
+        key = normalize_location(location)
+        with self.__lock:
+            if self.__misses.get(key) == self.__builtAt:
+                return
+            self.__misses[key] = self.__builtAt
+            candidates = self.__candidates(key)
+            ambiguous = bool(candidates)
+            if not ambiguous:
+                byName = {normalize_location(text): (value, text) for value, text in self.__options}
+                candidates = [byName[name] for name in difflib.get_close_matches(key, list(byName), n=5)]
+        names = ", ".join(f"{text} ({value})" for value, text in candidates)
+        if ambiguous:
+            log_with_timestamp(f"地点 '{location}' 有多个匹配，请使用代码或完整名称: {names}", logging.ERROR)
+        elif candidates:
+            log_with_timestamp(f"下拉列表中没有地点 '{location}'，相近的地点: {names}", logging.ERROR)
+        else:
+            log_with_timestamp(f"下拉列表中没有地点 '{location}'，请参考 LOCATION.md 使用代码", logging.ERROR)
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_location_index() -> LocationIndex:
+    """进程内默认共享的 LocationIndex"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = LocationIndex()
+        return _default_index
@@ -1,65 +1,285 @@
+import logging
+import os
 import requests
-from bs4 import BeautifulSoup
 import time
+from urllib.parse import urlsplit
 
-from CEACStatusBot.captcha import CaptchaHandle, OnnxCaptchaHandle
-from CEACStatusBot.utils import log_with_timestamp
+from CEACStatusBot.captcha import CaptchaHandle, get_default_captcha_handle
+from CEACStatusBot.utils import get_default_registry, log_with_timestamp
 
-def query_status(location, application_num, passport_number, surname, captchaHandle: CaptchaHandle = OnnxCaptchaHandle("captcha.onnx")):
+from .extract import CAPTCHA_VCID_FIELD, extract_async_form, extract_form, extract_status
+from .location import LocationIndex, get_default_location_index
+from .session import get_default_session_pool
+from .throttle import CeacThrottle, CircuitOpenError, backoff_delay, get_default_throttle
+
+__all__ = ["query_status"]
+
+# 可以通过 CEAC_ROOT_URL 指向本地的模拟服务（见 benchmarks/mock_ceac.py）
+ROOT = os.getenv("CEAC_ROOT_URL", "https://ceac.state.gov").rstrip("/")
+
+# 提交表单时需要从页面（或异步回发的 hiddenField）中更新的字段
+FIELDS_NEED_UPDATE = [
+    "__VIEWSTATE",
+    "__VIEWSTATEGENERATOR",
+    CAPTCHA_VCID_FIELD,
+]
+
+# 置信度低于阈值时，单次尝试内最多重新获取验证码的次数
+MAX_CAPTCHA_REFETCH = 3
+MAX_ATTEMPTS = 5
+
+_metrics = get_default_registry()
+STAGE_SECONDS = _metrics.histogram(
+    "ceac_stage_seconds",
+    "Time spent in each step of a CEAC query (rate_limit, landing, captcha_image, captcha_solve, form_post, parse, backoff)",
+    ["stage"],
+)
+QUERY_SECONDS = _metrics.histogram("ceac_query_seconds", "End-to-end query_status latency", ["result"])
+CAPTCHA_ATTEMPTS = _metrics.counter("ceac_captcha_attempts_total", "Captcha answers submitted to CEAC")
+CAPTCHA_FAILURES = _metrics.counter("ceac_captcha_failures_total", "Submissions answered without a status (wrong captcha or form error)")
+CAPTCHA_REFETCHES = _metrics.counter("ceac_captcha_refetches_total", "Captcha images refetched because of low confidence")
+CAPTCHA_REJECTED = _metrics.counter(
+    "ceac_captcha_low_confidence_total", "Attempts skipped because every refetched captcha stayed below the confidence threshold"
+)
+RETRIES = _metrics.counter("ceac_retries_total", "query_status retries by reason (captcha, transport)", ["reason"])
+
+
+class _ThrottledSession:
+    """
+    在每个请求前向限速器申请令牌，并把结果报告给熔断器
+
+    网络错误和 5xx 响应计为失败；5xx 响应同时抛出 HTTPError，按网络错误重试；
+    其他异常只释放熔断器的探测名额。
+    """
+
+    def __init__(self, session, throttle: CeacThrottle) -> None:
+        self.__session = session
+        self.__throttle = throttle
+
+    def __request(self, method, *args, **kwargs):
+        with STAGE_SECONDS.time(stage="rate_limit"):
+            probe = self.__throttle.acquire()
+        try:
+            response = getattr(self.__session, method)(*args, **kwargs)
+        except requests.RequestException:
+            self.__throttle.record_failure()
+            raise
+        except BaseException:
+            # 其他异常不说明站点的状态，但必须释放半开状态下的探测名额
+            if probe:
+                self.__throttle.release_probe()
+            raise
+        if response.status_code >= 500:
+            self.__throttle.record_failure()
+            raise requests.HTTPError(f"{response.status_code} Server Error from {response.url}", response=response)
+        self.__throttle.record_success()
+        return response
+
+    def get(self, *args, **kwargs):
+        return self.__request("get", *args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        return self.__request("post", *args, **kwargs)
+
+
+def _load_form(session, headers, location, locationIndex):
+    """
+    完整加载 status.aspx，解析出提交表单所需的状态
+
+    地点索引未过期时不解析下拉框；索引过期、或该地点在当前索引中第一次查找失败时，从下拉框重建索引。
+    重建后仍找不到的地点在索引过期之前不再触发重建。
+
+    Returns:
+        {"image_url": 验证码图片地址, "fields": 需要回传的隐藏字段, "location_value": 地点下拉值}；
+        未找到地点时 location_value 为 None
+    """
+    with STAGE_SECONDS.time(stage="landing"):
+        r = session.get(url=f"{ROOT}/ceacstattracker/status.aspx?App=NIV", headers=headers)
+
+    fresh = locationIndex.fresh
+    location_value = locationIndex.lookup(location) if fresh else None
+    rebuild = not fresh or (location_value is None and not locationIndex.missed(location))
+    with STAGE_SECONDS.time(stage="parse"):
+        page = extract_form(r.text, with_locations=rebuild)
+    if rebuild:
+        locationIndex.update(page["locations"])
+        location_value = locationIndex.lookup(location)
+    if location_value is None:
+        locationIndex.record_miss(location)
+
+    fields = {field: page["fields"][field] for field in FIELDS_NEED_UPDATE if field in page["fields"]}
+    return {"image_url": ROOT + page["image_src"], "fields": fields, "location_value": location_value}
+
+
+def _refresh_form(form, response_text):
+    """
+    验证码错误后，根据异步回发的响应更新表单状态，避免重新加载整个 status.aspx
+
+    响应中的 hiddenField 片段带有新的 __VIEWSTATE 等字段；UpdatePanel 片段里如果重新渲染了验证码，
+    使用新的图片地址和 VCID，否则对同一个 VCID 重新获取一张验证码图片。
+
+    Returns:
+        更新后的表单状态；响应不是预期的 delta 格式时返回 None，由调用方重新加载页面
+    """
+    with STAGE_SECONDS.time(stage="parse"):
+        update = extract_async_form(response_text)
+    if update is None:
+        return None
+
+    fields = dict(form["fields"])
+    fields.update({field: update["fields"][field] for field in FIELDS_NEED_UPDATE if field in update["fields"]})
+    if update["image_src"]:
+        image_url = ROOT + update["image_src"]
+    else:
+        image_url = _reload_captcha_url(form["image_url"])
+
+    return {"image_url": image_url, "fields": fields, "location_value": form["location_value"]}
+
+
+def _reload_captcha_url(image_url):
+    """BotDetect 对同一个 VCID 的图片请求加上时间戳即可重新生成验证码"""
+    base_url = image_url.split("&d=")[0]
+    separator = "&" if "?" in base_url else "?"
+    return f"{base_url}{separator}d={time.time_ns()}"
+
+
+def _solve_captcha(session, headers, form, captchaHandle, minConfidence):
+    """
+    获取并识别验证码；置信度低于 minConfidence 时重新获取验证码，而不是提交一个大概率错误的答案
+
+    Returns:
+        (识别结果, 置信度)；重新获取 MAX_CAPTCHA_REFETCH 次后置信度仍然过低时识别结果为 None，调用方不应提交
+    """
+    def fetch_and_solve():
+        with STAGE_SECONDS.time(stage="captcha_image"):
+            img_resp = session.get(form["image_url"], headers=headers)
+        with STAGE_SECONDS.time(stage="captcha_solve"):
+            return captchaHandle.solve_with_confidence(img_resp.content)
+
+    captcha_num, confidence = fetch_and_solve()
+    refetchCount = 0
+    while confidence < minConfidence and refetchCount < MAX_CAPTCHA_REFETCH:
+        refetchCount += 1
+        CAPTCHA_REFETCHES.inc()
+        log_with_timestamp(
+            f"Captcha confidence too low ({captcha_num}, {confidence:.3f} < {minConfidence}), refetching",
+            sample="captcha_refetch",
+        )
+        form["image_url"] = _reload_captcha_url(form["image_url"])
+        captcha_num, confidence = fetch_and_solve()
+    if confidence < minConfidence:
+        return None, confidence
+    return captcha_num, confidence
+
+
+def query_status(location, application_num, passport_number, surname, captchaHandle: CaptchaHandle = None, session: requests.Session = None, minCaptchaConfidence: float = None, locationIndex: LocationIndex = None, throttle: CeacThrottle = None):
+    """
+    查询签证状态
+
+    第一次尝试会完整加载 status.aspx；验证码错误后的重试只重新获取验证码图片并沿用已解析的表单状态，
+    网络错误或响应无法解析时才重新加载页面。
+
+    所有请求经过共享的限速器；重试之间按失败类型退避：验证码错误等待较短，网络错误和 5xx 按指数退避等待更久。
+    站点连续出错触发熔断时直接返回失败，不再消耗重试次数。
+
+    Args:
+        captchaHandle: 验证码识别 handle，默认使用进程内共享的 OnnxCaptchaHandle("captcha.onnx")
+        session: 发送请求使用的 session，默认从共享连接池创建；重试之间复用同一个 session 的连接和 cookie
+        minCaptchaConfidence: 验证码置信度阈值，低于该值时重新获取验证码而不提交，
+            默认读取环境变量 CAPTCHA_MIN_CONFIDENCE（默认 0，即不检查）
+        locationIndex: 地点索引，location 可以是 LOCATION.md 中的代码或完整名称，默认使用进程内共享的索引
+        throttle: 限速器和熔断器，默认使用进程内共享的 CeacThrottle
+    """
+    queryStart = time.perf_counter()
     isSuccess = False
     failCount = 0
+    captchaFailures = 0
+    transportFailures = 0
+    error = None
 
-    while not isSuccess and failCount < 5:
-        failCount += 1
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/105.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9",
-            "Accept-Encoding": "gzip, deflate, br",
-            "Accept-Language": "en,zh-CN;q=0.9,zh;q=0.8",
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Host": "ceac.state.gov",
-        }
+    if minCaptchaConfidence is None:
+        minCaptchaConfidence = float(os.getenv("CAPTCHA_MIN_CONFIDENCE", "0"))
 
-        session = requests.Session()
-        ROOT = "https://ceac.state.gov"
+    if captchaHandle is None:
+        captchaHandle = get_default_captcha_handle()
+    if session is None:
+        session = get_default_session_pool().new_session()
+    if locationIndex is None:
+        locationIndex = get_default_location_index()
+    if throttle is None:
+        throttle = get_default_throttle()
+    session = _ThrottledSession(session, throttle)
 
-        try:
-            r = session.get(url=f"{ROOT}/ceacstattracker/status.aspx?App=NIV", headers=headers)
-        except Exception as e:
-            log_with_timestamp(str(e))
-            isSuccess = False
-            continue
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/105.0.0.0 Safari/537.36",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Accept-Language": "en,zh-CN;q=0.9,zh;q=0.8",
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "Host": urlsplit(ROOT).netloc,
+    }
 
-        soup = BeautifulSoup(r.text, features="lxml")
+    def backoff(captcha: bool) -> None:
+        # 已经熔断时不必等待，下一次请求会直接失败
+        if failCount >= MAX_ATTEMPTS or throttle.retry_after():
+            return
+        RETRIES.inc(reason="captcha" if captcha else "transport")
+        delay = backoff_delay(captchaFailures if captcha else transportFailures, captcha)
+        log_with_timestamp(f"Retrying in {delay:.1f}s", sample="retry")
+        with STAGE_SECONDS.time(stage="backoff"):
+            time.sleep(delay)
 
-        # Find captcha image
-        captcha = soup.find(name="img", id="c_status_ctl00_contentplaceholder1_defaultcaptcha_CaptchaImage")
-        image_url = ROOT + captcha["src"]
-        img_resp = session.get(image_url)
+    form = None
+    while not isSuccess and failCount < MAX_ATTEMPTS:
+        failCount += 1
 
-        # Resolve captcha
-        captcha_num = captchaHandle.solve(img_resp.content)
-        log_with_timestamp(f"Captcha solved: {captcha_num}")
-
-        # Find the correct value for the location dropdown
-        location_dropdown = soup.find("select", id="Location_Dropdown")
-        location_value = None
-        for option in location_dropdown.find_all("option"):
-            if location in option.text:
-                location_value = option["value"]
+        if form is None:
+            try:
+                form = _load_form(session, headers, location, locationIndex)
+            except CircuitOpenError as e:
+                error = str(e)
                 break
+            except Exception as e:
+                log_with_timestamp(f"Failed to load CEAC form: {e}", logging.WARNING, sample="transport_error")
+                isSuccess = False
+                transportFailures += 1
+                backoff(captcha=False)
+                continue
 
-        if not location_value:
-            log_with_timestamp(f"查询失败：在下拉列表中未找到地点 '{location}'")
-            return {"success": False}
+            if not form["location_value"]:
+                log_with_timestamp(f"查询失败：在下拉列表中未找到地点 '{location}'", logging.ERROR, sample="location_not_found")
+                QUERY_SECONDS.observe(time.perf_counter() - queryStart, result="failure")
+                return {"success": False}
 
-        # Fill form
-        def update_from_current_page(cur_page, name, data):
-            ele = cur_page.find(name="input", attrs={"name": name})
-            if ele:
-                data[name] = ele["value"]
+        # Resolve captcha
+        try:
+            captcha_num, confidence = _solve_captcha(session, headers, form, captchaHandle, minCaptchaConfidence)
+        except CircuitOpenError as e:
+            error = str(e)
+            break
+        except Exception as e:
+            log_with_timestamp(f"Failed to fetch captcha: {e}", logging.WARNING, sample="transport_error")
+            form = None
+            isSuccess = False
+            transportFailures += 1
+            backoff(captcha=False)
+            continue
+        if captcha_num is None:
+            # 低置信度的答案不提交，按验证码错误退避后换一张验证码重试
+            log_with_timestamp(
+                f"Captcha confidence still too low after {MAX_CAPTCHA_REFETCH} refetches ({confidence:.3f}), skipping submission",
+                sample="captcha_low_confidence",
+            )
+            CAPTCHA_REJECTED.inc()
+            form["image_url"] = _reload_captcha_url(form["image_url"])
+            isSuccess = False
+            captchaFailures += 1
+            backoff(captcha=True)
+            continue
+        log_with_timestamp(f"Captcha solved: {captcha_num} (confidence {confidence:.3f})", logging.DEBUG)
 
+        # Fill form
         data = {
             "ctl00$ToolkitScriptManager1": "ctl00$ContentPlaceHolder1$UpdatePanel1|ctl00$ContentPlaceHolder1$btnSubmit",
             "ctl00_ToolkitScriptManager1_HiddenField": ";;AjaxControlToolkit, Version=4.1.40412.0, Culture=neutral, PublicKeyToken=28f01b0e84b6d53e:en-US:acfc7575-cdee-46af-964f-5d85d9cdcf92:de1feab2:f9cec9bc:a67c2700:f2c8e708:8613aea7:3202a5a2:ab09e3fe:87104b7c:be6fb298",
@@ -70,55 +290,58 @@ def query_status(location, application_num, passport_number, surname, captchaHan
             "__VIEWSTATEGENERATOR": "DBF1011F",
             "__VIEWSTATEENCRYPTED": "",
             "ctl00$ContentPlaceHolder1$Visa_Application_Type": "NIV",
-            "ctl00$ContentPlaceHolder1$Location_Dropdown": location_value,  # Use the correct value
+            "ctl00$ContentPlaceHolder1$Location_Dropdown": form["location_value"],  # Use the correct value
             "ctl00$ContentPlaceHolder1$Visa_Case_Number": application_num,
             "ctl00$ContentPlaceHolder1$Captcha": captcha_num,
             "ctl00$ContentPlaceHolder1$Passport_Number": passport_number,
             "ctl00$ContentPlaceHolder1$Surname": surname,
-            "LBD_VCID_c_status_ctl00_contentplaceholder1_defaultcaptcha": "a81747f3a56d4877bf16e1a5450fb944",
+            CAPTCHA_VCID_FIELD: "a81747f3a56d4877bf16e1a5450fb944",
             "LBD_BackWorkaround_c_status_ctl00_contentplaceholder1_defaultcaptcha": "1",
             "__ASYNCPOST": "true",
         }
-
-        fields_need_update = [
-            "__VIEWSTATE",
-            "__VIEWSTATEGENERATOR",
-            "LBD_VCID_c_status_ctl00_contentplaceholder1_defaultcaptcha",
-        ]
-        for field in fields_need_update:
-            update_from_current_page(soup, field, data)
+        data.update(form["fields"])
 
         try:
-            r = session.post(url=f"{ROOT}/ceacstattracker/status.aspx", headers=headers, data=data)
+            CAPTCHA_ATTEMPTS.inc()
+            with STAGE_SECONDS.time(stage="form_post"):
+                r = session.post(url=f"{ROOT}/ceacstattracker/status.aspx", headers=headers, data=data)
+        except CircuitOpenError as e:
+            error = str(e)
+            break
         except Exception as e:
-            log_with_timestamp(str(e))
+            log_with_timestamp(f"Failed to submit CEAC form: {e}", logging.WARNING, sample="transport_error")
+            form = None
             isSuccess = False
+            transportFailures += 1
+            backoff(captcha=False)
             continue
 
-        soup = BeautifulSoup(r.text, features="lxml")
-        status_tag = soup.find("span", id="ctl00_ContentPlaceHolder1_ucApplicationStatusView_lblStatus")
-        if not status_tag:
-            log_with_timestamp(f"查询失败（尝试 {failCount}/5）：未找到状态信息，可能是验证码错误或表单提交失败")
+        with STAGE_SECONDS.time(stage="parse"):
+            status_info = extract_status(r.text)
+        if not status_info:
+            log_with_timestamp(
+                f"查询失败（尝试 {failCount}/{MAX_ATTEMPTS}）：未找到状态信息，可能是验证码错误或表单提交失败",
+                sample="captcha_failure",
+            )
+            form = _refresh_form(form, r.text)
             isSuccess = False
+            CAPTCHA_FAILURES.inc()
+            captchaFailures += 1
+            backoff(captcha=True)
             continue
 
-        application_num_returned = soup.find("span", id="ctl00_ContentPlaceHolder1_ucApplicationStatusView_lblCaseNo").string
+        application_num_returned = status_info.get("application_num")
         assert application_num_returned == application_num
-        status = status_tag.string
-        visa_type = soup.find("span", id="ctl00_ContentPlaceHolder1_ucApplicationStatusView_lblAppName").string
-        case_created = soup.find("span", id="ctl00_ContentPlaceHolder1_ucApplicationStatusView_lblSubmitDate").string
-        case_last_updated = soup.find("span", id="ctl00_ContentPlaceHolder1_ucApplicationStatusView_lblStatusDate").string
-        description = soup.find("span", id="ctl00_ContentPlaceHolder1_ucApplicationStatusView_lblMessage").string
 
         isSuccess = True
         result = {
             "success": True,
             "time": str(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())),
-            "visa_type": visa_type,
-            "status": status,
-            "case_created": case_created,
-            "case_last_updated": case_last_updated,
-            "description": description,
+            "visa_type": status_info.get("visa_type"),
+            "status": status_info["status"],
+            "case_created": status_info.get("case_created"),
+            "case_last_updated": status_info.get("case_last_updated"),
+            "description": status_info.get("description"),
             "application_num": application_num_returned,
             "application_num_origin": application_num
         }
@@ -126,9 +349,10 @@ def query_status(location, application_num, passport_number, surname, captchaHan
     if not isSuccess:
         result = {
             "success": False,
-            "error": f"已尝试 {failCount} 次，均未成功",
+            "error": error or f"已尝试 {failCount} 次，均未成功",
             "location": location,
             "application_num": application_num,
         }
-        log_with_timestamp(f"查询失败详情: {result}")
+        log_with_timestamp(f"查询失败: {result['error']}", logging.WARNING)
+    QUERY_SECONDS.observe(time.perf_counter() - queryStart, result="success" if isSuccess else "failure")
     return result
@@ -0,0 +1,88 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+__all__ = ["SessionPool", "get_default_session_pool"]
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 30
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """为没有显式指定 timeout 的请求加上默认超时"""
+
+    def __init__(self, timeout: float, *args, **kwargs) -> None:
+        self.__timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.__timeout
+        return super().send(request, **kwargs)
+
+
+class SessionPool:
+    def __init__(self, poolSize: int = None, timeout: float = None) -> None:
+        """
+        共享 HTTP 连接池
+
+        所有 session 挂载同一个 HTTPAdapter，因此共享到 ceac.state.gov 的 keep-alive 连接；
+        每个 session 有独立的 cookie，不同案件的 ASP.NET 会话互不干扰。
+
+        Args:
+            poolSize: 每个主机保留的最大连接数，默认读取环境变量 HTTP_POOL_SIZE（默认 10）
+            timeout: 每个请求的默认超时（秒），默认读取环境变量 HTTP_TIMEOUT（默认 30）
+        """
+        self.__poolSize = poolSize or int(os.getenv("HTTP_POOL_SIZE", DEFAULT_POOL_SIZE))
+        self.__timeout = timeout or float(os.getenv("HTTP_TIMEOUT", DEFAULT_TIMEOUT))
+        self.__adapter = TimeoutHTTPAdapter(
+            self.__timeout,
+            pool_connections=self.__poolSize,
+            pool_maxsize=self.__poolSize,
+        )
+        self.__sessions = {}
+        self.__lock = threading.Lock()
+
+    @property
+    def timeout(self) -> float:
+        return self.__timeout
+
+    def new_session(self) -> requests.Session:
+        """
+        创建一个使用共享连接池的 session
+
+        注意不要对返回的 session 调用 close()，那会关闭共享的连接池。
+        """
+        session = requests.Session()
+        session.mount("https://", self.__adapter)
+        session.mount("http://", self.__adapter)
+        return session
+
+    def session_for(self, key: str) -> requests.Session:
+        """按 key（通常是案件名）返回长期复用的 session，cookie 在多次轮询之间保留"""
+        with self.__lock:
+            session = self.__sessions.get(key)
+            if session is None:
+                session = self.new_session()
+                self.__sessions[key] = session
+            return session
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__sessions.clear()
+        self.__adapter.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_session_pool() -> SessionPool:
+    """进程内默认共享的 SessionPool"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = SessionPool()
+        return _default_pool
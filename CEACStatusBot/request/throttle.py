@@ -0,0 +1,224 @@
+import os
+import random
+import threading
+import time
+
+import requests
+
+from CEACStatusBot.utils import TokenBucket, get_default_registry, log_with_timestamp
+
+__all__ = ["CircuitOpenError", "CeacThrottle", "get_default_throttle"]
+
+DEFAULT_RATE = 2
+DEFAULT_BURST = 5
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_RESET = 300
+BREAKER_MAX_RESET = 3600
+# 重试退避：验证码错误只需要换一张验证码，网络错误说明站点有压力，退避更久
+CAPTCHA_BACKOFF_BASE = 0.5
+CAPTCHA_BACKOFF_MAX = 5
+TRANSPORT_BACKOFF_BASE = 2
+TRANSPORT_BACKOFF_MAX = 60
+REMOTE_TIMEOUT = 5
+# 协调服务不可用后，多久内直接使用本地令牌桶（秒）
+REMOTE_RETRY_AFTER = 60
+# 半开状态下探测请求进行中时，其他请求的建议等待秒数
+PROBE_RETRY_AFTER = 5.0
+# 探测请求超过该秒数仍未报告结果时视为丢失，重新回到半开状态放行下一个探测请求
+PROBE_TIMEOUT = 120.0
+
+_metrics = get_default_registry()
+TRANSPORT_ERRORS = _metrics.counter("ceac_transport_errors_total", "Network errors, timeouts and 5xx responses from CEAC")
+CIRCUIT_OPENS = _metrics.counter("ceac_circuit_opens_total", "Times the CEAC circuit breaker opened")
+CIRCUIT_RETRY_AFTER = _metrics.gauge("ceac_circuit_retry_after_seconds", "Seconds until the default circuit breaker lets a probe through, 0 when closed")
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，暂停访问 ceac.state.gov"""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"ceac.state.gov circuit open, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt: int, captcha: bool) -> float:
+    """
+    第 attempt 次失败（从 1 开始）后的等待秒数，指数退避 + full jitter
+
+    Args:
+        captcha: 是否为验证码错误（站点正常响应），否则视为网络 / 服务端错误
+    """
+    if captcha:
+        base, cap = CAPTCHA_BACKOFF_BASE, CAPTCHA_BACKOFF_MAX
+    else:
+        base, cap = TRANSPORT_BACKOFF_BASE, TRANSPORT_BACKOFF_MAX
+    return random.uniform(0, min(base * 2 ** (attempt - 1), cap))
+
+
+class CeacThrottle:
+    def __init__(
+        self,
+        rate: float = None,
+        burst: float = None,
+        breakerThreshold: int = None,
+        breakerReset: float = None,
+        coordinatorUrl: str = None,
+    ) -> None:
+        """
+        访问 ceac.state.gov 的全局限速器和熔断器，进程内所有案件共享
+
+        - 令牌桶限制每秒请求数；设置 coordinatorUrl 时通过状态服务的 /ratelimit/acquire 在多台机器间共享配额，
+          协调服务不可用时退回本地令牌桶
+        - 连续 breakerThreshold 次网络 / 服务端错误后熔断，breakerReset 秒内所有请求直接失败；
+          之后放行一个探测请求，成功则恢复，失败则熔断时间翻倍（最长 1 小时）；
+          探测请求 PROBE_TIMEOUT 秒内没有结果时重新放行一个探测请求
+
+        Args:
+            rate: 每秒请求数，默认读取环境变量 CEAC_RATE（默认 2）
+            burst: 允许的突发请求数，默认读取环境变量 CEAC_BURST（默认 5）
+            breakerThreshold: 熔断前允许的连续失败次数，默认读取环境变量 CEAC_BREAKER_THRESHOLD（默认 5）
+            breakerReset: 熔断持续秒数，默认读取环境变量 CEAC_BREAKER_RESET（默认 300）
+            coordinatorUrl: 状态服务地址，默认读取环境变量 CEAC_RATE_COORDINATOR，未设置时只在进程内限速
+        """
+        self.__bucket = TokenBucket(
+            rate or float(os.getenv("CEAC_RATE", DEFAULT_RATE)),
+            burst or float(os.getenv("CEAC_BURST", DEFAULT_BURST)),
+        )
+        self.__threshold = breakerThreshold or int(os.getenv("CEAC_BREAKER_THRESHOLD", DEFAULT_BREAKER_THRESHOLD))
+        self.__baseReset = breakerReset or float(os.getenv("CEAC_BREAKER_RESET", DEFAULT_BREAKER_RESET))
+        self.__coordinatorUrl = (coordinatorUrl or os.getenv("CEAC_RATE_COORDINATOR", "")).rstrip("/")
+        self.__remoteSession = requests.Session() if self.__coordinatorUrl else None
+        self.__remoteDownUntil = 0.0
+
+        self.__failures = 0
+        self.__reset = self.__baseReset
+        self.__openUntil = 0.0
+        self.__probing = False
+        self.__probeDeadline = 0.0
+        self.__lock = threading.Lock()
+
+    def __probe_in_flight(self, now: float) -> bool:
+        """是否有未超时的探测请求，调用方需持有锁"""
+        return self.__probing and now < self.__probeDeadline
+
+    def retry_after(self) -> float:
+        """熔断剩余的秒数；半开状态下探测请求进行中时为 PROBE_RETRY_AFTER；可以正常请求时为 0"""
+        with self.__lock:
+            now = time.monotonic()
+            remaining = self.__openUntil - now
+            if remaining > 0:
+                return remaining
+            return PROBE_RETRY_AFTER if self.__probe_in_flight(now) else 0.0
+
+    @property
+    def half_open(self) -> bool:
+        """熔断时间已过、还没有放行探测请求：下一次 acquire 将作为探测请求"""
+        with self.__lock:
+            now = time.monotonic()
+            return self.__failures >= self.__threshold and not self.__probe_in_flight(now) and self.__openUntil <= now
+
+    def __check_breaker(self) -> bool:
+        """熔断中时抛出 CircuitOpenError，返回本次请求是否为探测请求"""
+        with self.__lock:
+            now = time.monotonic()
+            if self.__openUntil > now:
+                raise CircuitOpenError(self.__openUntil - now)
+            if self.__failures >= self.__threshold:
+                # 熔断时间已过：只放行一个探测请求
+                if self.__probe_in_flight(now):
+                    raise CircuitOpenError(PROBE_RETRY_AFTER)
+                if self.__probing:
+                    log_with_timestamp(f"ceac.state.gov probe got no result within {PROBE_TIMEOUT:.0f}s, sending another")
+                self.__probing = True
+                self.__probeDeadline = now + PROBE_TIMEOUT
+                return True
+            return False
+
+    def release_probe(self) -> None:
+        """
+        探测请求没有得到站点的响应、也不是网络错误（如发送前抛出的其他异常）时调用：
+        不计入成功或失败，只释放探测名额，让下一个请求作为探测请求
+        """
+        with self.__lock:
+            self.__probing = False
+
+    def __remote_wait(self) -> float:
+        """向协调服务申请一个令牌，返回需要等待的秒数；协调服务不可用时返回 None"""
+        if not self.__coordinatorUrl or time.monotonic() < self.__remoteDownUntil:
+            return None
+        try:
+            response = self.__remoteSession.post(
+                f"{self.__coordinatorUrl}/ratelimit/acquire", json={"key": "ceac"}, timeout=REMOTE_TIMEOUT
+            )
+            response.raise_for_status()
+            result = response.json()
+            return 0.0 if result.get("granted") else float(result.get("wait", 1))
+        except Exception as e:
+            log_with_timestamp(f"Rate limit coordinator unavailable, using local limiter: {e}")
+            self.__remoteDownUntil = time.monotonic() + REMOTE_RETRY_AFTER
+            return None
+
+    def acquire(self) -> bool:
+        """
+        在每次请求 ceac.state.gov 之前调用，阻塞直到拿到令牌
+
+        Returns:
+            本次请求是否为半开状态下的探测请求；探测请求必须以 record_success / record_failure / release_probe 结束
+
+        Raises:
+            CircuitOpenError: 熔断中
+        """
+        probe = self.__check_breaker()
+        try:
+            while True:
+                wait = self.__remote_wait()
+                if wait is None:
+                    wait = self.__bucket.try_acquire()
+                if wait == 0:
+                    return probe
+                time.sleep(wait)
+        except BaseException:
+            if probe:
+                self.release_probe()
+            raise
+
+    def record_success(self) -> None:
+        """站点正常响应（包括验证码错误）"""
+        with self.__lock:
+            if self.__failures >= self.__threshold:
+                log_with_timestamp("ceac.state.gov is reachable again, circuit closed")
+            self.__failures = 0
+            self.__reset = self.__baseReset
+            self.__probing = False
+
+    def record_failure(self) -> None:
+        """网络错误、超时或 5xx 响应"""
+        TRANSPORT_ERRORS.inc()
+        with self.__lock:
+            self.__failures += 1
+            # 熔断前已发出的请求陆续失败时，不重复延长熔断时间
+            if self.__failures < self.__threshold or self.__openUntil > time.monotonic():
+                return
+            if self.__probing:
+                # 探测失败，熔断时间翻倍
+                self.__reset = min(self.__reset * 2, BREAKER_MAX_RESET)
+            self.__probing = False
+            self.__openUntil = time.monotonic() + self.__reset
+            CIRCUIT_OPENS.inc()
+            log_with_timestamp(
+                f"ceac.state.gov failed {self.__failures} times in a row, pausing requests for {self.__reset:.0f}s"
+            )
+
+
+_default_throttle = None
+_default_throttle_lock = threading.Lock()
+
+
+def get_default_throttle() -> CeacThrottle:
+    """进程内默认共享的 CeacThrottle"""
+    global _default_throttle
+    with _default_throttle_lock:
+        if _default_throttle is None:
+            _default_throttle = CeacThrottle()
+            CIRCUIT_RETRY_AFTER.set_function(_default_throttle.retry_after)
+        return _default_throttle
@@ -1,4 +1,14 @@
-from .logger import log_with_timestamp, get_timestamp
-
-__all__ = ["log_with_timestamp", "get_timestamp"]
+from .logger import configure_logging, get_logger, get_timestamp, log_context, log_with_timestamp
+from .metrics import get_default_registry, start_metrics_server
+from .ratelimit import TokenBucket
 
+__all__ = [
+    "log_with_timestamp",
+    "get_timestamp",
+    "get_logger",
+    "configure_logging",
+    "log_context",
+    "TokenBucket",
+    "get_default_registry",
+    "start_metrics_server",
+]
@@ -0,0 +1,38 @@
+import importlib
+import sys
+
+__all__ = ["lazy_exports"]
+
+
+def lazy_exports(package: str, exports: dict):
+    """
+    为包生成 PEP 562 的 __getattr__ / __dir__，子模块在第一次访问其导出的名字时才导入
+
+    用法（在包的 __init__.py 中）::
+
+        _EXPORTS = {"OnnxCaptchaHandle": ".onnx", ...}
+        __all__ = list(_EXPORTS)
+        __getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
+
+    Args:
+        package: 包名，即 __init__.py 中的 __name__
+        exports: 导出的名字 -> 所在的子模块（相对包的路径，如 ".onnx"）
+
+    Returns:
+        (__getattr__, __dir__)
+    """
+    module_globals = sys.modules[package].__dict__
+
+    def __getattr__(name: str):
+        module_name = exports.get(name)
+        if module_name is None:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(module_name, package), name)
+        # 缓存到包的命名空间，之后的访问不再经过 __getattr__
+        module_globals[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(module_globals) | set(exports))
+
+    return __getattr__, __dir__
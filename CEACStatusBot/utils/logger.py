@@ -1,20 +1,243 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 
+__all__ = [
+    "log_with_timestamp",
+    "get_timestamp",
+    "get_logger",
+    "configure_logging",
+    "shutdown_logging",
+    "log_context",
+]
 
-def log_with_timestamp(message: str) -> None:
+LOGGER_NAME = "CEACStatusBot"
+DEFAULT_LOG_LEVEL = "INFO"
+DEFAULT_LOG_FORMAT = "text"
+# 同一条重复日志（同一 sample 键、同一案件）在该时间窗口内只输出一次（秒）
+DEFAULT_SAMPLE_INTERVAL = 60
+
+# 当前线程 / 协程的上下文字段，如 {"case": "..."}，随日志一起输出
+_context = contextvars.ContextVar("log_context", default={})
+
+_lock = threading.Lock()
+_listener = None
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    在 with 块内的日志中附加上下文字段（如 case=案件名）
+
+    上下文保存在 contextvars 中，各线程互不影响；提交到线程池的任务需要用 contextvars.copy_context().run 传递。
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class _ContextFilter(logging.Filter):
+    """在调用方线程中把上下文字段和 log_with_timestamp 的额外字段合并到 record.fields"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.fields = {**_context.get(), **getattr(record, "fields", {})}
+        return True
+
+
+class _SamplingFilter(logging.Filter):
+    def __init__(self, interval: float) -> None:
+        """
+        带 sample 键的日志在 interval 秒内只输出第一条，下一条输出时附带被省略的条数
+
+        按 (sample 键, 案件) 计数，不同案件的重复日志互不影响。
+        """
+        super().__init__()
+        self.__interval = interval
+        # (键, 案件) -> [窗口开始时间, 省略条数]
+        self.__windows = {}
+        self.__lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample = getattr(record, "sample", None)
+        if sample is None or self.__interval <= 0:
+            return True
+        key = (sample, record.fields.get("case"))
+        now = time.monotonic()
+        with self.__lock:
+            window = self.__windows.get(key)
+            if window is not None and now - window[0] < self.__interval:
+                window[1] += 1
+                return False
+            suppressed = window[1] if window is not None else 0
+            self.__windows[key] = [now, 0]
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar message(s) suppressed)"
+            record.args = None
+        return True
+
+
+class _TextFormatter(logging.Formatter):
+    """与旧版 log_with_timestamp 相同的格式：YYYY-MM-DD HH:mm:ss - [案件] 消息，INFO 以外的级别附带级别名"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        parts = [self.formatTime(record, "%Y-%m-%d %H:%M:%S"), " - "]
+        if record.levelno != logging.INFO:
+            parts.append(f"{record.levelname} - ")
+        case = getattr(record, "fields", {}).get("case")
+        if case:
+            parts.append(f"[{case}] ")
+        parts.append(record.getMessage())
+        return "".join(parts)
+
+
+class _JsonFormatter(logging.Formatter):
+    """每行一个 JSON 对象，上下文字段作为顶层字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "message": record.getMessage(),
+        }
+        for name, value in getattr(record, "fields", {}).items():
+            entry.setdefault(name, value)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """每次写入时取当前的 sys.stdout，兼容 contextlib.redirect_stdout"""
+
+    def __init__(self) -> None:
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, _value) -> None:
+        pass
+
+
+class _PreparedQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        只在调用方线程中合并消息参数和异常信息，格式化与写入交给后台线程
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.msg = f"{record.msg}\n{logging.Formatter().formatException(record.exc_info)}"
+            record.exc_info = None
+        record.exc_text = None
+        return record
+
+
+def configure_logging(level=None, fmt: str = None, stream=None, sampleInterval: float = None) -> None:
+    """
+    配置 CEACStatusBot 的日志输出；不调用时在第一次写日志时按环境变量自动配置
+
+    日志先放入内存队列，由后台线程格式化并写入，调用方不会阻塞在 stdout 上；进程退出时自动写完队列中的日志。
+
+    Args:
+        level: 日志级别（名称或数值），默认读取环境变量 LOG_LEVEL（默认 INFO）
+        fmt: "text" 或 "json"，默认读取环境变量 LOG_FORMAT（默认 text）
+        stream: 输出流，默认为 sys.stdout
+        sampleInterval: 重复日志的采样窗口（秒），默认读取环境变量 LOG_SAMPLE_INTERVAL（默认 60），0 表示不采样
+    """
+    global _listener
+    level = level or os.getenv("LOG_LEVEL", DEFAULT_LOG_LEVEL)
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            level = logging.INFO
+    fmt = (fmt or os.getenv("LOG_FORMAT", DEFAULT_LOG_FORMAT)).lower()
+    if sampleInterval is None:
+        sampleInterval = float(os.getenv("LOG_SAMPLE_INTERVAL", DEFAULT_SAMPLE_INTERVAL))
+
+    handler = logging.StreamHandler(stream) if stream is not None else _StdoutHandler()
+    handler.setFormatter(_JsonFormatter() if fmt == "json" else _TextFormatter())
+
+    logQueue = queue.SimpleQueue()
+    queueHandler = _PreparedQueueHandler(logQueue)
+    # 过滤器在调用方线程执行：上下文字段只能在这里读取
+    queueHandler.addFilter(_ContextFilter())
+    queueHandler.addFilter(_SamplingFilter(sampleInterval))
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+        logger = logging.getLogger(LOGGER_NAME)
+        for old in list(logger.handlers):
+            logger.removeHandler(old)
+        logger.addHandler(queueHandler)
+        logger.setLevel(level)
+        logger.propagate = False
+        _listener = QueueListener(logQueue, handler)
+        _listener.start()
+
+
+def shutdown_logging() -> None:
+    """写完队列中剩余的日志并停止后台线程"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        logger = logging.getLogger(LOGGER_NAME)
+        for old in list(logger.handlers):
+            logger.removeHandler(old)
+
+
+atexit.register(shutdown_logging)
+
+
+def get_logger(name: str = None) -> logging.Logger:
+    """
+    获取 CEACStatusBot 的 logger（或其子 logger），未配置时按环境变量配置
+
+    额外字段通过 extra={"fields": {...}} 传入，重复日志通过 extra={"sample": 键} 采样。
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    if _listener is None:
+        configure_logging()
+    return logger.getChild(name) if name else logger
+
+
+def log_with_timestamp(message: str, level: int = logging.INFO, sample: str = None, **fields) -> None:
     """打印带时间戳的日志信息
-    
-    格式: YYYY-MM-DD HH:mm:ss - {message}
+
+    格式: YYYY-MM-DD HH:mm:ss - {message}（LOG_FORMAT=json 时为 JSON）
+
+    Args:
+        level: 日志级别，默认 INFO
+        sample: 重复日志的采样键，同一键在 LOG_SAMPLE_INTERVAL 秒内只输出一次
+        fields: 附加的上下文字段，如 case=案件名
     """
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"{timestamp} - {message}")
+    logger = get_logger()
+    if not logger.isEnabledFor(level):
+        return
+    extra = {"fields": fields}
+    if sample is not None:
+        extra["sample"] = sample
+    logger.log(level, message, extra=extra)
 
 
 def get_timestamp() -> str:
     """获取格式化的时间戳字符串
-    
+
     Returns:
         格式化的时间戳字符串: YYYY-MM-DD HH:mm:ss
     """
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
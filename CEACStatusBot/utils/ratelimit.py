@@ -0,0 +1,62 @@
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        """
+        线程安全的令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 桶容量（允许的突发量），默认等于 rate 且不小于 1
+        """
+        self.__rate = rate
+        self.__capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.__tokens = self.__capacity
+        self.__updatedAt = time.monotonic()
+        self.__lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self.__rate
+
+    def __refill(self, now: float) -> None:
+        self.__tokens = min(self.__capacity, self.__tokens + (now - self.__updatedAt) * self.__rate)
+        self.__updatedAt = now
+
+    def delay(self, tokens: float = 1) -> float:
+        """距离可以取出 tokens 个令牌还需等待的秒数，不取出令牌"""
+        with self.__lock:
+            self.__refill(time.monotonic())
+            if self.__tokens >= tokens:
+                return 0.0
+            return (tokens - self.__tokens) / self.__rate
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """
+        尝试取出令牌
+
+        Returns:
+            0 表示已取出；否则为还需等待的秒数（未取出）
+        """
+        with self.__lock:
+            self.__refill(time.monotonic())
+            if self.__tokens >= tokens:
+                self.__tokens -= tokens
+                return 0.0
+            return (tokens - self.__tokens) / self.__rate
+
+    def acquire(self, tokens: float = 1, timeout: float = None) -> bool:
+        """阻塞直到取出令牌，超时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
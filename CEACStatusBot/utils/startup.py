@@ -0,0 +1,114 @@
+"""
+启动耗时报告：在子进程中用 python -X importtime 导入指定模块，汇总最耗时的导入
+
+用法::
+
+    python -m CEACStatusBot.utils.startup                      # 默认 import CEACStatusBot
+    python -m CEACStatusBot.utils.startup trigger.py --top 30  # 只执行 trigger.py 中的 import，不会查询
+    python -m CEACStatusBot.utils.startup CEACStatusBot.engine.runner
+"""
+
+import argparse
+import ast
+import os
+import re
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+
+__all__ = ["ImportRecord", "parse_importtime", "measure_imports"]
+
+# import time:       self [us] |  cumulative | imported package
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+@dataclass
+class ImportRecord:
+    """-X importtime 输出中的一行"""
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> list:
+    """解析 -X importtime 写到 stderr 的内容，返回 ImportRecord 列表（按导入完成的顺序）"""
+    records = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            # 顶层导入前有一个空格，之后每层缩进两个空格
+            records.append(ImportRecord(module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return records
+
+
+def _script_imports(path: str) -> str:
+    """
+    提取脚本顶层的 import 语句
+
+    trigger.py / daemon.py 导入即运行，这里只测量它们的 import 部分。
+    """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    return "\n".join(
+        ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))
+    )
+
+
+def measure_imports(target: str = "CEACStatusBot") -> tuple:
+    """
+    在一个全新的解释器中导入 target，返回 (ImportRecord 列表, 子进程总耗时秒数)
+
+    Args:
+        target: 模块名，或者 .py 脚本路径（只执行其中的 import 语句）
+    """
+    if target.endswith(".py"):
+        code = _script_imports(target)
+    else:
+        code = f"import {target}"
+
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=os.getcwd(),
+    )
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"
+        raise RuntimeError(f"Importing {target} failed: {error}")
+    return parse_importtime(proc.stderr), elapsed
+
+
+def report(target: str, top: int) -> str:
+    records, elapsed = measure_imports(target)
+    total_us = sum(record.cumulative_us for record in records if record.depth == 0)
+
+    lines = [
+        f"Startup report for {target}",
+        f"  interpreter + imports: {elapsed * 1000:.0f} ms (imports {total_us / 1000:.0f} ms, {len(records)} modules)",
+        "",
+        "Top-level imports by cumulative time:",
+    ]
+    for record in sorted((r for r in records if r.depth == 0), key=lambda r: r.cumulative_us, reverse=True)[:top]:
+        lines.append(f"  {record.cumulative_us / 1000:8.1f} ms  {record.module}")
+
+    lines += ["", "Slowest modules by self time:"]
+    for record in sorted(records, key=lambda r: r.self_us, reverse=True)[:top]:
+        lines.append(f"  {record.self_us / 1000:8.1f} ms  {record.module}")
+    return "\n".join(lines)
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description="Report import-time cost of a module or script")
+    parser.add_argument("target", nargs="?", default="CEACStatusBot", help="module name or script path")
+    parser.add_argument("--top", type=int, default=15, help="number of entries to show")
+    args = parser.parse_args(argv)
+    print(report(args.target, args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+本地模拟的 ceac.state.gov 状态查询页面，用于离线基准测试
+
+实现 query_status 用到的三个接口：
+- GET  /ceacstattracker/status.aspx?App=NIV      完整页面：地点下拉框、隐藏字段、验证码图片
+- GET  /ceacstattracker/BotDetectCaptcha.ashx    验证码图片（PNG），答案已知
+- POST /ceacstattracker/status.aspx              UpdatePanel 异步回发的 delta 响应
+
+可以配置固定延迟 + 随机抖动、5xx 错误率和验证码错误率。
+
+单独运行（然后把 CEAC_ROOT_URL 指向它）::
+
+    python -m benchmarks.mock_ceac --port 18080 --latency 0.05 --error-rate 0.02
+    CEAC_ROOT_URL=http://127.0.0.1:18080 python trigger.py
+"""
+
+import argparse
+import hashlib
+import html
+import io
+import random
+import string
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image, ImageDraw
+
+from CEACStatusBot.captcha.handle import CaptchaHandle
+from CEACStatusBot.request.extract import CAPTCHA_IMAGE_ID, CAPTCHA_VCID_FIELD, STATUS_VIEW_PREFIX
+
+__all__ = ["MockCeacConfig", "MockCeacServer", "OracleCaptchaHandle"]
+
+STATUS_PATH = "/ceacstattracker/status.aspx"
+CAPTCHA_PATH = "/ceacstattracker/BotDetectCaptcha.ashx"
+CAPTCHA_ALPHABET = string.digits + string.ascii_uppercase
+CAPTCHA_LENGTH = 5
+# 与 OnnxCaptchaHandle 的输入尺寸一致 (W, H)
+CAPTCHA_SIZE = (200, 50)
+
+LOCATION_FILE = Path(__file__).resolve().parent.parent / "LOCATION.md"
+# LOCATION.md 不存在时使用的地点
+DEFAULT_LOCATIONS = [("BEJ", "CHINA, BEIJING"), ("GUZ", "CHINA, GUANGZHOU"), ("SHG", "CHINA, SHANGHAI")]
+STATUSES = ["Administrative Processing", "Issued", "Refused", "Ready", "Application Received"]
+
+
+@dataclass
+class MockCeacConfig:
+    """
+    Args:
+        latency: 每个请求的固定延迟（秒）
+        jitter: 在固定延迟上叠加的随机延迟上限（秒）
+        error_rate: 返回 503 的概率
+        captcha_error_rate: 答案正确时仍按验证码错误处理的概率
+        strict_captcha: 是否校验验证码答案；False 时任何答案都接受（用于测量真实模型的推理开销）
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    captcha_error_rate: float = 0.0
+    strict_captcha: bool = True
+
+
+def load_locations(path: Path = LOCATION_FILE) -> list:
+    """从 LOCATION.md 的表格读取 [(代码, 名称), ...]，使下拉框与真实页面的规模一致"""
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return list(DEFAULT_LOCATIONS)
+    locations = []
+    for line in lines:
+        cells = [cell.strip() for cell in line.strip().strip("|").split("|")]
+        if len(cells) == 2 and len(cells[0]) == 3 and cells[0].isupper():
+            locations.append((cells[0], cells[1]))
+    return locations or list(DEFAULT_LOCATIONS)
+
+
+def _render_captcha(text: str) -> bytes:
+    image = Image.new("RGB", CAPTCHA_SIZE, (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for i, char in enumerate(text):
+        draw.text((20 + i * 34, 18 + random.randint(-6, 6)), char, fill=(random.randint(0, 120), 0, 0))
+    for _ in range(6):
+        draw.line([(random.randint(0, 200), random.randint(0, 50)) for _ in range(2)], fill=(120, 120, 120))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _delta(*entries) -> str:
+    """拼接 ASP.NET UpdatePanel 的 delta 响应："长度|类型|id|内容|" """
+    return "".join(f"{len(content)}|{entry_type}|{entry_id}|{content}|" for entry_type, entry_id, content in entries)
+
+
+class MockCeacServer:
+    def __init__(self, config: MockCeacConfig = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        """
+        在后台线程中运行的模拟 CEAC 服务
+
+        每个 VCID 对应一个验证码，答案保存在内存中；image_answer() 可以根据图片内容查到答案，
+        供 OracleCaptchaHandle 使用。
+
+        Args:
+            config: 延迟和错误注入配置
+            host: 监听地址
+            port: 监听端口，0 表示随机端口
+        """
+        self.config = config or MockCeacConfig()
+        self.locations = load_locations()
+        self.__answers = {}
+        self.__imageAnswers = {}
+        self.__lock = threading.Lock()
+        self.__requestCount = 0
+        self.__httpd = ThreadingHTTPServer((host, port), self.__handler_class())
+        self.__httpd.daemon_threads = True
+        self.__thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.__httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def request_count(self) -> int:
+        return self.__requestCount
+
+    def start(self) -> "MockCeacServer":
+        self.__thread = threading.Thread(target=self.__httpd.serve_forever, name="mock-ceac", daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__httpd.shutdown()
+        self.__httpd.server_close()
+
+    def __enter__(self) -> "MockCeacServer":
+        return self.start()
+
+    def __exit__(self, *_exc) -> None:
+        self.stop()
+
+    def record_request(self) -> None:
+        with self.__lock:
+            self.__requestCount += 1
+
+    def image_answer(self, image: bytes) -> str:
+        """已生成过的验证码图片的答案，未知图片返回空字符串"""
+        with self.__lock:
+            return self.__imageAnswers.get(hashlib.sha1(image).digest(), "")
+
+    def new_captcha(self) -> str:
+        """生成一个新的 VCID 和对应的答案"""
+        vcid = uuid.uuid4().hex
+        answer = "".join(random.choices(CAPTCHA_ALPHABET, k=CAPTCHA_LENGTH))
+        with self.__lock:
+            self.__answers[vcid] = answer
+        return vcid
+
+    def captcha_image(self, vcid: str) -> bytes:
+        with self.__lock:
+            answer = self.__answers.get(vcid)
+        if answer is None:
+            return None
+        image = _render_captcha(answer)
+        with self.__lock:
+            self.__imageAnswers[hashlib.sha1(image).digest()] = answer
+        return image
+
+    def check_captcha(self, vcid: str, answer: str) -> bool:
+        """校验答案；每个 VCID 只能使用一次"""
+        with self.__lock:
+            expected = self.__answers.pop(vcid, None)
+        if expected is None:
+            return False
+        if self.config.strict_captcha and answer != expected:
+            return False
+        return random.random() >= self.config.captcha_error_rate
+
+    # --- 页面内容 ---
+
+    @staticmethod
+    def _captcha_img(vcid: str) -> str:
+        src = html.escape(f"{CAPTCHA_PATH}?get=image&c=c_status_ctl00_contentplaceholder1_defaultcaptcha&t={vcid}")
+        return f'<img id="{CAPTCHA_IMAGE_ID}" src="{src}" alt="Retype the CAPTCHA code from the image" />'
+
+    @staticmethod
+    def _hidden(name: str, value: str) -> str:
+        return f'<input type="hidden" name="{name}" id="{name}" value="{html.escape(value)}" />'
+
+    def landing_page(self) -> str:
+        vcid = self.new_captcha()
+        options = "".join(
+            f'<option value="{value}">{html.escape(name)}</option>' for value, name in self.locations
+        )
+        return (
+            "<!DOCTYPE html><html><head><title>CEAC Status</title></head><body>"
+            '<form method="post" action="./status.aspx?App=NIV" id="aspnetForm">'
+            + self._hidden("__VIEWSTATE", uuid.uuid4().hex * 4)
+            + self._hidden("__VIEWSTATEGENERATOR", "DBF1011F")
+            + self._hidden("__EVENTVALIDATION", uuid.uuid4().hex * 2)
+            + '<select name="ctl00$ContentPlaceHolder1$Location_Dropdown" id="Location_Dropdown">'
+            + '<option value="">- SELECT ONE -</option>' + options + "</select>"
+            + '<div id="ctl00_ContentPlaceHolder1_UpdatePanel1">'
+            + self._captcha_img(vcid)
+            + self._hidden(CAPTCHA_VCID_FIELD, vcid)
+            + "</div></form></body></html>"
+        )
+
+    def captcha_failure(self) -> str:
+        """验证码错误：UpdatePanel 重新渲染验证码，hiddenField 带上新的 __VIEWSTATE"""
+        vcid = self.new_captcha()
+        panel = (
+            '<span class="error">The code entered does not match the code displayed on the page.</span>'
+            + self._captcha_img(vcid)
+            + self._hidden(CAPTCHA_VCID_FIELD, vcid)
+        )
+        return _delta(
+            ("updatePanel", "ctl00_ContentPlaceHolder1_UpdatePanel1", panel),
+            ("hiddenField", "__VIEWSTATE", uuid.uuid4().hex * 4),
+            ("hiddenField", "__VIEWSTATEGENERATOR", "DBF1011F"),
+        )
+
+    def status_result(self, application_num: str) -> str:
+        status = STATUSES[int(hashlib.sha1(application_num.encode()).hexdigest(), 16) % len(STATUSES)]
+        spans = {
+            "lblCaseNo": application_num,
+            "lblStatus": status,
+            "lblAppName": "NONIMMIGRANT VISA APPLICATION",
+            "lblSubmitDate": "30-Aug-2022",
+            "lblStatusDate": "19-Oct-2022",
+            "lblMessage": "Your case is undergoing necessary administrative processing.",
+        }
+        panel = "".join(
+            f'<span id="{STATUS_VIEW_PREFIX}{suffix}">{html.escape(value)}</span>' for suffix, value in spans.items()
+        )
+        return _delta(
+            ("updatePanel", "ctl00_ContentPlaceHolder1_UpdatePanel1", panel),
+            ("hiddenField", "__VIEWSTATE", uuid.uuid4().hex * 4),
+        )
+
+    # --- HTTP ---
+
+    def __handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和响应体分两次写入，不关闭 Nagle 会与客户端的延迟 ACK 叠加出约 40ms 的额外延迟
+            disable_nagle_algorithm = True
+
+            def log_message(self, *_args) -> None:
+                pass
+
+            def _delay_and_fail(self) -> bool:
+                server.record_request()
+                config = server.config
+                delay = config.latency + random.uniform(0, config.jitter)
+                if delay > 0:
+                    time.sleep(delay)
+                if random.random() < config.error_rate:
+                    self._send(503, b"Service Unavailable", "text/plain")
+                    return True
+                return False
+
+            def _send(self, code: int, body: bytes, content_type: str) -> None:
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                if self._delay_and_fail():
+                    return
+                url = urlsplit(self.path)
+                if url.path == STATUS_PATH:
+                    self._send(200, server.landing_page().encode(), "text/html; charset=utf-8")
+                elif url.path == CAPTCHA_PATH:
+                    vcid = parse_qs(url.query).get("t", [""])[0]
+                    image = server.captcha_image(vcid)
+                    if image is None:
+                        self._send(404, b"Unknown captcha", "text/plain")
+                    else:
+                        self._send(200, image, "image/png")
+                else:
+                    self._send(404, b"Not Found", "text/plain")
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                if self._delay_and_fail():
+                    return
+                if urlsplit(self.path).path != STATUS_PATH:
+                    self._send(404, b"Not Found", "text/plain")
+                    return
+                form = {key: values[0] for key, values in parse_qs(body, keep_blank_values=True).items()}
+                vcid = form.get(CAPTCHA_VCID_FIELD, "")
+                answer = form.get("ctl00$ContentPlaceHolder1$Captcha", "")
+                if server.check_captcha(vcid, answer):
+                    response = server.status_result(form.get("ctl00$ContentPlaceHolder1$Visa_Case_Number", ""))
+                else:
+                    response = server.captcha_failure()
+                self._send(200, response.encode(), "text/plain; charset=utf-8")
+
+        return Handler
+
+
+class OracleCaptchaHandle(CaptchaHandle):
+    """直接从模拟服务查出验证码答案的 handle，用于不依赖 ONNX 模型测量其余环节"""
+
+    def __init__(self, server: MockCeacServer) -> None:
+        super().__init__()
+        self.__server = server
+
+    def solve(self, image) -> str:
+        return self.__server.image_answer(image)
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for ceac.state.gov status.aspx")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.0, help="fixed delay per request (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay per request (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a 503 response")
+    parser.add_argument("--captcha-error-rate", type=float, default=0.0, help="probability of rejecting a correct captcha")
+    parser.add_argument("--lenient", action="store_true", help="accept any captcha answer")
+    args = parser.parse_args(argv)
+
+    config = MockCeacConfig(args.latency, args.jitter, args.error_rate, args.captcha_error_rate, not args.lenient)
+    server = MockCeacServer(config, args.host, args.port)
+    print(f"Mock CEAC listening on {server.url} (set CEAC_ROOT_URL={server.url})")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
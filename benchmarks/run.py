@@ -0,0 +1,319 @@
+"""
+离线基准测试：针对本地模拟的 CEAC 服务测量查询各环节的耗时
+
+    python -m benchmarks.run                                  # 默认参数
+    python -m benchmarks.run --queries 200 --concurrency 1,4,16 --latency 0.02 --jitter 0.01
+    python -m benchmarks.run --model captcha.onnx             # 同时测量 ONNX 识别（模拟服务接受任意答案）
+    python -m benchmarks.run --json bench.json                # 保存结果
+    python -m benchmarks.run --compare bench.json             # 与保存的结果比较，p50 / p95 变慢超过阈值时返回非 0
+
+模拟服务默认与基准测试运行在同一个进程中，高并发时会与被测代码争抢 GIL。测量吞吐量时可以在另一个进程中
+启动模拟服务（必须使用 --lenient，因为此时无法查到验证码答案）::
+
+    python -m benchmarks.mock_ceac --port 18080 --lenient
+    python -m benchmarks.run --url http://127.0.0.1:18080
+
+测量内容：
+- parse：extract_form / extract_async_form / extract_status 解析模拟页面
+- captcha：OnnxCaptchaHandle 单张与批量识别（需要模型文件）
+- query：不同并发下 query_status 的端到端延迟、吞吐量，以及落地页 GET、验证码 GET、识别、表单 POST 各环节的延迟
+- send：NotificationManager.send（查询 + 变更检测 + 通知分发）的延迟
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from CEACStatusBot.notification.handle import NotificationHandle
+from CEACStatusBot.utils import configure_logging
+
+from .mock_ceac import MockCeacConfig, MockCeacServer, OracleCaptchaHandle
+
+DEFAULT_CONCURRENCY = "1,4,16"
+DEFAULT_THRESHOLD = 0.2
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """最近秩法求百分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class Timings:
+    """线程安全地收集各环节的耗时（秒）"""
+
+    def __init__(self) -> None:
+        self.__samples = {}
+        self.__lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self.__lock:
+            self.__samples.setdefault(stage, []).append(seconds)
+
+    def time(self, stage: str, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def summary(self) -> dict:
+        """{环节: {"n", "mean_ms", "p50_ms", "p95_ms", "p99_ms"}}"""
+        result = {}
+        with self.__lock:
+            samples = {stage: sorted(values) for stage, values in self.__samples.items()}
+        for stage, values in samples.items():
+            result[stage] = {
+                "n": len(values),
+                "mean_ms": sum(values) / len(values) * 1000,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            }
+        return result
+
+
+class TimingSession:
+    """按请求类型记录耗时的 session 包装"""
+
+    def __init__(self, session, timings: Timings) -> None:
+        self.__session = session
+        self.__timings = timings
+
+    def get(self, url, *args, **kwargs):
+        stage = "captcha GET" if "BotDetectCaptcha" in url else "landing GET"
+        return self.__timings.time(stage, self.__session.get, url, *args, **kwargs)
+
+    def post(self, url, *args, **kwargs):
+        return self.__timings.time("form POST", self.__session.post, url, *args, **kwargs)
+
+
+class TimingCaptchaHandle:
+    """记录识别耗时的验证码 handle 包装"""
+
+    def __init__(self, captchaHandle, timings: Timings) -> None:
+        self.__captchaHandle = captchaHandle
+        self.__timings = timings
+
+    def solve_with_confidence(self, image) -> tuple:
+        return self.__timings.time("captcha solve", self.__captchaHandle.solve_with_confidence, image)
+
+
+def bench_parse(server: MockCeacServer, iterations: int) -> dict:
+    from CEACStatusBot.request import extract_async_form, extract_form, extract_status
+
+    landing = server.landing_page()
+    failure = server.captcha_failure()
+    result = server.status_result("AA00BENCH1")
+    timings = Timings()
+    for _ in range(iterations):
+        timings.time("extract_form", extract_form, landing)
+        timings.time("extract_form (cached locations)", extract_form, landing, with_locations=False)
+        timings.time("extract_async_form", extract_async_form, failure)
+        timings.time("extract_status", extract_status, result)
+    return timings.summary()
+
+
+def bench_captcha(server: MockCeacServer, model: str, iterations: int, batchSize: int) -> dict:
+    from CEACStatusBot.captcha import OnnxCaptchaHandle
+
+    handle = OnnxCaptchaHandle(model, warmup=True)
+    handle.warmup()
+    images = [server.captcha_image(server.new_captcha()) for _ in range(max(batchSize, 1))]
+    timings = Timings()
+    for i in range(iterations):
+        timings.time("solve", handle.solve_with_confidence, images[i % len(images)])
+    for _ in range(max(iterations // batchSize, 1)):
+        start = time.perf_counter()
+        handle.solve_batch_with_confidence(images)
+        timings.record(f"solve_batch (per image, batch {batchSize})", (time.perf_counter() - start) / len(images))
+    return timings.summary()
+
+
+def bench_query(server: MockCeacServer, captchaHandle, queries: int, concurrency: int, external: bool = False) -> dict:
+    from CEACStatusBot.request import CeacThrottle, LocationIndex, get_default_session_pool, query_status
+
+    pool = get_default_session_pool()
+    # 只测量本地开销：不限速、不熔断、不落盘地点索引
+    throttle = CeacThrottle(rate=1e9, burst=1e9, breakerThreshold=1e9)
+    locationIndex = LocationIndex(cacheFile="")
+    timings = Timings()
+    handle = TimingCaptchaHandle(captchaHandle, timings)
+    location = server.locations[0][0]
+    failures = 0
+    requestsBefore = server.request_count
+
+    def one(i: int) -> bool:
+        session = TimingSession(pool.new_session(), timings)
+        start = time.perf_counter()
+        result = query_status(
+            location, f"AA{i:08d}", "E12345678", "BENCH",
+            captchaHandle=handle, session=session, locationIndex=locationIndex, throttle=throttle,
+        )
+        timings.record("end-to-end", time.perf_counter() - start)
+        return result["success"]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for success in executor.map(one, range(queries)):
+            failures += not success
+    elapsed = time.perf_counter() - start
+
+    summary = timings.summary()
+    summary["_run"] = {
+        "queries": queries,
+        "concurrency": concurrency,
+        "throughput_qps": queries / elapsed,
+        "failures": failures,
+    }
+    if not external:
+        summary["_run"]["requests_per_query"] = (server.request_count - requestsBefore) / queries
+    return summary
+
+
+class NullNotificationHandle(NotificationHandle):
+    """不发送任何内容的通知渠道，只测量分发本身的开销"""
+
+    name = "null"
+
+    def send(self, result, change_type="status") -> None:
+        pass
+
+
+def bench_send(server: MockCeacServer, captchaHandle, iterations: int) -> dict:
+    from CEACStatusBot.notification import NotificationManager
+
+    timings = Timings()
+    location = server.locations[0][0]
+    manager = NotificationManager(location, "AA00BENCH1", "E12345678", "BENCH", captchaHandle=captchaHandle)
+    manager.addHandle(NullNotificationHandle())
+    for _ in range(iterations):
+        timings.time("NotificationManager.send", manager.send)
+    return timings.summary()
+
+
+def format_section(title: str, summary: dict) -> str:
+    lines = [f"== {title}"]
+    run = summary.get("_run")
+    if run:
+        lines.append(
+            f"   throughput {run['throughput_qps']:.1f} q/s, {run['failures']} failure(s)"
+            + (f", {run['requests_per_query']:.2f} HTTP requests/query" if "requests_per_query" in run else "")
+        )
+    lines.append(f"   {'stage':<40}{'n':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for stage, stats in summary.items():
+        if stage.startswith("_"):
+            continue
+        lines.append(
+            f"   {stage:<40}{stats['n']:>7}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+            f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+        )
+    return "\n".join(lines)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """返回 p50 / p95 比基线慢超过 threshold 的 [(section, stage, 指标, 基线, 当前)]"""
+    regressions = []
+    for section, summary in results.items():
+        for stage, stats in summary.items():
+            base = baseline.get(section, {}).get(stage)
+            if stage.startswith("_") or not base:
+                continue
+            for metric in ("p50_ms", "p95_ms"):
+                if base[metric] > 0 and stats[metric] > base[metric] * (1 + threshold):
+                    regressions.append((section, stage, metric, base[metric], stats[metric]))
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks against a local CEAC stand-in")
+    parser.add_argument("--url", help="use a mock server already running at this URL (started with --lenient)")
+    parser.add_argument("--queries", type=int, default=100, help="queries per concurrency level")
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help="comma-separated concurrency levels")
+    parser.add_argument("--iterations", type=int, default=200, help="iterations for parse / captcha / send")
+    parser.add_argument("--latency", type=float, default=0.0, help="mock server delay per request (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="mock server extra random delay (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a 503 response")
+    parser.add_argument("--captcha-error-rate", type=float, default=0.0, help="probability of rejecting a correct captcha")
+    parser.add_argument("--model", help="ONNX model for captcha benchmarks (default: captcha.onnx if present)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline JSON written by --json")
+    parser.add_argument("--verbose", action="store_true", help="show query logs")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown vs baseline")
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.concurrency.split(",") if level]
+    model = args.model or ("captcha.onnx" if os.path.exists("captcha.onnx") else None)
+    useModel = model is not None
+    config = MockCeacConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        captcha_error_rate=args.captcha_error_rate,
+        # 真实模型识别不了模拟的验证码图片，此时接受任意答案，只测量推理开销
+        strict_captcha=not useModel,
+    )
+
+    # query_status 等的日志默认只显示错误
+    configure_logging(level="INFO" if args.verbose else "ERROR")
+    # 外部模拟服务时，本地的 MockCeacServer 只用来生成解析测试的页面内容
+    server = MockCeacServer(config)
+    with contextlib.ExitStack() as stack:
+        if not args.url:
+            stack.enter_context(server)
+        # 必须在导入 CEACStatusBot.request.query 之前设置
+        os.environ["CEAC_ROOT_URL"] = args.url or server.url
+        os.environ["HTTP_POOL_SIZE"] = str(max(levels + [10]))
+        os.environ["LOCATION_CACHE_FILE"] = ""
+        os.environ["NOTIFY_OUTBOX_DB"] = ""
+        os.environ["STATUS_API_BASE_URL"] = ""
+        os.environ["CEAC_RATE"] = "1000000000"
+        os.environ["CEAC_BURST"] = "1000000000"
+
+        if useModel:
+            from CEACStatusBot.captcha import OnnxCaptchaHandle
+
+            captchaHandle = OnnxCaptchaHandle(model, warmup=True)
+            captchaHandle.warmup()
+        else:
+            captchaHandle = OracleCaptchaHandle(server)
+
+        results = {"parse": bench_parse(server, args.iterations)}
+        if useModel:
+            results["captcha"] = bench_captcha(server, model, args.iterations, args.batch_size)
+        else:
+            print("captcha.onnx not found, skipping captcha benchmarks (queries use known answers)", file=sys.stderr)
+        for level in levels:
+            results[f"query c={level}"] = bench_query(server, captchaHandle, args.queries, level, bool(args.url))
+        results["send"] = bench_send(server, captchaHandle, max(args.iterations // 10, 1))
+
+    for section, summary in results.items():
+        print(format_section(section, summary))
+        print()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for section, stage, metric, base, current in regressions:
+            print(f"REGRESSION {section} / {stage} {metric}: {base:.2f} -> {current:.2f} ms")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
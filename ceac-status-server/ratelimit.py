@@ -0,0 +1,51 @@
+"""
+多个轮询节点共享的令牌桶
+
+每个 key 一个令牌桶，保存在进程内存中；服务重启后配额重新计算，不影响正确性。
+"""
+
+import os
+import threading
+import time
+
+DEFAULT_RATE = 2
+DEFAULT_BURST = 5
+# 超过该时间未使用的令牌桶在下次申请时清理（秒）
+IDLE_EXPIRE = 3600
+
+
+class RateLimiter:
+    def __init__(self, rate=None, burst=None):
+        """
+        Args:
+            rate: 每个 key 每秒补充的令牌数，默认读取环境变量 RATELIMIT_RATE（默认 2）
+            burst: 令牌桶容量，默认读取环境变量 RATELIMIT_BURST（默认 5）
+        """
+        self.rate = rate or float(os.getenv("RATELIMIT_RATE", DEFAULT_RATE))
+        self.burst = burst or float(os.getenv("RATELIMIT_BURST", DEFAULT_BURST))
+        # key -> (剩余令牌数, 上次更新时间)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, tokens=1.0):
+        """
+        尝试取出 tokens 个令牌
+
+        Returns:
+            0 表示已取得；否则为需要等待的秒数（本次未扣除令牌）
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            available, updated = self._buckets.get(key, (self.burst, now))
+            available = min(self.burst, available + (now - updated) * self.rate)
+            if available >= tokens:
+                self._buckets[key] = (available - tokens, now)
+                return 0.0
+            self._buckets[key] = (available, now)
+            return (tokens - available) / self.rate
+
+    def _expire(self, now):
+        idle = [key for key, (_, updated) in self._buckets.items() if now - updated > IDLE_EXPIRE]
+        for key in idle:
+            del self._buckets[key]
@@ -1,19 +1,37 @@
 #!/usr/bin/env python3
 """
 简单的状态管理 API Server
-提供两个接口：
-- GET /status - 获取上一次的状态
-- POST /status - 更新最新的状态
+提供以下接口：
+- GET /status - 获取案件上一次的状态
+- POST /status - 更新案件最新的状态
+- GET /status/history - 获取案件的状态历史
+- POST /observe - 提交一次查询结果，原子地与已存储的状态比较并保存，返回变更类型
+- GET/POST /status/batch - 批量获取多个案件的状态（支持 ETag / If-None-Match）
+- POST /observe/batch - 批量提交查询结果
+- GET /events - 变更事件流（Server-Sent Events，或带游标的长轮询）
+- POST /ratelimit/acquire - 多个轮询节点共享的令牌桶，限制对 ceac.state.gov 的总请求速率
+- GET /metrics - Prometheus 指标：各接口的请求数和耗时、状态缓存命中率
+
+请求体和响应都支持 gzip（Content-Encoding / Accept-Encoding）。
+
+案件通过 case_id 区分，不传时使用默认案件（兼容单案件客户端）。
 """
 
+import gzip
+import hashlib
 import json
 import logging
 import os
 import sys
-from datetime import datetime
+import time
+import zlib
 from pathlib import Path
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
+
+from metrics import CONTENT_TYPE, MetricsRegistry
+from ratelimit import RateLimiter
+from storage import DEFAULT_CASE_ID, StatusStore
 
 # 配置日志
 logging.basicConfig(
@@ -26,44 +44,136 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# 数据存储文件路径
+# 数据存储路径
 DATA_DIR = Path(__file__).parent / "data"
-STATUS_FILE = DATA_DIR / "status_data.json"
-
-
-def ensure_data_dir():
-    """确保数据目录存在"""
-    DATA_DIR.mkdir(exist_ok=True)
-
-
-def load_status_data():
-    """加载状态数据"""
-    ensure_data_dir()
-    if STATUS_FILE.exists():
-        try:
-            with open(STATUS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                logger.debug(f"成功加载状态数据")
-                return data
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON 解析失败: {e}")
-            return None
-    logger.info("状态数据文件不存在，返回空数据")
+DB_FILE = Path(os.getenv("STATUS_DB", DATA_DIR / "status.db"))
+# 旧版单条记录的 JSON 文件，启动时自动迁移到 SQLite
+LEGACY_STATUS_FILE = DATA_DIR / "status_data.json"
+
+store = StatusStore(DB_FILE)
+store.migrate_json(LEGACY_STATUS_FILE)
+
+rate_limiter = RateLimiter()
+
+metrics = MetricsRegistry()
+REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Request handling time", ["method", "endpoint", "status"]
+)
+REQUESTS = metrics.counter("http_requests_total", "Requests by endpoint and status", ["method", "endpoint", "status"])
+metrics.callback("status_cache_hits_total", "Case lookups served from the in-memory cache", lambda: store.cache_hits, "counter")
+metrics.callback("status_cache_misses_total", "Case lookups read from SQLite", lambda: store.cache_misses, "counter")
+metrics.callback("status_cases", "Cases with a stored status", lambda: store.count())
+
+
+# 超过该字节数的 JSON 响应在客户端支持时使用 gzip 压缩
+GZIP_MIN_SIZE = 1024
+
+# 长轮询最长等待时间（秒）
+EVENTS_MAX_WAIT = 60
+# SSE 心跳间隔（秒），防止代理断开空闲连接
+EVENTS_HEARTBEAT = 15
+EVENTS_BATCH_LIMIT = 100
+
+
+def get_case_id(data=None):
+    """从请求体或查询参数中读取 case_id"""
+    case_id = (data or {}).get("case_id") or request.args.get("case_id")
+    return case_id or DEFAULT_CASE_ID
+
+
+def get_case_ids():
+    """从查询参数读取案件列表：case_id=a&case_id=b 或 case_ids=a,b"""
+    case_ids = request.args.getlist("case_id")
+    for value in request.args.getlist("case_ids"):
+        case_ids.extend(value.split(","))
+    return [case_id for case_id in case_ids if case_id]
+
+
+def get_request_json():
+    """读取 JSON 请求体，支持 Content-Encoding: gzip（由 decode_request_body 解压）；请求体为空或无法解析时返回 None"""
+    body = g.get("request_body")
+    if body is None:
+        body = request.get_data()
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def jsonify_with_etag(payload):
+    """返回带 ETag 的 JSON 响应，If-None-Match 命中时返回 304"""
+    response = jsonify(payload)
+    etag = hashlib.sha1(response.get_data()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.before_request
+def decode_request_body():
+    """解压 Content-Encoding: gzip 的请求体；数据损坏时所有接口统一返回 400"""
+    if request.headers.get("Content-Encoding", "").lower() != "gzip":
+        return None
+    body = request.get_data()
+    if not body:
+        return None
+    try:
+        g.request_body = gzip.decompress(body)
+    except (OSError, EOFError, zlib.error) as e:
+        logger.warning(f"{request.method} {request.path} 请求体 gzip 解压失败: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Invalid gzip request body"
+        }), 400
     return None
 
 
-def save_status_data(data):
-    """保存状态数据"""
-    ensure_data_dir()
-    with open(STATUS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    logger.info(f"成功保存状态数据")
+@app.after_request
+def record_request(response):
+    """记录请求耗时；SSE 等流式响应只计到开始返回为止"""
+    start = g.pop("request_start", None)
+    if start is not None:
+        # 用路由规则而不是实际路径作为标签，避免标签数量无限增长
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        labels = {"method": request.method, "endpoint": endpoint, "status": response.status_code}
+        REQUEST_SECONDS.observe(time.perf_counter() - start, **labels)
+        REQUESTS.inc(**labels)
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """客户端接受 gzip 时压缩较大的 JSON 响应"""
+    if (
+        response.status_code != 200
+        or response.is_streamed
+        or response.mimetype != "application/json"
+        or "Content-Encoding" in response.headers
+        or "gzip" not in request.headers.get("Accept-Encoding", "").lower()
+    ):
+        return response
+    data = response.get_data()
+    if len(data) < GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=5))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
 
 
 @app.route("/status", methods=["GET"])
 def get_status():
     """
     获取上一次的状态
+    查询参数：case_id（可选）
     返回格式：
     {
         "success": true,
@@ -76,9 +186,10 @@ def get_status():
     如果没有历史记录，返回 null
     """
     try:
-        logger.info("收到 GET /status 请求")
-        data = load_status_data()
-        
+        case_id = get_case_id()
+        logger.info(f"收到 GET /status 请求 (case_id: {case_id})")
+        data = store.get(case_id)
+
         if not data:
             logger.info("没有找到状态记录")
             return jsonify({
@@ -88,7 +199,7 @@ def get_status():
             })
         
         logger.info(f"返回最新状态: {data['status']} (更新于 {data.get('case_last_updated', 'N/A')})")
-        return jsonify({
+        return jsonify_with_etag({
             "success": True,
             "data": data
         })
@@ -106,14 +217,15 @@ def update_status():
     更新最新的状态
     请求体格式：
     {
+        "case_id": "...",  (可选)
         "status": "...",
         "case_last_updated": "..."
     }
     """
     try:
         logger.info("收到 POST /status 请求")
-        req_data = request.get_json()
-        
+        req_data = get_request_json()
+
         if not req_data:
             logger.warning("请求体为空")
             return jsonify({
@@ -131,17 +243,11 @@ def update_status():
                 "error": "status field is required"
             }), 400
         
-        logger.info(f"准备更新状态: {status}, case_last_updated: {case_last_updated}")
-        
-        # 创建新的状态记录（覆盖旧数据）
-        new_record = {
-            "status": status,
-            "case_last_updated": case_last_updated or "",
-            "date": datetime.now().isoformat()
-        }
+        case_id = get_case_id(req_data)
+        logger.info(f"准备更新状态: {status}, case_last_updated: {case_last_updated} (case_id: {case_id})")
         
-        # 保存数据
-        save_status_data(new_record)
+        # 覆盖当前状态并追加历史记录
+        new_record = store.put(case_id, status, case_last_updated)
         
         logger.info(f"状态更新成功: {status} (记录时间: {new_record['date']})")
         
@@ -158,6 +264,281 @@ def update_status():
         }), 500
 
 
+@app.route("/observe", methods=["POST"])
+def observe_status():
+    """
+    提交一次查询结果：在同一个事务内与已存储的状态比较，有变化时保存，并返回变更类型
+    请求体格式：
+    {
+        "case_id": "...",  (可选)
+        "status": "...",
+        "case_last_updated": "...",
+        "observation_id": "..."  (可选，客户端生成的唯一 id；重试同一次提交时返回第一次的变更类型)
+    }
+    返回格式：
+    {
+        "success": true,
+        "change_type": "status" | "case_updated" | null,
+        "data": {...},       当前记录
+        "previous": {...}    之前的记录，首次记录时为 null
+    }
+    """
+    try:
+        req_data = get_request_json()
+        if not req_data or not req_data.get("status"):
+            logger.warning("POST /observe 缺少必需字段: status")
+            return jsonify({
+                "success": False,
+                "error": "status field is required"
+            }), 400
+
+        case_id = get_case_id(req_data)
+        record, change_type, previous = store.record(
+            case_id,
+            req_data["status"],
+            req_data.get("case_last_updated"),
+            only_if_changed=True,
+            observation_id=req_data.get("observation_id"),
+        )
+        logger.info(f"POST /observe (case_id: {case_id}): {record['status']}, 变更类型: {change_type}")
+        return jsonify({
+            "success": True,
+            "change_type": change_type,
+            "data": record,
+            "previous": previous
+        })
+    except Exception as e:
+        logger.error(f"POST /observe 处理失败: {e}", exc_info=True)
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route("/status/batch", methods=["GET", "POST"])
+def get_status_batch():
+    """
+    批量获取多个案件的当前状态
+    GET 查询参数：case_id=a&case_id=b 或 case_ids=a,b
+    POST 请求体（案件较多时）：{"case_ids": ["a", "b"]}
+    返回格式：
+    {
+        "success": true,
+        "data": {"a": {...}, "b": null}
+    }
+    响应带 ETag，客户端可以用 If-None-Match 避免重复下载未变化的数据
+    """
+    try:
+        if request.method == "POST":
+            req_data = get_request_json() or {}
+            case_ids = req_data.get("case_ids") or []
+        else:
+            case_ids = get_case_ids()
+        case_ids = [case_id for case_id in case_ids if case_id]
+        if not case_ids:
+            return jsonify({
+                "success": False,
+                "error": "case_ids is required"
+            }), 400
+
+        logger.info(f"收到 {request.method} /status/batch 请求 ({len(case_ids)} 个案件)")
+        return jsonify_with_etag({
+            "success": True,
+            "data": store.get_many(case_ids)
+        })
+    except Exception as e:
+        logger.error(f"/status/batch 处理失败: {e}", exc_info=True)
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route("/observe/batch", methods=["POST"])
+def observe_status_batch():
+    """
+    批量提交查询结果，在一个事务内逐个比较并保存
+    请求体格式：
+    {
+        "observations": [
+            {"case_id": "...", "status": "...", "case_last_updated": "...", "observation_id": "..."}
+        ]
+    }
+    返回格式：
+    {
+        "success": true,
+        "results": [{"case_id": "...", "change_type": ..., "data": {...}, "previous": {...}}]
+    }
+    results 与 observations 顺序一致
+    """
+    try:
+        req_data = get_request_json() or {}
+        observations = req_data.get("observations") or []
+        for item in observations:
+            if not item.get("status"):
+                return jsonify({
+                    "success": False,
+                    "error": "status field is required for every observation"
+                }), 400
+
+        rows = [
+            (item.get("case_id") or DEFAULT_CASE_ID, item["status"], item.get("case_last_updated"), item.get("observation_id"))
+            for item in observations
+        ]
+        results = store.record_many(rows, only_if_changed=True)
+        changed = sum(1 for _, change_type, _ in results if change_type)
+        logger.info(f"POST /observe/batch: {len(rows)} 条结果，{changed} 个案件有变更")
+        return jsonify({
+            "success": True,
+            "results": [
+                {"case_id": row[0], "change_type": change_type, "data": record, "previous": previous}
+                for row, (record, change_type, previous) in zip(rows, results)
+            ]
+        })
+    except Exception as e:
+        logger.error(f"POST /observe/batch 处理失败: {e}", exc_info=True)
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route("/status/history", methods=["GET"])
+def get_status_history():
+    """
+    获取案件的状态历史（按时间倒序）
+    查询参数：case_id（可选）、limit（默认 100）
+    """
+    try:
+        case_id = get_case_id()
+        limit = request.args.get("limit", 100, type=int)
+        logger.info(f"收到 GET /status/history 请求 (case_id: {case_id}, limit: {limit})")
+        return jsonify({
+            "success": True,
+            "data": store.history(case_id, limit)
+        })
+    except Exception as e:
+        logger.error(f"GET /status/history 处理失败: {e}", exc_info=True)
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+def next_events(cursor, case_ids, timeout):
+    """
+    等待并返回游标之后的事件
+
+    Returns:
+        (事件列表, 新游标)；超时没有事件时返回空列表，游标可能前进（跳过了其他案件的事件）
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        latest = store.last_event_id()
+        events = store.events_since(cursor, case_ids, EVENTS_BATCH_LIMIT)
+        if events:
+            return events, events[-1]["id"]
+        # latest 之前的事件都已经查询过，只是不属于订阅的案件
+        cursor = max(cursor, latest)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not store.wait_for_events(cursor, remaining):
+            return [], cursor
+
+
+def stream_events(cursor, case_ids):
+    """SSE 事件流：每个事件的 id 为游标，断线重连时浏览器会通过 Last-Event-ID 继续"""
+    yield "retry: 3000\n\n"
+    while True:
+        events, cursor = next_events(cursor, case_ids, EVENTS_HEARTBEAT)
+        if not events:
+            yield ": keep-alive\n\n"
+            continue
+        for event in events:
+            yield f"id: {event['id']}\nevent: change\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+@app.route("/events", methods=["GET"])
+def get_events():
+    """
+    订阅状态变更事件
+    查询参数：
+        case_id / case_ids  只订阅指定案件（可选）
+        cursor              从该事件 id 之后开始，不传时只返回之后发生的新事件
+        timeout             长轮询最长等待秒数（默认 30，最大 60）
+
+    请求头 Accept: text/event-stream 时返回 SSE 流（支持 Last-Event-ID），否则为长轮询：
+    有事件时立即返回，否则等待到超时
+    {
+        "success": true,
+        "events": [{"id": 1, "case_id": "...", "change_type": "status", "status": "...",
+                    "case_last_updated": "...", "observed_at": "..."}],
+        "cursor": 1          下一次请求带上这个游标
+    }
+    """
+    try:
+        case_ids = get_case_ids()
+        cursor = request.headers.get("Last-Event-ID", type=int)
+        if cursor is None:
+            cursor = request.args.get("cursor", type=int)
+        if cursor is None:
+            cursor = store.last_event_id()
+
+        if request.accept_mimetypes.best == "text/event-stream":
+            logger.info(f"新的 SSE 订阅 (cursor: {cursor}, case_ids: {case_ids or 'all'})")
+            response = Response(stream_with_context(stream_events(cursor, case_ids)), mimetype="text/event-stream")
+            response.headers["Cache-Control"] = "no-cache"
+            # 关闭 Nginx 的响应缓冲
+            response.headers["X-Accel-Buffering"] = "no"
+            return response
+
+        timeout = min(max(request.args.get("timeout", 30, type=float), 0), EVENTS_MAX_WAIT)
+        events, cursor = next_events(cursor, case_ids, timeout)
+        return jsonify({
+            "success": True,
+            "events": events,
+            "cursor": cursor
+        })
+    except Exception as e:
+        logger.error(f"GET /events 处理失败: {e}", exc_info=True)
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route("/ratelimit/acquire", methods=["POST"])
+def acquire_rate_limit():
+    """
+    从共享令牌桶中申请令牌
+    请求体: {"key": "ceac", "tokens": 1}
+    返回: {"success": true, "granted": true/false, "wait": 需要等待的秒数}
+    """
+    data = get_request_json() or {}
+    key = str(data.get("key") or "default")
+    try:
+        tokens = float(data.get("tokens", 1))
+    except (TypeError, ValueError):
+        tokens = 0
+    if not 0 < tokens <= rate_limiter.burst:
+        return jsonify({
+            "success": False,
+            "error": f"tokens must be in (0, {rate_limiter.burst:g}]"
+        }), 400
+
+    wait = rate_limiter.acquire(key, tokens)
+    return jsonify({
+        "success": True,
+        "granted": wait == 0,
+        "wait": round(wait, 3)
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus 文本格式的指标"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+
 @app.route("/health", methods=["GET"])
 def health():
     """健康检查接口"""
@@ -175,20 +556,12 @@ if __name__ == "__main__":
     logger.info("=" * 60)
     logger.info("CEAC Status API Server 启动中...")
     logger.info(f"监听地址: {host}:{port}")
-    logger.info(f"数据目录: {DATA_DIR}")
+    logger.info(f"数据库文件: {DB_FILE}")
     logger.info(f"Python 版本: {sys.version}")
     logger.info("=" * 60)
     
-    # 确保数据目录存在
-    ensure_data_dir()
-    logger.info(f"数据目录已就绪: {DATA_DIR}")
-    
-    # 加载现有数据并显示统计
-    data = load_status_data()
-    if data:
-        logger.info(f"最新状态: {data['status']} (记录于 {data.get('date', 'N/A')})")
-    else:
-        logger.info("当前没有状态记录")
+    # 显示统计
+    logger.info(f"当前共有 {store.count()} 个案件的状态记录")
     
     logger.info("服务器启动成功，等待请求...")
     
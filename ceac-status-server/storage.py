@@ -0,0 +1,409 @@
+"""
+基于 SQLite（WAL 模式）的状态存储
+
+- cases 表：每个案件的当前状态
+- status_history 表：只追加的状态历史，按 (case_id, observed_at) 建索引
+
+当前状态在进程内有一份 LRU 缓存：启动时预热，写入时同步更新；
+其他进程写入数据库时通过 PRAGMA data_version 发现并清空缓存。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CASE_ID = "default"
+DEFAULT_CACHE_SIZE = 10000
+# 等待事件时检查其他进程写入的间隔（秒）
+EVENT_POLL_INTERVAL = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    case_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    case_last_updated TEXT NOT NULL DEFAULT '',
+    date TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS status_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    case_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    case_last_updated TEXT NOT NULL DEFAULT '',
+    change_type TEXT,
+    observed_at TEXT NOT NULL,
+    observation_id TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_status_history_case_observed
+    ON status_history (case_id, observed_at);
+"""
+
+
+def detect_change(previous, status, case_last_updated):
+    """
+    比较新旧状态，返回变更类型
+
+    Returns:
+        "status"（状态变更或首次记录）、"case_updated"（仅 case_last_updated 变更）或 None（无变更）
+    """
+    if not previous:
+        return "status"
+    if status != previous["status"]:
+        return "status"
+    if case_last_updated != previous.get("case_last_updated", ""):
+        return "case_updated"
+    return None
+
+
+class StatusStore:
+    def __init__(self, db_path, cache_size=None):
+        """
+        Args:
+            db_path: SQLite 数据库文件路径
+            cache_size: 当前状态缓存的最大案件数，默认读取环境变量 STATUS_CACHE_SIZE（默认 10000），0 表示不缓存
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # 单个连接 + 锁：所有读写串行执行，每个操作都是亚毫秒级的主键查询或单个事务
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.executescript(SCHEMA)
+            self._migrate_schema()
+
+        # case_id -> 记录或 None（None 表示确认不存在），按最近访问排序
+        self._cache = OrderedDict()
+        self._cache_size = cache_size if cache_size is not None else int(os.getenv("STATUS_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+        self._data_version = None
+        # 按案件统计的缓存命中 / 未命中次数，供 /metrics 导出
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._warm_cache()
+
+        # 变更事件：status_history 中 change_type 非空的行，id 即游标
+        self._events = threading.Condition()
+        self._last_event_id = self._query_last_event_id()
+        self._last_event_check = time.monotonic()
+
+    def _migrate_schema(self):
+        """为旧版数据库补充新增的列和索引"""
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(status_history)")}
+        if "observation_id" not in columns:
+            self._conn.execute("ALTER TABLE status_history ADD COLUMN observation_id TEXT")
+        self._conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_status_history_observation "
+            "ON status_history (observation_id) WHERE observation_id IS NOT NULL"
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row_to_record(row):
+        return {
+            "case_id": row["case_id"],
+            "status": row["status"],
+            "case_last_updated": row["case_last_updated"],
+            "date": row["date"],
+        }
+
+    def _warm_cache(self):
+        """启动时按最近更新时间加载当前状态"""
+        if self._cache_size <= 0:
+            return
+        with self._lock:
+            self._check_data_version()
+            rows = self._conn.execute(
+                "SELECT case_id, status, case_last_updated, date FROM cases ORDER BY date DESC LIMIT ?",
+                (self._cache_size,),
+            ).fetchall()
+            # 最近更新的放在 LRU 的末尾
+            for row in reversed(rows):
+                self._cache_put(row["case_id"], self._row_to_record(row))
+
+    def _check_data_version(self):
+        """其他连接提交过写入时 data_version 会变化，此时缓存可能过期，整体清空"""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            if self._data_version is not None:
+                logger.info("检测到其他进程写入数据库，清空状态缓存")
+            self._cache.clear()
+            self._data_version = version
+
+    def _cache_put(self, case_id, record):
+        if self._cache_size <= 0:
+            return
+        self._cache[case_id] = record
+        self._cache.move_to_end(case_id)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _lookup_locked(self, case_ids):
+        """先查缓存，未命中的从数据库读取并写入缓存；调用方负责加锁"""
+        result = {}
+        missing = []
+        for case_id in case_ids:
+            if case_id in self._cache:
+                self._cache.move_to_end(case_id)
+                result[case_id] = self._cache[case_id]
+            else:
+                missing.append(case_id)
+        self.cache_hits += len(case_ids) - len(missing)
+        self.cache_misses += len(missing)
+        # 分块查询，避免超过 SQLite 的参数个数限制
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT case_id, status, case_last_updated, date FROM cases WHERE case_id IN ({placeholders})",
+                chunk,
+            ).fetchall()
+            found = {row["case_id"]: self._row_to_record(row) for row in rows}
+            for case_id in chunk:
+                result[case_id] = found.get(case_id)
+                self._cache_put(case_id, result[case_id])
+        return result
+
+    def get(self, case_id=DEFAULT_CASE_ID):
+        """获取案件的当前状态，没有记录时返回 None"""
+        return self.get_many([case_id])[case_id]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cases").fetchone()[0]
+
+    def get_many(self, case_ids):
+        """批量获取多个案件的当前状态，返回 {case_id: 记录或 None}"""
+        case_ids = list(dict.fromkeys(case_ids))
+        with self._lock:
+            self._check_data_version()
+            result = self._lookup_locked(case_ids)
+        # 返回副本，避免调用方修改缓存中的记录
+        return {case_id: dict(record) if record else None for case_id, record in result.items()}
+
+    def _record_locked(self, case_id, status, case_last_updated, only_if_changed, observation_id=None):
+        """在已开启的事务内比较并写入，调用方负责加锁和提交"""
+        case_last_updated = case_last_updated or ""
+        previous = self._lookup_locked([case_id])[case_id]
+
+        if observation_id:
+            # 客户端重试同一次查询结果时返回第一次记录的变更类型，而不是与已保存的自己比较
+            row = self._conn.execute(
+                "SELECT change_type FROM status_history WHERE observation_id = ?", (observation_id,)
+            ).fetchone()
+            if row is not None:
+                return dict(previous), row["change_type"], None
+        change_type = detect_change(previous, status, case_last_updated)
+
+        if change_type is None and only_if_changed:
+            return dict(previous), None, dict(previous)
+
+        now = datetime.now().isoformat()
+        self._conn.execute(
+            "INSERT INTO cases (case_id, status, case_last_updated, date) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(case_id) DO UPDATE SET status = excluded.status, "
+            "case_last_updated = excluded.case_last_updated, date = excluded.date",
+            (case_id, status, case_last_updated, now),
+        )
+        self._conn.execute(
+            "INSERT INTO status_history (case_id, status, case_last_updated, change_type, observed_at, observation_id) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (case_id, status, case_last_updated, change_type, now, observation_id),
+        )
+        record = {"case_id": case_id, "status": status, "case_last_updated": case_last_updated, "date": now}
+        self._cache_put(case_id, record)
+        return dict(record), change_type, dict(previous) if previous else None
+
+    def record_many(self, observations, only_if_changed=False):
+        """
+        在一个事务内写入多条查询结果
+
+        Args:
+            observations: [(case_id, status, case_last_updated[, observation_id]), ...]
+                带 observation_id 时，同一个 id 重复提交会返回第一次的变更类型
+
+        Returns:
+            与 observations 一一对应的 [(当前记录, 变更类型, 之前的记录), ...]
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 拿到写锁后再检查，保证比较时用的不是其他进程写入前的旧缓存
+                self._check_data_version()
+                results = [
+                    self._record_locked(case_id, status, case_last_updated, only_if_changed, *observation_id)
+                    for case_id, status, case_last_updated, *observation_id in observations
+                ]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                # 缓存可能已经写入了未提交的记录
+                self._cache.clear()
+                raise
+        if any(change_type for _, change_type, _ in results):
+            self._notify_events()
+        return results
+
+    def record(self, case_id, status, case_last_updated, only_if_changed=False, observation_id=None):
+        """
+        在一个事务内读取当前状态、比较并写入新状态和历史
+
+        Args:
+            only_if_changed: 为 True 时，状态没有变化则不写入
+
+        Returns:
+            (当前记录, 变更类型, 之前的记录)
+        """
+        return self.record_many([(case_id, status, case_last_updated, observation_id)], only_if_changed)[0]
+
+    def put(self, case_id, status, case_last_updated):
+        """写入新状态（覆盖当前状态并追加历史），返回新记录"""
+        return self.record(case_id, status, case_last_updated)[0]
+
+    def history(self, case_id=DEFAULT_CASE_ID, limit=100):
+        """按时间倒序返回案件的状态历史"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, case_id, status, case_last_updated, change_type, observed_at FROM status_history "
+                "WHERE case_id = ? ORDER BY observed_at DESC, id DESC LIMIT ?",
+                (case_id, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _row_to_event(row):
+        return {
+            "id": row["id"],
+            "case_id": row["case_id"],
+            "change_type": row["change_type"],
+            "status": row["status"],
+            "case_last_updated": row["case_last_updated"],
+            "observed_at": row["observed_at"],
+        }
+
+    def _query_last_event_id(self):
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(id) FROM status_history WHERE change_type IS NOT NULL").fetchone()
+        return row[0] or 0
+
+    def _notify_events(self):
+        last_event_id = self._query_last_event_id()
+        with self._events:
+            self._last_event_id = max(self._last_event_id, last_event_id)
+            self._last_event_check = time.monotonic()
+            self._events.notify_all()
+
+    def last_event_id(self):
+        """当前最新的变更事件 id，可作为订阅的起始游标"""
+        with self._events:
+            return self._last_event_id
+
+    def events_since(self, cursor, case_ids=None, limit=100):
+        """
+        返回 id 大于 cursor 的变更事件（按 id 升序）
+
+        Args:
+            cursor: 上一次收到的最后一个事件 id
+            case_ids: 只返回这些案件的事件，None 表示全部
+        """
+        sql = (
+            "SELECT id, case_id, status, case_last_updated, change_type, observed_at FROM status_history "
+            "WHERE id > ? AND change_type IS NOT NULL"
+        )
+        params = [cursor]
+        if case_ids:
+            sql += f" AND case_id IN ({','.join('?' * len(case_ids))})"
+            params.extend(case_ids)
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row_to_event(row) for row in rows]
+
+    def wait_for_events(self, cursor, timeout):
+        """
+        阻塞直到有 id 大于 cursor 的变更事件或超时
+
+        本进程的写入会立即唤醒等待者；其他进程的写入最多每 EVENT_POLL_INTERVAL 秒检查一次，
+        并且由所有等待者共享这一次检查，订阅者数量不会增加数据库查询次数。
+
+        Returns:
+            是否有新事件（不考虑案件过滤）
+        """
+        deadline = time.monotonic() + timeout
+        with self._events:
+            while self._last_event_id <= cursor:
+                now = time.monotonic()
+                if now >= deadline:
+                    return False
+                if now - self._last_event_check >= EVENT_POLL_INTERVAL:
+                    self._last_event_check = now
+                    self._last_event_id = max(self._last_event_id, self._query_last_event_id())
+                    continue
+                self._events.wait(min(deadline - now, EVENT_POLL_INTERVAL))
+            return True
+
+    def migrate_json(self, json_path):
+        """
+        将旧版 status_data.json 中的单条记录迁移为默认案件
+
+        迁移成功后原文件重命名为 *.migrated，重复调用不会重复导入。
+
+        Returns:
+            是否进行了迁移
+        """
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return False
+
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except json.JSONDecodeError as e:
+            logger.error(f"旧数据文件 JSON 解析失败，跳过迁移: {e}")
+            return False
+
+        migrated = False
+        if data and data.get("status"):
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    exists = self._conn.execute(
+                        "SELECT 1 FROM cases WHERE case_id = ?", (DEFAULT_CASE_ID,)
+                    ).fetchone()
+                    if not exists:
+                        date = data.get("date") or datetime.now().isoformat()
+                        values = (DEFAULT_CASE_ID, data["status"], data.get("case_last_updated") or "", date)
+                        self._conn.execute(
+                            "INSERT INTO cases (case_id, status, case_last_updated, date) VALUES (?, ?, ?, ?)", values
+                        )
+                        self._conn.execute(
+                            "INSERT INTO status_history (case_id, status, case_last_updated, change_type, observed_at) "
+                            "VALUES (?, ?, ?, 'status', ?)",
+                            values,
+                        )
+                        migrated = True
+                        self._cache.pop(DEFAULT_CASE_ID, None)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+
+        json_path.rename(json_path.with_name(json_path.name + ".migrated"))
+        if migrated:
+            logger.info(f"已将 {json_path} 迁移到 SQLite（案件 {DEFAULT_CASE_ID}）")
+        return migrated
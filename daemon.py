@@ -0,0 +1,19 @@
+import os
+
+from dotenv import load_dotenv
+
+from CEACStatusBot import PollingDaemon, engine_from_env
+from CEACStatusBot.utils import log_with_timestamp
+
+# 常驻进程模式：与 trigger.py 使用相同的配置，但在进程内按 POLL_INTERVAL ± POLL_JITTER 循环轮询，
+# 收到 SIGTERM / SIGINT 后等待进行中的查询结束再退出
+# 运行命令: uv run daemon.py
+
+if os.path.exists(".env"):
+    load_dotenv(dotenv_path=".env")
+else:
+    log_with_timestamp(".env not found, using system environment only")
+
+daemon = PollingDaemon(engine_from_env())
+daemon.install_signal_handlers()
+daemon.run()
@@ -0,0 +1,84 @@
+import string
+
+import numpy as np
+
+from CEACStatusBot.captcha.onnx import ctc_decode, decode_outputs
+from CEACStatusBot.utils import log_with_timestamp
+
+# 测试命令: uv run test_captcha_decode.py
+# 不需要模型文件：用固定的 logits 检查向量化 CTC 解码和置信度
+
+CHARACTERS = '-' + string.digits + string.ascii_uppercase
+# 模型输出的帧数和类别数
+FRAMES = 12
+CLASSES = len(CHARACTERS)
+
+
+def _decode_reference(sequence) -> str:
+    """向量化之前逐帧循环的解码实现"""
+    a = ''.join([CHARACTERS[x] for x in sequence])
+    s = ''.join([x for j, x in enumerate(a[:-1]) if x != CHARACTERS[0] and x != a[j+1]])
+    if len(s) == 0:
+        return ''
+    if a[-1] != CHARACTERS[0] and s[-1] != a[-1]:
+        s += a[-1]
+    return s
+
+
+def _logits_for(sequences, margin: float = 4.0) -> np.ndarray:
+    """构造 (T, N, C) 的 logits：其他类别在 [-1, 1) 之间，margin > 1 时每帧的 argmax 为给定的类别下标"""
+    sequences = np.asarray(sequences)
+    rng = np.random.default_rng(0)
+    logits = rng.uniform(-1, 1, (sequences.shape[1], sequences.shape[0], CLASSES)).astype(np.float32)
+    frames, batch = np.meshgrid(np.arange(sequences.shape[1]), np.arange(sequences.shape[0]), indexing="ij")
+    logits[frames, batch, sequences.T] = margin
+    return logits
+
+
+def _sequences() -> np.ndarray:
+    """边界情况加上固定种子的随机序列（类别范围较小，保证有连续重复和 blank）"""
+    edge = [
+        [0] * FRAMES,
+        [1] * FRAMES,
+        [0] * (FRAMES - 1) + [5],
+        [5] + [0] * (FRAMES - 1),
+        [5, 5, 0, 5, 5, 6, 6, 0, 0, 7, 7, 7],
+        [5, 6, 5, 6, 5, 6, 5, 6, 5, 6, 5, 5],
+        [0, 3, 0, 3, 0, 3, 0, 3, 0, 3, 0, 3],
+        [9, 9, 9, 9, 9, 9, 9, 9, 9, 9, 9, 8],
+        [8, 9, 9, 9, 9, 9, 9, 9, 9, 9, 9, 9],
+    ]
+    rng = np.random.default_rng(2024)
+    random = rng.integers(0, 4, (200, FRAMES))
+    wide = rng.integers(0, CLASSES, (200, FRAMES))
+    return np.concatenate([np.array(edge), random, wide])
+
+
+def test_vectorized_decode_matches_reference() -> None:
+    sequences = _sequences()
+    expected = [_decode_reference(sequence) for sequence in sequences]
+    assert ctc_decode(sequences) == expected
+    # 经过 logits -> argmax 的完整路径结果相同
+    assert [pred for pred, _ in decode_outputs(_logits_for(sequences))] == expected
+
+
+def test_confidence_range_and_monotonic() -> None:
+    sequences = _sequences()[:20]
+    margins = [1.5, 2.0, 3.0, 4.0, 8.0, 16.0, 64.0]
+    previous = None
+    for margin in margins:
+        confidences = np.array([confidence for _, confidence in decode_outputs(_logits_for(sequences, margin))])
+        assert np.all((confidences >= 0) & (confidences <= 1))
+        if previous is not None:
+            # 其他类别的 logits 不变，argmax 类别的 logit 越大，置信度越高
+            assert np.all(confidences >= previous)
+        previous = confidences
+    # logit 差距足够大时每帧接近确定
+    assert np.all(previous > 0.99)
+
+
+if __name__ == "__main__":
+    test_vectorized_decode_matches_reference()
+    log_with_timestamp("test_vectorized_decode_matches_reference passed")
+    test_confidence_range_and_monotonic()
+    log_with_timestamp("test_confidence_range_and_monotonic passed")
@@ -0,0 +1,74 @@
+from pathlib import Path
+
+from CEACStatusBot.request import extract_async_form, extract_status, parse_async_delta
+from CEACStatusBot.utils import log_with_timestamp
+
+# 测试命令: uv run test_extract.py
+# 不需要网络：解析 test_fixtures 中按 ceac.state.gov 异步回发格式保存的响应
+
+FIXTURES = Path(__file__).parent / "test_fixtures"
+UPDATE_PANEL_ID = "ctl00_ContentPlaceHolder1_UpdatePanel1"
+
+
+def _fixture(name: str) -> str:
+    # 保留 \r\n：delta 中的长度按原始字符计算
+    with open(FIXTURES / name, "r", encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def test_parse_delta_with_multibyte_content() -> None:
+    entries = parse_async_delta(_fixture("ceac_status_delta.txt"))
+    assert entries[0] == ("#", "", "4")
+    entry_type, entry_id, panel = entries[1]
+    assert (entry_type, entry_id) == ("updatePanel", UPDATE_PANEL_ID)
+    # 长度字段覆盖了 São Paulo、北京、弯引号等非 ASCII 内容，片段应该恰好在面板结束处截断
+    assert "北京" in panel and "We’re" in panel
+    assert panel.rstrip().endswith("</div>")
+    hidden = {entry_id: content for entry_type, entry_id, content in entries if entry_type == "hiddenField"}
+    assert hidden["__VIEWSTATEGENERATOR"] == "DBF1011F"
+    assert entries[-1][0] == "pageTitle"
+
+
+def test_parse_delta_length_counts_utf16_units() -> None:
+    # .NET 按 UTF-16 码元计算长度：emoji 占 2
+    content = "Status ✅ 🛂 ok"
+    text = f"{len(content.encode('utf-16-le')) // 2}|updatePanel|panel|{content}|0|hiddenField|__EVENTTARGET||"
+    assert parse_async_delta(text) == [("updatePanel", "panel", content), ("hiddenField", "__EVENTTARGET", "")]
+
+
+def test_parse_delta_rejects_wrong_length() -> None:
+    assert parse_async_delta("5|updatePanel|panel|abc|") == []
+    assert parse_async_delta("<html><body>not a delta</body></html>") == []
+
+
+def test_extract_status_from_delta() -> None:
+    result = extract_status(_fixture("ceac_status_delta.txt"))
+    assert result["application_num"] == "AA00XXXXXX"
+    assert result["status"] == "Administrative Processing"
+    assert result["visa_type"] == "NONIMMIGRANT VISA APPLICATION"
+    assert result["case_created"] == "30-Aug-2022"
+    assert result["case_last_updated"] == "19-Oct-2022"
+    assert result["description"].endswith("São Paulo, México, 北京.")
+
+
+def test_extract_status_without_status_panel() -> None:
+    text = _fixture("ceac_captcha_error_delta.txt")
+    assert extract_status(text) is None
+
+    # 验证码错误的响应用于刷新表单：新的验证码地址和隐藏字段
+    form = extract_async_form(text)
+    assert form["image_src"].startswith("/ceacstattracker/BotDetectCaptcha.ashx?get=image&c=")
+    assert form["fields"]["LBD_VCID_c_status_ctl00_contentplaceholder1_defaultcaptcha"] == "9b2e4d6f8a0c1e3f5a7b9c0d2e4f6a8b"
+    assert form["fields"]["__VIEWSTATEGENERATOR"] == "DBF1011F"
+
+
+if __name__ == "__main__":
+    for test in (
+        test_parse_delta_with_multibyte_content,
+        test_parse_delta_length_counts_utf16_units,
+        test_parse_delta_rejects_wrong_length,
+        test_extract_status_from_delta,
+        test_extract_status_without_status_panel,
+    ):
+        test()
+        log_with_timestamp(f"{test.__name__} passed")
@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import tempfile
+
+from CEACStatusBot.notification import EmailNotificationHandle, NotificationDispatcher, NotificationOutbox
+from CEACStatusBot.notification.email import SmtpTransport
+from CEACStatusBot.utils import log_with_timestamp
+
+# 测试命令: uv run test_outbox.py
+# 不需要网络和 .env：用替换后的 SmtpTransport.sendmail 模拟 SMTP 服务器
+
+
+def test_digest_flush_failure_keeps_row_pending() -> None:
+    sent = []
+
+    def sendmail_down(self, fromEmail, toEmail, message):
+        raise ConnectionError("smtp down")
+
+    def sendmail_ok(self, fromEmail, toEmail, message):
+        sent.append(message)
+
+    originalSendmail = SmtpTransport.sendmail
+    SmtpTransport.sendmail = sendmail_down
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            dbPath = os.path.join(tmp, "outbox.db")
+            dispatcher = NotificationDispatcher(maxWorkers=1, timeout=5)
+            outbox = NotificationOutbox(dbPath, dispatcher=dispatcher)
+            handle = EmailNotificationHandle("bot@example.com", "me@example.com", "password", digest=True)
+            outbox.register(handle)
+
+            result = {"status": "Issued", "case_last_updated": "19-Oct-2022"}
+            # hold 期间不启动后台发送线程，由测试手动 drain
+            with outbox.hold():
+                observation_id = outbox.stage("case", result)
+                outbox.resolve(observation_id, [handle], result, "status")
+
+                # send 只是暂存到摘要中，flush 失败时不能标记为已送达
+                assert outbox.drain_once() == 0
+                assert outbox.pending_count() == 1
+
+                SmtpTransport.sendmail = sendmail_ok
+                # 跳过退避等待
+                with sqlite3.connect(dbPath) as conn:
+                    conn.execute("UPDATE deliveries SET next_attempt_at = 0")
+                assert outbox.drain_once() == 1
+                assert outbox.pending_count() == 0
+
+            # 重试由发件箱负责，失败的摘要没有留在 handle 的内存中，只发送了一次
+            assert len(sent) == 1
+            outbox.close()
+            dispatcher.close()
+    finally:
+        SmtpTransport.sendmail = originalSendmail
+
+
+if __name__ == "__main__":
+    test_digest_flush_failure_keeps_row_pending()
+    log_with_timestamp("test_digest_flush_failure_keeps_row_pending passed")